@@ -0,0 +1,50 @@
+"""Cost of the agent analyzers per note.
+
+Usage: python benchmarks/bench_agent.py [--notes N]
+
+Times `pipeline.analyze_chunk` (summary and task suggestions of each note)
+over generated notes of three sizes, and over long notes without anything
+task-like, which every analyzer has to read to the end.
+"""
+from __future__ import annotations
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from pkms.pipeline import analyze_chunk  # noqa: E402
+
+WORDS = "we review the plan call alice about budget fix the build then write notes with Bob in May".split()
+PLAIN = "the plan of alice about budget and the build then notes with Bob in May".split()
+
+
+def body(rng, sentences, pool=WORDS):
+    out = []
+    for _ in range(sentences):
+        words = rng.choices(pool, k=rng.randint(4, 16))
+        out.append(" ".join(words).capitalize() + rng.choice(".!?"))
+    return " ".join(out)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--notes", type=int, default=2000)
+    args = ap.parse_args()
+    rng = random.Random(1)
+    for sentences, words, label in ((5, WORDS, ""), (40, WORDS, ""), (2000, WORDS, ""), (2000, PLAIN, ", no tasks")):
+        count = max(args.notes * 5 // sentences, 5)
+        chunk = [(str(i), body(rng, sentences, words)) for i in range(count)]
+        best = float("inf")
+        for _ in range(3):
+            t = time.perf_counter()
+            analyze_chunk(chunk, 2, 3)
+            best = min(best, time.perf_counter() - t)
+        print(f"{sentences:5d} sentences/note  {best / count * 1e6:9.1f} us/note  ({count} notes{label})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Cold against warm agent runs with the content-hash agent cache.
+
+Usage: python benchmarks/bench_agent_cache.py [--notes N] [--edited PCT]
+
+Writes N notes and runs `pipeline.summarize_all` three times: with an empty
+cache, with every result cached, and after editing PCT% of the notes. Then
+times `agent_cache.analyze` for one note, cold and warm.
+"""
+from __future__ import annotations
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from pkms.agent_cache import AgentCache, analyze  # noqa: E402
+from pkms.models import Note  # noqa: E402
+from pkms.pipeline import summarize_all  # noqa: E402
+from pkms.storage import StorageManager  # noqa: E402
+
+WORDS = "we should review the plan call alice about budget fix the build then write notes".split()
+
+
+def body(rng):
+    sentences = []
+    for _ in range(rng.randint(5, 40)):
+        words = rng.choices(WORDS, k=rng.randint(4, 16))
+        sentences.append(" ".join(words).capitalize() + rng.choice(".!?"))
+    return " ".join(sentences)
+
+
+def timed(label, sm, n):
+    t = time.perf_counter()
+    counts = summarize_all(sm, workers=1, resume=False)
+    elapsed = time.perf_counter() - t
+    assert counts["summarized"] == n
+    print(f"summarize-all {label:<14} {elapsed:8.2f} s  ({counts['cached']} from cache)")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--notes", type=int, default=20000)
+    ap.add_argument("--edited", type=float, default=5.0)
+    ap.add_argument("--repeat", type=int, default=200)
+    args = ap.parse_args()
+    rng = random.Random(1)
+    print(f"{args.notes} notes")
+    with tempfile.TemporaryDirectory() as d:
+        sm = StorageManager(d)
+        notes = sm.add_notes([Note.create(f"Note {i}", body(rng)) for i in range(args.notes)])
+        timed("cold", sm, args.notes)
+        timed("warm", sm, args.notes)
+        with sm.batch():
+            for note in rng.sample(notes, int(args.notes * args.edited / 100)):
+                sm.update_note(note.id, body=body(rng))
+        timed(f"{args.edited:g}% edited", sm, args.notes)
+
+        cache = AgentCache(d)
+        text = body(rng) * 20
+        t = time.perf_counter()
+        for i in range(args.repeat):
+            analyze(None, "n", text, 2, 3)
+        cold = (time.perf_counter() - t) / args.repeat
+        analyze(cache, "n", text, 2, 3)
+        t = time.perf_counter()
+        for i in range(args.repeat):
+            analyze(cache, "n", text, 2, 3)
+        warm = (time.perf_counter() - t) / args.repeat
+        cache.close()
+        print(f"one note ({len(text)} chars)  uncached {cold * 1000:.2f} ms  cached {warm * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
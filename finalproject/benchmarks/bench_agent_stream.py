@@ -0,0 +1,68 @@
+"""Peak memory of suggest_tasks on a whole note against iter_suggestions.
+
+Usage: python benchmarks/bench_agent_stream.py [--sizes 1,16,64]
+
+Writes a log-like text of each size (in MiB) with nothing task-like in it,
+so every sentence has to be read, then runs each case in a fresh process
+and reports its time and peak RSS: `suggest_tasks` on the file read into
+one string, and `iter_suggestions` over `text_chunks` of the open file.
+"""
+from __future__ import annotations
+import argparse
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from pkms.agent import iter_suggestions, suggest_tasks  # noqa: E402
+from pkms.sentences import text_chunks  # noqa: E402
+
+WORDS = "the job ran on host in zone and the cache was warm after restart with retry count".split()
+
+
+def write(path, mib):
+    rng = random.Random(1)
+    with open(path, "w", encoding="utf-8") as f:
+        written = 0
+        while written < mib << 20:
+            line = " ".join(rng.choices(WORDS, k=rng.randint(6, 14))).capitalize() + ".\n"
+            f.write(line)
+            written += len(line)
+
+
+def measure(path, mode):
+    t = time.perf_counter()
+    with open(path, "r", encoding="utf-8") as f:
+        if mode == "whole":
+            found = suggest_tasks(f.read(), max_suggestions=3)
+        else:
+            found = list(iter_suggestions(text_chunks(f), max_suggestions=3))
+    elapsed = time.perf_counter() - t
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"  {mode:<7} {elapsed:7.2f} s  peak RSS {rss:7.1f} MiB  ({len(found)} suggestions)")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="1,16,64")
+    ap.add_argument("--measure", nargs=2, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.measure:
+        return measure(*args.measure)
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "note.txt")
+        for mib in (int(s) for s in args.sizes.split(",")):
+            write(path, mib)
+            print(f"{mib} MiB note")
+            for mode in ("whole", "stream"):
+                subprocess.run([sys.executable, __file__, "--measure", path, mode], check=True)
+
+
+if __name__ == "__main__":
+    main()
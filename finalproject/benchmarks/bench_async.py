@@ -0,0 +1,115 @@
+"""Many coroutines adding and reading tasks: sync calls vs AsyncStorageManager.
+
+Usage: python benchmarks/bench_async.py [--coroutines 1,10,100] [--ops N] [--seed-tasks N]
+
+Each coroutine adds `ops` tasks, reading one back and listing all tasks after
+every add. Three ways of calling the store from the event loop:
+
+  sync       StorageManager(cache=True) called directly (blocks the loop)
+  executor   the same manager behind a one-thread executor, one call per op
+  async      AsyncStorageManager (coalesced writes, shared reads)
+
+Reports operations per second and the worst event-loop stall seen by a
+ticker coroutine that wakes every millisecond.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pkms.aio import AsyncStorageManager  # noqa: E402
+from pkms.models import Task  # noqa: E402
+from pkms.storage import StorageManager  # noqa: E402
+
+
+class Sync:
+    def __init__(self, data_dir, backend):
+        self.sm = StorageManager(data_dir, backend=backend, cache=True)
+
+    async def call(self, name, *args):
+        return getattr(self.sm, name)(*args)
+
+    async def close(self):
+        self.sm.close()
+
+
+class Executor:
+    def __init__(self, data_dir, backend):
+        self.pool = ThreadPoolExecutor(max_workers=1)
+        self.sm = self.pool.submit(StorageManager, data_dir, backend=backend, cache=True).result()
+
+    async def call(self, name, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.pool, getattr(self.sm, name), *args)
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(self.pool, self.sm.close)
+        self.pool.shutdown()
+
+
+class Async:
+    def __init__(self, data_dir, backend):
+        self.asm = AsyncStorageManager(data_dir, backend=backend)
+
+    async def call(self, name, *args):
+        return await getattr(self.asm, name)(*args)
+
+    async def close(self):
+        await self.asm.close()
+
+
+async def run(store, coroutines, ops):
+    stall = 0.0
+    stop = False
+
+    async def ticker():
+        nonlocal stall
+        while not stop:
+            t = time.perf_counter()
+            await asyncio.sleep(0.001)
+            stall = max(stall, time.perf_counter() - t - 0.001)
+
+    async def client(n):
+        for i in range(ops):
+            task = await store.call("add_task", Task.create(f"c{n}-{i}"))
+            await store.call("get_task", task.id)
+            await store.call("list_tasks")
+
+    tick = asyncio.ensure_future(ticker())
+    await asyncio.sleep(0.01)
+    t = time.perf_counter()
+    await asyncio.gather(*(client(n) for n in range(coroutines)))
+    elapsed = time.perf_counter() - t
+    stop = True
+    await tick
+    await store.close()
+    return coroutines * ops * 3 / elapsed, stall
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--coroutines", default="1,10,100")
+    ap.add_argument("--ops", type=int, default=20, help="Adds per coroutine")
+    ap.add_argument("--seed-tasks", type=int, default=5000)
+    ap.add_argument("--backend", default="json")
+    args = ap.parse_args()
+    print(f"{args.backend} backend, {args.seed_tasks} tasks before the run")
+    print(f"{'mode':<10}{'coroutines':>11}{'ops/s':>10}{'max stall ms':>14}")
+    for coroutines in (int(c) for c in args.coroutines.split(",")):
+        for name, cls in (("sync", Sync), ("executor", Executor), ("async", Async)):
+            with tempfile.TemporaryDirectory() as d:
+                sm = StorageManager(d, backend=args.backend)
+                sm.add_tasks(Task.create(f"seed {i}") for i in range(args.seed_tasks))
+                sm.close()
+                rate, stall = asyncio.run(run(cls(d, args.backend), coroutines, args.ops))
+                assert len(StorageManager(d, backend=args.backend).list_tasks()) == args.seed_tasks + coroutines * args.ops
+            print(f"{name:<10}{coroutines:>11}{rate:>10,.0f}{stall * 1000:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
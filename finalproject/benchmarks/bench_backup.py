@@ -0,0 +1,80 @@
+"""Compare backup formats: file size, write and read throughput.
+
+Usage: python benchmarks/bench_backup.py [--notes N]
+
+"legacy" is the pre-streaming export (`json.dump(..., indent=2)` of the whole
+store, read back with `json.load`). The other rows go through
+pkms.backup.write_backup/read_backup, without touching a storage backend.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pkms.backup import read_backup, write_backup, zstandard  # noqa: E402
+from pkms.models import Note, Task  # noqa: E402
+
+WORDS = ("meeting notes budget roadmap review draft idea follow up with the team about "
+         "quarterly planning release schedule bug triage design decision").split()
+
+
+def make_records(n_notes: int):
+    rows = []
+    for i in range(n_notes):
+        body = " ".join(WORDS[(i * 7 + j) % len(WORDS)] for j in range(60))
+        rows.append(("notes", Note.create(f"Note {i}", body, tags=[WORDS[i % 5], "pkms"]).to_dict()))
+    for i in range(n_notes // 10):
+        rows.append(("tasks", Task.create(f"Task {i}", description="do it").to_dict()))
+    return rows
+
+
+def bench_legacy(path, records):
+    data = {"notes": [r for k, r in records if k == "notes"], "tasks": [r for k, r in records if k == "tasks"]}
+    t = time.perf_counter()
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    write = time.perf_counter() - t
+    t = time.perf_counter()
+    with open(path, "r", encoding="utf-8") as f:
+        loaded = json.load(f)
+    n = sum(len(v) for v in loaded.values())
+    return write, time.perf_counter() - t, n
+
+
+def bench_format(path, records):
+    t = time.perf_counter()
+    write_backup(path, records)
+    write = time.perf_counter() - t
+    t = time.perf_counter()
+    n = sum(1 for _ in read_backup(path))
+    return write, time.perf_counter() - t, n
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--notes", type=int, default=50000)
+    args = ap.parse_args()
+    records = make_records(args.notes)
+    names = ["legacy.json", "backup.json", "backup.jsonl", "backup.jsonl.gz", "backup.jsonl.xz",
+             "backup.pkb", "backup.pkb.gz"]
+    if zstandard is not None:
+        names.insert(5, "backup.jsonl.zst")
+    print(f"{len(records)} records")
+    print(f"{'format':<18}{'size MiB':>10}{'write s':>9}{'read s':>8}{'write rec/s':>13}{'read rec/s':>12}")
+    with tempfile.TemporaryDirectory() as d:
+        for name in names:
+            path = os.path.join(d, name)
+            run = bench_legacy if name.startswith("legacy") else bench_format
+            write, read, n = run(path, records)
+            assert n == len(records)
+            size = os.path.getsize(path) / (1 << 20)
+            print(f"{name:<18}{size:>10.1f}{write:>9.2f}{read:>8.2f}{n / write:>13,.0f}{n / read:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Write throughput of several processes adding tasks to one data directory.
+
+Usage: python benchmarks/bench_concurrency.py [--adds N] [--procs 1,2,4,8]
+
+Each process adds N tasks one at a time (one locked read-modify-write per
+add), all starting together. Reports adds/second over all processes and
+checks that every task made it to disk.
+"""
+from __future__ import annotations
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pkms.models import Task  # noqa: E402
+from pkms.storage import StorageManager  # noqa: E402
+
+
+def worker(data_dir, backend, n, adds, start):
+    sm = StorageManager(data_dir, backend=backend)
+    start.wait()
+    for i in range(adds):
+        sm.add_task(Task.create(f"p{n}-{i}"))
+    sm.close()
+
+
+def run(backend, procs, adds, seed_tasks):
+    with tempfile.TemporaryDirectory() as d:
+        sm = StorageManager(d, backend=backend)
+        sm.add_tasks(Task.create(f"seed {i}") for i in range(seed_tasks))
+        sm.close()
+        ctx = multiprocessing.get_context("fork")
+        start = ctx.Event()
+        ps = [ctx.Process(target=worker, args=(d, backend, n, adds, start)) for n in range(procs)]
+        for p in ps:
+            p.start()
+        time.sleep(0.2)
+        t = time.perf_counter()
+        start.set()
+        for p in ps:
+            p.join()
+        elapsed = time.perf_counter() - t
+        stored = len(StorageManager(d, backend=backend).list_tasks()) - seed_tasks
+        return procs * adds / elapsed, stored == procs * adds
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--adds", type=int, default=200)
+    ap.add_argument("--procs", default="1,2,4,8")
+    ap.add_argument("--seed-tasks", type=int, default=1000, help="Tasks in the store before the run")
+    args = ap.parse_args()
+    print(f"{'backend':<9}{'procs':>6}{'adds/s':>10}  complete")
+    for backend in ("json", "journal", "sqlite"):
+        for procs in (int(p) for p in args.procs.split(",")):
+            rate, complete = run(backend, procs, args.adds, args.seed_tasks)
+            print(f"{backend:<9}{procs:>6}{rate:>10,.0f}  {'yes' if complete else 'LOST WRITES'}")
+
+
+if __name__ == "__main__":
+    main()
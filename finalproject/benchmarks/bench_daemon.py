@@ -0,0 +1,93 @@
+"""Per-command latency with and without `pkms serve`.
+
+Usage: python benchmarks/bench_daemon.py [--notes N] [--calls N]
+
+Runs `view-note` and `search-notes` against a store of N notes three ways:
+a fresh `pkms_cli.py` process with PKMS_NO_DAEMON set (every call
+loads the store and rebuilds what it needs), the same process forwarding to
+a running server, and one persistent `Client` connection (what a long
+scripted loop would use).
+"""
+from __future__ import annotations
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+CLI = os.path.join(ROOT, "pkms_cli.py")
+sys.path.insert(0, ROOT)
+
+from pkms.daemon import Client, socket_path  # noqa: E402
+from pkms.models import Note  # noqa: E402
+from pkms.storage import StorageManager  # noqa: E402
+
+WORDS = ("meeting notes budget roadmap review draft idea follow up with the team about "
+         "quarterly planning release schedule bug triage design decision").split()
+
+
+def per_call(fn, calls):
+    t = time.perf_counter()
+    for i in range(calls):
+        fn(i)
+    return (time.perf_counter() - t) / calls * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--notes", type=int, default=20000)
+    ap.add_argument("--calls", type=int, default=20, help="Subprocess calls per row")
+    ap.add_argument("--client-calls", type=int, default=2000)
+    args = ap.parse_args()
+    with tempfile.TemporaryDirectory() as d:
+        sm = StorageManager(d)
+        notes = [Note.create(f"Note {i}", " ".join(WORDS[(i * 7 + j) % len(WORDS)] for j in range(40)))
+                 for i in range(args.notes)]
+        sm.add_notes(notes)
+        sm.close()
+        ids = [n.id for n in notes]
+        commands = {
+            "view-note": lambda i: ["--data-dir", d, "view-note", ids[i * 7919 % len(ids)]],
+            "search-notes": lambda i: ["--data-dir", d, "search-notes", "triage", "--limit", "5"],
+        }
+
+        env = dict(os.environ)
+        env.pop("PKMS_SOCKET", None)
+        local_env = dict(env, PKMS_NO_DAEMON="1")
+
+        def cli(argv, env):
+            subprocess.run([sys.executable, CLI, *argv], env=env, check=True,
+                           stdout=subprocess.DEVNULL)
+
+        results = {name: {} for name in commands}
+        for name, argv in commands.items():
+            results[name]["cli"] = per_call(lambda i: cli(argv(i), local_env), args.calls)
+
+        server = subprocess.Popen([sys.executable, CLI, "--data-dir", d, "serve"],
+                                  env=env, stdout=subprocess.DEVNULL)
+        try:
+            path = socket_path(d)
+            while not os.path.exists(path):
+                if server.poll() is not None:
+                    raise SystemExit("pkms serve exited early")
+                time.sleep(0.05)
+            with Client(path) as client:
+                for argv in commands.values():
+                    client.run(argv(0))  # warm the server's cache and index
+                for name, argv in commands.items():
+                    results[name]["forwarded"] = per_call(lambda i: cli(argv(i), env), args.calls)
+                    results[name]["client"] = per_call(lambda i: client.run(argv(i)), args.client_calls)
+                client.call("shutdown")
+        finally:
+            server.wait(10)
+
+    print(f"{args.notes} notes, milliseconds per call")
+    print(f"{'command':<14}{'cli':>10}{'forwarded':>11}{'client':>10}")
+    for name, row in results.items():
+        print(f"{name:<14}{row['cli']:>10.1f}{row['forwarded']:>11.1f}{row['client']:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Bulk task creation: one write per add_task vs group commit.
+
+Usage: python benchmarks/bench_group_commit.py [--adds N] [--seed-tasks N]
+
+"plain" calls add_task in a loop (one atomic write each); "group" submits
+the same adds through StorageManager.group_commit() and waits for every
+future. Each run starts from a store holding --seed-tasks tasks.
+"""
+from __future__ import annotations
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pkms.models import Task  # noqa: E402
+from pkms.storage import StorageManager  # noqa: E402
+
+
+def plain(sm, adds):
+    for i in range(adds):
+        sm.add_task(Task.create(f"t{i}"))
+
+
+def group(window, max_records):
+    def run(sm, adds):
+        with sm.group_commit(window=window, max_records=max_records) as gc:
+            futures = [gc.add_task(Task.create(f"t{i}")) for i in range(adds)]
+        for f in futures:
+            f.result()
+    return run
+
+
+def measure(backend, run, adds, seed_tasks):
+    with tempfile.TemporaryDirectory() as d:
+        sm = StorageManager(d, backend=backend)
+        sm.add_tasks(Task.create(f"seed {i}") for i in range(seed_tasks))
+        t = time.perf_counter()
+        run(sm, adds)
+        elapsed = time.perf_counter() - t
+        assert len(StorageManager(d, backend=backend).list_tasks()) == seed_tasks + adds
+        sm.close()
+        return adds / elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--adds", type=int, default=20000)
+    ap.add_argument("--plain-adds", type=int, default=200, help="Adds for the (slow) plain runs")
+    ap.add_argument("--seed-tasks", type=int, default=1000)
+    args = ap.parse_args()
+    modes = [("plain", plain, args.plain_adds),
+             ("group 10ms/1000", group(0.01, 1000), args.adds),
+             ("group 50ms/10000", group(0.05, 10000), args.adds)]
+    print(f"{args.seed_tasks} tasks before each run")
+    print(f"{'backend':<9}{'mode':<18}{'adds':>7}{'adds/s':>11}")
+    for backend in ("json", "journal", "sqlite"):
+        for name, run, adds in modes:
+            rate = measure(backend, run, adds, args.seed_tasks)
+            print(f"{backend:<9}{name:<18}{adds:>7}{rate:>11,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Memory held by a loaded store.
+
+Usage: python benchmarks/bench_memory.py [--records N]
+
+Writes a json store with N/2 notes and N/2 tasks, then measures with
+tracemalloc the memory still held after loading it as a list of records
+(`list_notes`/`list_tasks`) and as a columnar collection
+(pkms.columnar.Columns), and the process's peak RSS at the end.
+"""
+from __future__ import annotations
+import argparse
+import gc
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pkms.models import Note, Task  # noqa: E402
+from pkms.storage import StorageManager  # noqa: E402
+
+try:
+    from pkms.columnar import Columns  # noqa: E402
+except ImportError:
+    Columns = None
+
+TAGS = ["work", "home", "idea", "meeting", "reading", "pkms", "draft", "urgent"]
+
+
+def build(data_dir, n):
+    sm = StorageManager(data_dir)
+    notes, tasks = [], []
+    for i in range(n // 2):
+        note = Note.create(f"Note {i}", f"Body of note {i}: " + "lorem ipsum dolor sit amet " * 4,
+                           tags=[TAGS[i % 8], TAGS[(i * 3) % 8]], source="agent" if i % 10 == 0 else "manual")
+        if i % 5 == 0:
+            note.updated_at = "2026-01-01T00:00:00.000000Z"
+        notes.append(note)
+        task = Task.create(f"Task {i}", description="follow up" if i % 2 else "",
+                           due_date="2026-02-01" if i % 3 == 0 else None)
+        task.status = "done" if i % 4 == 0 else "todo"
+        tasks.append(task)
+    sm.add_notes(notes)
+    sm.add_tasks(tasks)
+
+
+def held(load):
+    gc.collect()
+    tracemalloc.start()
+    t = time.perf_counter()
+    obj = load()
+    elapsed = time.perf_counter() - t
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, size, elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--records", type=int, default=500000)
+    args = ap.parse_args()
+    with tempfile.TemporaryDirectory() as d:
+        build(d, args.records)
+        sm = StorageManager(d)
+        per = args.records // 2
+        print(f"{args.records} records ({per} notes, {per} tasks)")
+        print(f"{'layout':<10}{'kind':<7}{'MiB':>9}{'bytes/rec':>11}{'load s':>8}")
+        kept = []
+        for kind in ("notes", "tasks"):
+            loads = [("objects", getattr(sm, f"list_{kind}"))]
+            if Columns is not None:
+                loads.append(("columns", lambda kind=kind: sm.columns(kind)))
+            for name, load in loads:
+                obj, size, elapsed = held(load)
+                assert len(obj) == per
+                kept.append(obj)
+                print(f"{name:<10}{kind:<7}{size / (1 << 20):>9.1f}{size / per:>11.0f}{elapsed:>8.2f}")
+                del obj
+                kept.clear()
+        print(f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Record encode/decode speed: Note/Task to_dict and from_dict.
+
+Usage: python benchmarks/bench_models.py [--records N] [--repeat R]
+
+Times to_dict/from_dict alone over N notes and N tasks (best of R), then a
+full save_notes/save_tasks and list_notes/list_tasks round trip through the
+json backend, where JSON encoding and file I/O are included.
+"""
+from __future__ import annotations
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pkms.models import Note, Task  # noqa: E402
+from pkms.storage import StorageManager  # noqa: E402
+
+
+def best(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return min(times)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--records", type=int, default=100000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+    n = args.records
+    notes = [Note.create(f"Note {i}", f"body {i}", tags=["work", "idea"]) for i in range(n)]
+    tasks = [Task.create(f"Task {i}", description="x", due_date="2026-02-01" if i % 3 == 0 else None)
+             for i in range(n)]
+    print(f"{n} records per kind, best of {args.repeat}, seconds")
+    print(f"{'kind':<7}{'to_dict':>9}{'from_dict':>11}{'save':>8}{'load':>8}")
+    for kind, model, records in (("notes", Note, notes), ("tasks", Task, tasks)):
+        rows = [r.to_dict() for r in records]
+        encode = best(lambda: [r.to_dict() for r in records], args.repeat)
+        decode = best(lambda: [model.from_dict(d) for d in rows], args.repeat)
+        with tempfile.TemporaryDirectory() as d:
+            sm = StorageManager(d, backend="json")
+            save = best(lambda: getattr(sm, f"save_{kind}")(records), args.repeat)
+            load = best(lambda: getattr(sm, f"list_{kind}")(), args.repeat)
+        print(f"{kind:<7}{encode:>9.3f}{decode:>11.3f}{save:>8.3f}{load:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
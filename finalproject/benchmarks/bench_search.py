@@ -0,0 +1,81 @@
+"""Per-query search latency as the store grows.
+
+Usage: python benchmarks/bench_search.py [--sizes 5000,20000,80000] [--queries 20]
+
+For each size, writes that many notes of random words (w0..w4999, about
+150 words each), builds the search index with a first query, then times
+queries the way the CLI runs them: a fresh StorageManager per query, so
+nothing is warm but the OS page cache.
+
+Latency should stay flat as the store grows for queries whose hits don't
+grow with it: every size has the word `needle` planted in exactly 25
+notes, searched as a word, as a substring (`eedl`) and ranked. The words
+are Zipf-distributed, so the hits of the other queries (a rare word, a
+substring expanding to many words, a ranked top-10 of a common word, two
+words that must both match) grow with the store, and so does their cost:
+every hit is loaded, or scored.
+"""
+from __future__ import annotations
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from pkms.models import Note  # noqa: E402
+from pkms.storage import StorageManager  # noqa: E402
+
+PLANTED = 25
+QUERIES = {
+    "planted": dict(query="needle"),
+    "planted substr": dict(query="eedl"),
+    "planted ranked": dict(query="needle", ranked=True, limit=10),
+    "rare word": dict(query="w4999"),
+    "substring": dict(query="w49"),
+    "ranked top 10": dict(query="w7", ranked=True, limit=10),
+    "two words, all": dict(query="w12 w345", match="all"),
+}
+
+
+def notes(rng, n):
+    for i in range(n):
+        words = [f"w{int(rng.paretovariate(0.6)) % 5000}" for _ in range(rng.randint(100, 200))]
+        if i % (n // PLANTED) == 0:
+            words[rng.randrange(len(words))] = "needle"
+        yield Note.create(f"Note {i} " + " ".join(words[:3]), " ".join(words), tags=[f"t{i % 50}"])
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="5000,20000,80000")
+    ap.add_argument("--queries", type=int, default=20)
+    args = ap.parse_args()
+    rng = random.Random(1)
+    for size in (int(s) for s in args.sizes.split(",")):
+        with tempfile.TemporaryDirectory() as d:
+            sm = StorageManager(d)
+            sm.add_notes(notes(rng, size))
+            t = time.perf_counter()
+            sm.search_notes("w0")
+            build = time.perf_counter() - t
+            sm.close()
+            index_mb = sum(os.path.getsize(os.path.join(d, f)) for f in os.listdir(d)
+                           if f.startswith("search_index")) / (1 << 20)
+            notes_mb = os.path.getsize(os.path.join(d, "notes.json")) / (1 << 20)
+            print(f"{size} notes ({notes_mb:.0f} MB): index built in {build:.1f} s, {index_mb:.0f} MB")
+            for label, kwargs in QUERIES.items():
+                t = time.perf_counter()
+                for _ in range(args.queries):
+                    sm = StorageManager(d)
+                    hits = sm.search_notes(**kwargs)
+                    sm.close()
+                elapsed = (time.perf_counter() - t) / args.queries
+                print(f"  {label:<15} {elapsed * 1000:8.1f} ms/query  ({len(hits)} hits)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Single-record writes and full loads, whole-file vs sharded stores.
+
+Usage: python benchmarks/bench_sharded.py [--notes N]
+
+Writes N notes to a json store and to sharded stores of 16 and 64 shards,
+then times `update_note` on random notes (each a read-modify-write of the
+file holding it), a `batch()` updating 100 random notes, and `list_notes`
+on a fresh manager.
+"""
+from __future__ import annotations
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pkms.models import Note  # noqa: E402
+from pkms.sharded_backend import reshard  # noqa: E402
+from pkms.storage import StorageManager  # noqa: E402
+
+
+def best(fn, rounds=3):
+    times = []
+    for _ in range(rounds):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return min(times)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--notes", type=int, default=50000)
+    ap.add_argument("--updates", type=int, default=50)
+    args = ap.parse_args()
+    rng = random.Random(1)
+    notes = [Note.create(f"Note {i}", "lorem ipsum dolor sit amet " * 8, tags=["a"]) for i in range(args.notes)]
+    ids = [n.id for n in notes]
+    print(f"{args.notes} notes")
+    print(f"{'layout':<12}{'update ms':>11}{'batch100 ms':>13}{'list s':>9}")
+    with tempfile.TemporaryDirectory() as d:
+        for layout, shards in (("json", None), ("sharded 16", 16), ("sharded 64", 64)):
+            data_dir = os.path.join(d, layout.replace(" ", ""))
+            StorageManager(data_dir, backend="json").add_notes(notes)
+            if shards:
+                reshard(data_dir, shards)
+            sm = StorageManager(data_dir)
+            t = time.perf_counter()
+            for _ in range(args.updates):
+                sm.update_note(rng.choice(ids), title="edited")
+            update = (time.perf_counter() - t) / args.updates
+
+            def batch():
+                with sm.batch():
+                    for note_id in rng.sample(ids, 100):
+                        sm.update_note(note_id, title="batched")
+            batched = best(batch)
+            listed = best(lambda: StorageManager(data_dir).list_notes())
+            print(f"{layout:<12}{update * 1000:>11.1f}{batched * 1000:>13.1f}{listed:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Listing and searching notes with bodies kept apart from the metadata.
+
+Usage: python benchmarks/bench_split.py [--notes N] [--body-kb K]
+
+Writes N notes with K KiB bodies to a json store and a split store. Then, in
+a fresh process per store (so peak RSS is per store), times on a fresh
+manager each round:
+- `list_notes` plus reading every title
+- `list_notes_by_tags` for one tag
+- `search_notes` for a phrase whose words are in every note but never
+  side by side (every note is a candidate, none matches)
+- `search_notes` for a phrase in one note in 100
+- reading every body after `list_notes`
+For the split store it also reports how many bodies each case decoded.
+The peak RSS column is the process's peak so far, so it grows down the
+table.
+"""
+from __future__ import annotations
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pkms.models import Note  # noqa: E402
+from pkms.split_backend import BodyStore  # noqa: E402
+from pkms.storage import StorageManager  # noqa: E402
+
+TAGS = ["work", "home", "idea", "meeting", "reading", "pkms", "draft", "urgent"]
+
+CASES = [
+    ("list titles", lambda sm: [n.title for n in sm.list_notes()]),
+    ("tag filter", lambda sm: sm.list_notes_by_tags(["work"])),
+    ("search miss", lambda sm: sm.search_notes("amet ipsum")),
+    ("search hit", lambda sm: sm.search_notes("needle in haystack")),
+    ("list bodies", lambda sm: [n.body for n in sm.list_notes()]),
+]
+
+reads = [0]
+_read = BodyStore.read
+
+
+def counting_read(self, ref):
+    reads[0] += 1
+    return _read(self, ref)
+
+
+BodyStore.read = counting_read
+
+
+def build(data_dir, backend, n, body_kb):
+    sm = StorageManager(data_dir, backend=backend)
+    filler = "lorem ipsum dolor sit amet " * (body_kb * 1024 // 27)
+    sm.add_notes([Note.create(f"Note {i}", f"Body {i}: {filler}" + (" needle in haystack" if i % 100 == 0 else ""),
+                              tags=[TAGS[i % 8]]) for i in range(n)])
+    sm.list_notes_by_tags(["work"])  # build the indexes
+    sm.search_notes("lorem")
+
+
+def timed(data_dir, fn, rounds=3):
+    best = None
+    for _ in range(rounds):
+        sm = StorageManager(data_dir)
+        reads[0] = 0
+        t = time.perf_counter()
+        fn(sm)
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+        sm.close()
+    return best, reads[0]
+
+
+def measure(data_dir):
+    backend = StorageManager(data_dir).backend.name
+    for name, fn in CASES:
+        elapsed, n = timed(data_dir, fn)
+        shown = n if backend == "split" else "-"
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"{backend:<8}{name:<13}{elapsed:>9.3f}{shown:>13}{rss:>10.0f}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--notes", type=int, default=20000)
+    ap.add_argument("--body-kb", type=int, default=4)
+    ap.add_argument("--build", nargs=2, help=argparse.SUPPRESS)
+    ap.add_argument("--measure", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.build:
+        return build(args.build[0], args.build[1], args.notes, args.body_kb)
+    if args.measure:
+        return measure(args.measure)
+    print(f"{args.notes} notes, {args.body_kb} KiB bodies")
+    print(f"{'backend':<8}{'case':<13}{'seconds':>9}{'bodies read':>13}{'peak MiB':>10}")
+    sys.stdout.flush()
+    with tempfile.TemporaryDirectory() as d:
+        for backend in ("json", "split"):
+            data_dir = os.path.join(d, backend)
+            # Each step in its own process: Linux carries peak RSS over exec
+            # from the parent, which must stay small
+            here = [sys.executable, os.path.abspath(__file__), "--notes", str(args.notes), "--body-kb", str(args.body_kb)]
+            subprocess.run(here + ["--build", data_dir, backend], check=True)
+            subprocess.run(here + ["--measure", data_dir], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Throughput of summarize-all against one summarize-note call per note.
+
+Usage: python benchmarks/bench_summarize_all.py [--notes N] [--workers 1,2,4]
+
+Writes N notes, times a few `pkms_cli.py summarize-note` invocations to get
+the per-note cost of the one-note-at-a-time path, then times
+`pipeline.summarize_all` over the whole store for each worker count.
+"""
+from __future__ import annotations
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from pkms.models import Note  # noqa: E402
+from pkms.pipeline import summarize_all  # noqa: E402
+from pkms.storage import StorageManager  # noqa: E402
+
+WORDS = "we should review the plan call alice about budget fix the build then write notes".split()
+
+
+def body(rng):
+    sentences = []
+    for _ in range(rng.randint(5, 40)):
+        words = rng.choices(WORDS, k=rng.randint(4, 16))
+        sentences.append(" ".join(words).capitalize() + rng.choice(".!?"))
+    return " ".join(sentences)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--notes", type=int, default=50000)
+    ap.add_argument("--workers", default="1,2,4")
+    ap.add_argument("--cli-calls", type=int, default=10)
+    args = ap.parse_args()
+    rng = random.Random(1)
+    print(f"{args.notes} notes, {os.cpu_count()} CPUs")
+    with tempfile.TemporaryDirectory() as d:
+        sm = StorageManager(d)
+        notes = sm.add_notes([Note.create(f"Note {i}", body(rng)) for i in range(args.notes)])
+        env = dict(os.environ, PKMS_NO_DAEMON="1")
+        t = time.perf_counter()
+        for note in notes[:args.cli_calls]:
+            subprocess.run([sys.executable, os.path.join(ROOT, "pkms_cli.py"), "--data-dir", d, "summarize-note",
+                            note.id, "--no-cache"], check=True, stdout=subprocess.DEVNULL, env=env)
+        per_call = (time.perf_counter() - t) / args.cli_calls
+        print(f"summarize-note per note  {per_call * 1000:8.1f} ms  (whole store: ~{per_call * args.notes:.0f} s)")
+        for workers in (int(w) for w in args.workers.split(",")):
+            t = time.perf_counter()
+            counts = summarize_all(sm, workers=workers, resume=False, cache=False)
+            elapsed = time.perf_counter() - t
+            assert counts["summarized"] == args.notes
+            print(f"summarize-all workers={workers}  {elapsed:8.2f} s  ({args.notes / elapsed:,.0f} notes/s)")
+
+
+if __name__ == "__main__":
+    main()
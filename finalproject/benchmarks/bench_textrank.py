@@ -0,0 +1,96 @@
+"""Speed of the TextRank summarizer, and its quality against lead-N.
+
+Usage: python benchmarks/bench_textrank.py [--sizes 100,1000,5000,20000] [--sentences 3]
+
+Speed: times `summarize_text(method="textrank")` on generated notes of each
+size (in sentences), with NumPy and with the pure-Python fallback.
+
+Quality: there are no reference summaries to score against, so both
+methods summarize each topic of the Python reference manual that ships
+with CPython (`pydoc_data.topics`) and are scored by coverage: the share of
+the topic's 10 most frequent content words that the summary contains.
+Summary length in words is reported next to it, since longer sentences
+cover more words.
+"""
+from __future__ import annotations
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from pkms import textrank  # noqa: E402
+from pkms.agent import summarize_text  # noqa: E402
+
+WORDS = ("we should review the plan call alice about budget fix the build then write notes hiring release "
+         "schedule customer feedback design database migration latency report roadmap").split()
+
+
+def body(rng, sentences):
+    out = []
+    for _ in range(sentences):
+        words = rng.choices(WORDS, k=rng.randint(4, 16))
+        out.append(" ".join(words).capitalize() + rng.choice(".!?"))
+    return " ".join(out)
+
+
+def speed(sizes, count):
+    rng = random.Random(1)
+    numpy = textrank.numpy
+    for n in sizes:
+        text = body(rng, n)
+        line = f"{n:6d} sentences"
+        for label, module in (("numpy", numpy), ("python", None)):
+            if label == "numpy" and module is None:
+                line += "  numpy: not installed"
+                continue
+            textrank.numpy = module
+            t = time.perf_counter()
+            summarize_text(text, count, method="textrank")
+            line += f"  {label} {(time.perf_counter() - t) * 1000:8.1f} ms"
+        textrank.numpy = numpy
+        t = time.perf_counter()
+        summarize_text(text, count)
+        print(line + f"  (lead {(time.perf_counter() - t) * 1000:.1f} ms)")
+
+
+def content_words(text):
+    return [w for w in re.findall(r"[^\W\d_]{2,}", text.lower()) if w not in textrank.STOPWORDS]
+
+
+def quality(count):
+    from pydoc_data.topics import topics
+    totals = {"lead": [0.0, 0], "textrank": [0.0, 0]}
+    docs = 0
+    for text in topics.values():
+        # Prose only: drop indented code and grammar blocks
+        prose = " ".join(line.strip() for line in text.splitlines() if line.strip() and not line.startswith("   "))
+        if len(re.split(r"(?<=[.!?])\s+", prose)) <= count * 3:
+            continue
+        docs += 1
+        salient = {w for w, _ in Counter(content_words(prose)).most_common(10)}
+        for method in totals:
+            summary = summarize_text(prose, count, method=method)
+            totals[method][0] += len(salient & set(content_words(summary))) / len(salient)
+            totals[method][1] += len(summary.split())
+    print(f"quality over {docs} reference-manual topics, {count} sentences per summary:")
+    for method, (coverage, words) in totals.items():
+        print(f"  {method:<8}  salient-word coverage {coverage / docs:6.1%}  mean length {words / docs:5.1f} words")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="100,1000,5000,20000")
+    ap.add_argument("--sentences", type=int, default=3)
+    args = ap.parse_args()
+    speed([int(s) for s in args.sizes.split(",")], args.sentences)
+    quality(args.sentences)
+
+
+if __name__ == "__main__":
+    main()
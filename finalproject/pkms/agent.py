@@ -3,48 +3,131 @@
 This module implements a small local summarizer and task-suggestion heuristics.
 It is intentionally dependency-free so it runs out-of-the-box; users may replace
 or extend it to call external APIs or local ML models.
+
+Every analyzer takes a text or a `sentences.Document`; `run_analyzers` splits
+a text once and hands the same Document to several of them. `iter_summary`
+and `iter_suggestions` work on text arriving in chunks instead, for notes
+too large to hold in memory.
 """
-from typing import List, Dict
-import re
+import itertools
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Union
+from .sentences import Document, SentenceStream
+
+# Part of the agent cache key (pkms.agent_cache): bump it whenever a change
+# here alters what the functions return, so cached results are not reused
+AGENT_VERSION = 1
+
+
+SUMMARY_METHODS = ("lead", "textrank")
 
 
-def summarize_text(text: str, max_sentences: int = 2) -> str:
-    """Return a naive summary: first N sentences after trimming whitespace.
+def summarize_text(text: Union[str, Document], max_sentences: int = 2, method: str = "lead") -> str:
+    """Return a summary of at most `max_sentences` sentences.
 
-    This is a simple fallback summarizer. In production, swap this with
-    a call to an external model or local ML component.
+    `method` "lead" (the default) takes the first sentences; "textrank"
+    takes the most central ones, in their original order (see
+    pkms.textrank). In production, swap this with a call to an external
+    model or local ML component.
     """
-    # Simple sentence splitter (naive)
-    sentences = re.split(r'(?<=[.!?])\s+', text.strip())
-    if not sentences:
-        return ""
-    return " ".join(sentences[:max_sentences])
+    if method not in SUMMARY_METHODS:
+        raise ValueError(f"Unknown summary method {method!r}; expected one of {', '.join(SUMMARY_METHODS)}")
+    doc = text if isinstance(text, Document) else Document(text)
+    if method == "textrank":
+        from .textrank import top_sentences  # imports NumPy when available
+        lowered = [doc.lower(i) for i in range(len(doc))]
+        return " ".join(doc[i] for i in top_sentences(lowered, max_sentences))
+    # Lead: only the first sentences are ever split off
+    return " ".join(sent for _, sent in zip(range(max_sentences), doc))
 
 
-def suggest_tasks(text: str, max_suggestions: int = 5) -> List[Dict[str, str]]:
+# Sentences containing one of these are suggested as tasks
+_TASK_MARKERS = ("should", "need to", "todo", "please")
+# Short sentences starting with one of these often are actions
+_ACTION_VERBS = frozenset(("write", "review", "call", "email", "schedule", "create", "update", "fix", "implement"))
+
+
+def suggest_tasks(text: Union[str, Document], max_suggestions: int = 5) -> List[Dict[str, str]]:
     """Heuristic extraction of candidate tasks from text.
 
     Finds sentences that look like actions (start with a verb or contain 'should', 'need to', 'todo').
     Returns a list of suggestion dicts with `title` and `excerpt`.
     """
-    sents = re.split(r'(?<=[.!?])\s+', text.strip())
+    doc = text if isinstance(text, Document) else Document(text)
     suggestions = []
-    verb_start = re.compile(r'^(?:[A-Z][a-z]+|[A-Z])\b')
-    for sent in sents:
-        low = sent.lower()
-        if any(k in low for k in ("should", "need to", "todo", "please")):
-            title = sent.strip()
-            suggestions.append({"title": title[:80], "excerpt": sent.strip()})
-        elif len(suggestions) < max_suggestions and len(sent.split()) <= 12:
-            # short sentences often are action-like
-            # crude heuristic: starts with a verb (lowercased)
-            first_word = sent.strip().split()[0].lower() if sent.strip() else ""
-            if first_word in ("write", "review", "call", "email", "schedule", "create", "update", "fix", "implement"):
-                suggestions.append({"title": sent.strip()[:80], "excerpt": sent.strip()})
+    for i, sent in enumerate(doc):
+        suggestion = _suggestion(sent, doc.lower(i), lambda: doc.words(i), len(suggestions) < max_suggestions)
+        if suggestion is not None:
+            suggestions.append(suggestion)
         if len(suggestions) >= max_suggestions:
             break
     # Fallback: if no suggestions found but text is long, offer a generic review action
-    if not suggestions and len(text.strip()) > 120:
-        excerpt = text.strip()[:120].rsplit(" ", 1)[0]
-        suggestions.append({"title": "Review note", "excerpt": excerpt})
+    stripped = doc.stripped
+    if not suggestions and len(stripped) > 120:
+        suggestions.append(_review_note(stripped))
     return suggestions
+
+
+def _suggestion(sent: str, low: str, words: Callable[[], List[str]], more: bool) -> Optional[Dict[str, str]]:
+    # The suggestion for one sentence, if any; `more` is whether short action sentences still count
+    if any(k in low for k in _TASK_MARKERS):
+        title = sent.strip()
+        return {"title": title[:80], "excerpt": sent.strip()}
+    if more and len(words()) <= 12:
+        # short sentences often are action-like
+        # crude heuristic: starts with a verb (lowercased)
+        first = words()[:1]
+        if first and first[0] in _ACTION_VERBS:
+            return {"title": sent.strip()[:80], "excerpt": sent.strip()}
+    return None
+
+
+def _review_note(stripped: str) -> Dict[str, str]:
+    excerpt = stripped[:120].rsplit(" ", 1)[0]
+    return {"title": "Review note", "excerpt": excerpt}
+
+
+def iter_summary(chunks: Iterable[str], max_sentences: int = 2) -> Iterator[str]:
+    """The sentences of a lead summary of text arriving in chunks.
+
+    Reads only as many chunks as the sentences need (see
+    sentences.SentenceStream); `" ".join()` gives `summarize_text`'s summary.
+    """
+    return itertools.islice(SentenceStream(chunks), max(max_sentences, 0))
+
+
+def iter_suggestions(chunks: Iterable[str], max_suggestions: int = 5) -> Iterator[Dict[str, str]]:
+    """`suggest_tasks` for text arriving in chunks, yielding each suggestion as found.
+
+    Stops reading once `max_suggestions` are found, and holds a bounded part
+    of the text at a time however long it is (see sentences.SentenceStream).
+    """
+    stream = SentenceStream(chunks, keep_prefix=120)
+    sentences = iter(stream)
+    found = 0
+    for sent in sentences:
+        low = sent.lower()
+        suggestion = _suggestion(sent, low, low.split, found < max_suggestions)
+        if suggestion is not None:
+            found += 1
+            yield suggestion
+        if found >= max_suggestions:
+            break
+    if not found:
+        # Only whether the text is over 120 characters matters, not the rest of it
+        while stream.length <= 120 and next(sentences, None) is not None:
+            pass
+        if stream.length > 120:
+            yield _review_note(stream.prefix)
+
+
+Analyzer = Callable[[Document], Any]
+
+
+def run_analyzers(text: Union[str, Document], analyzers: Mapping[str, Analyzer]) -> Dict[str, Any]:
+    """Run several analyzers over one split of `text`; returns their results by name.
+
+    An analyzer is any callable taking a Document, e.g.
+    `functools.partial(suggest_tasks, max_suggestions=3)`.
+    """
+    doc = text if isinstance(text, Document) else Document(text)
+    return {name: analyzer(doc) for name, analyzer in analyzers.items()}
@@ -0,0 +1,171 @@
+"""Persistent cache of agent results, keyed by note content.
+
+The key hashes the note body together with everything else that decides
+the result: `max_sentences`, `max_suggestions`, the summary method and
+`agent.AGENT_VERSION`.
+Editing a note's body therefore changes its key, so a stale result is
+never served; when the note's new result is stored, its entry for the old
+body with the same parameters is dropped. Entries live in
+`<data_dir>/agent_cache.db` (SQLite, so several processes can share it).
+The least recently used ones are evicted once the cache holds more than
+`max_bytes` of results or `max_entries` entries.
+
+The cache also remembers, per note and key, the note a `summarize-note
+--save` stored the summary in, so saving the same summary of the same note
+again reuses that note. These links are not evicted with the results.
+"""
+from __future__ import annotations
+import dataclasses
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from .agent import AGENT_VERSION
+from .models import AgentResult
+from .storage import StorageError
+
+CACHE_NAME = "agent_cache.db"
+DEFAULT_MAX_BYTES = 64 << 20
+
+
+def cache_params(max_sentences: int, max_suggestions: int, method: str = "lead") -> str:
+    """Everything but the body that goes into a cache key."""
+    return f"{AGENT_VERSION}\0{max_sentences}\0{max_suggestions}\0{method}"
+
+
+def cache_key(body: str, max_sentences: int, max_suggestions: int, method: str = "lead") -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{cache_params(max_sentences, max_suggestions, method)}\0".encode("ascii"))
+    h.update(body.encode("utf-8", "surrogatepass"))
+    return h.hexdigest()
+
+
+def for_note(result: AgentResult, note_id: Optional[str]) -> AgentResult:
+    """`result` as the result of `note_id` (a cached body may be shared by several notes)."""
+    return result if result.note_id == note_id else dataclasses.replace(result, note_id=note_id)
+
+
+class AgentCache:
+    def __init__(self, data_dir: str, max_bytes: int = DEFAULT_MAX_BYTES, max_entries: Optional[int] = None):
+        self.path = os.path.join(data_dir, CACHE_NAME)
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        try:
+            self.conn = sqlite3.connect(self.path, timeout=30)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            with self.conn:
+                self.conn.execute(
+                    "CREATE TABLE IF NOT EXISTS saved (note_id TEXT NOT NULL, key TEXT NOT NULL, "
+                    "summary_note_id TEXT NOT NULL, PRIMARY KEY (note_id, key))"
+                )
+                columns = {row[1] for row in self.conn.execute("PRAGMA table_info(results)")}
+                if columns and "params" not in columns:
+                    # Older layout: keep its saved summaries, drop the (recomputable) results
+                    self.conn.execute("INSERT OR IGNORE INTO saved SELECT note_id, key, saved_note_id FROM results "
+                                      "WHERE note_id IS NOT NULL AND saved_note_id IS NOT NULL")
+                    self.conn.execute("DROP TABLE results")
+                self.conn.execute(
+                    "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, note_id TEXT, params TEXT, "
+                    "result TEXT NOT NULL, size INTEGER NOT NULL, used INTEGER NOT NULL)"
+                )
+                self.conn.execute("CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+                self.conn.execute("CREATE INDEX IF NOT EXISTS results_note ON results (note_id)")
+        except sqlite3.Error as exc:
+            raise StorageError(f"Failed to open agent cache {self.path}: {exc}")
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, AgentResult]:
+        """Cached results by key, for the keys that have one; marks them used."""
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, AgentResult] = {}
+        # Stay under SQLite's limit on query parameters
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT key, result FROM results WHERE key IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+            for key, text in rows:
+                found[key] = AgentResult.from_dict(json.loads(text))
+        if found:
+            now = time.time_ns()
+            with self.conn:
+                self.conn.executemany("UPDATE results SET used = ? WHERE key = ?", [(now, k) for k in found])
+        return found
+
+    def get(self, key: str, note_id: Optional[str] = None) -> Optional[AgentResult]:
+        result = self.get_many([key]).get(key)
+        return for_note(result, note_id) if result is not None else None
+
+    def put_many(self, entries: Iterable[Tuple[str, AgentResult]], params: str):
+        """Store `(key, result)` pairs computed with `params` (see `cache_params`).
+
+        Replaces the entries of the same notes for an older body and the same
+        parameters; results for other parameters are kept.
+        """
+        now = time.time_ns()
+        rows = []
+        for key, result in entries:
+            text = json.dumps(result.to_dict(), ensure_ascii=False)
+            rows.append((key, result.note_id, params, text, len(text), now))
+        if not rows:
+            return
+        with self.conn:
+            # The note's previous body (if it changed) will not be asked for again
+            self.conn.executemany("DELETE FROM results WHERE note_id = ? AND params = ? AND key != ?",
+                                  [(r[1], params, r[0]) for r in rows if r[1] is not None])
+            self.conn.executemany(
+                "INSERT INTO results (key, note_id, params, result, size, used) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET note_id = excluded.note_id, result = excluded.result, "
+                "size = excluded.size, used = excluded.used",
+                rows,
+            )
+            self._evict()
+
+    def put(self, key: str, result: AgentResult, params: str):
+        self.put_many([(key, result)], params)
+
+    def _evict(self):
+        count, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        excess_count = count - self.max_entries if self.max_entries is not None else 0
+        excess_bytes = total - self.max_bytes
+        if excess_count <= 0 and excess_bytes <= 0:
+            return
+        doomed: List[str] = []
+        for key, size in self.conn.execute("SELECT key, size FROM results ORDER BY used"):
+            if excess_count <= 0 and excess_bytes <= 0:
+                break
+            doomed.append(key)
+            excess_count -= 1
+            excess_bytes -= size
+        self.conn.executemany("DELETE FROM results WHERE key = ?", [(k,) for k in doomed])
+
+    def saved_note(self, note_id: str, key: str) -> Optional[str]:
+        """Id of the note the summary of `note_id` with this key was saved as, if any."""
+        row = self.conn.execute("SELECT summary_note_id FROM saved WHERE note_id = ? AND key = ?",
+                                (note_id, key)).fetchone()
+        return row[0] if row else None
+
+    def mark_saved(self, note_id: str, key: str, summary_note_id: str):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO saved VALUES (?, ?, ?)", (note_id, key, summary_note_id))
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+def analyze(cache: Optional[AgentCache], note_id: Optional[str], body: str, max_sentences: int,
+            max_suggestions: int, method: str = "lead") -> Tuple[str, AgentResult]:
+    """(cache key, result) for one note body, computed only on a cache miss."""
+    from .pipeline import analyze_chunk
+    key = cache_key(body, max_sentences, max_suggestions, method)
+    result = cache.get(key, note_id) if cache is not None else None
+    if result is None:
+        result, = analyze_chunk([(note_id, body)], max_sentences, max_suggestions, method)
+        if cache is not None:
+            cache.put(key, result, cache_params(max_sentences, max_suggestions, method))
+    return key, result
@@ -0,0 +1,190 @@
+"""asyncio front end to StorageManager.
+
+`AsyncStorageManager` mirrors the StorageManager API with coroutines. All
+blocking work (parsing, atomic writes, index updates) runs on one worker
+thread, which also keeps the underlying manager single-threaded.
+
+- Writes issued while another group is being committed are queued and
+  committed together in one `batch()`, i.e. one atomic write per record kind.
+  Each caller's coroutine resumes once the group holding its write is on disk.
+  If one write of a group fails, the group is retried without it, so only
+  that caller sees the error (see pkms.groupcommit.commit_group).
+- Identical reads issued concurrently share one call on the worker; later
+  reads never join a call started before a write was committed.
+"""
+from __future__ import annotations
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from .groupcommit import commit_group
+from .models import Note, Task
+from .storage import StorageManager
+
+
+class AsyncStorageManager:
+    def __init__(self, data_dir: Optional[str] = None, backend: Optional[str] = None):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pkms-storage")
+        # Built on the worker: SQLite connections stay on their creating thread
+        self.sync = self._executor.submit(StorageManager, data_dir, backend=backend, cache=True).result()
+        self._queue: List[Tuple[str, tuple, dict, asyncio.Future]] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+
+    @property
+    def data_dir(self) -> str:
+        return self.sync.data_dir
+
+    async def close(self):
+        if self._flusher is not None:
+            await asyncio.shield(self._flusher)
+        await self._call(self.sync.close)
+        self._executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _call(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: fn(*args, **kwargs))
+
+    async def _read(self, name: str, *args, **kwargs):
+        fn = getattr(self.sync, name)
+        key = (name, args, tuple(sorted(kwargs.items())))
+        try:
+            shared = self._inflight.get(key)
+        except TypeError:  # unhashable arguments (e.g. a list of tags): no sharing
+            return await self._call(fn, *args, **kwargs)
+        if shared is None:
+            shared = asyncio.ensure_future(self._call(fn, *args, **kwargs))
+            self._inflight[key] = shared
+            shared.add_done_callback(lambda f: self._inflight.pop(key, None) if self._inflight.get(key) is f else None)
+        # One waiter being cancelled must not cancel the others
+        result = await asyncio.shield(shared)
+        # Callers share the call, not the list
+        return list(result) if isinstance(result, list) else result
+
+    async def _exclusive(self, name: str, *args, **kwargs):
+        # Writes that are not coalesced (bulk restores, reindexing): run after
+        # the queued writes, and keep later reads from joining older ones
+        if self._flusher is not None:
+            await asyncio.shield(self._flusher)
+        self._inflight.clear()
+        return await self._call(getattr(self.sync, name), *args, **kwargs)
+
+    async def _write(self, name: str, *args, **kwargs):
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((name, args, kwargs, future))
+        if self._flusher is None:
+            self._flusher = asyncio.ensure_future(self._flush())
+        return await future
+
+    async def _flush(self):
+        try:
+            while self._queue:
+                # Let writers that are ready to run join this group
+                await asyncio.sleep(0)
+                ops, self._queue = self._queue, []
+                self._inflight.clear()
+                try:
+                    results = await self._call(commit_group, self.sync, [op[:3] for op in ops])
+                except Exception as exc:
+                    results = [(False, exc)] * len(ops)
+                for (_, _, _, future), (ok, value) in zip(ops, results):
+                    if future.done():  # the caller was cancelled
+                        continue
+                    if ok:
+                        future.set_result(value)
+                    else:
+                        future.set_exception(value)
+        finally:
+            self._flusher = None
+
+    # Notes operations
+    async def list_notes(self) -> List[Note]:
+        return await self._read("list_notes")
+
+    async def get_note(self, note_id: str) -> Optional[Note]:
+        return await self._read("get_note", note_id)
+
+    async def search_notes(self, query: str, **kwargs) -> List[Note]:
+        return await self._read("search_notes", query, **kwargs)
+
+    async def list_notes_by_tags(self, tags: List[str], match: str = "all") -> List[Note]:
+        return await self._read("list_notes_by_tags", tuple(tags), match=match)
+
+    async def add_note(self, note: Note) -> Note:
+        return await self._write("add_note", note)
+
+    async def add_notes(self, notes: Iterable[Note]) -> List[Note]:
+        return await self._write("add_notes", list(notes))
+
+    async def update_note(self, note_id: str, **changes) -> Note:
+        return await self._write("update_note", note_id, **changes)
+
+    async def update_notes(self, changes: Dict[str, Dict[str, Any]]) -> List[Note]:
+        return await self._write("update_notes", changes)
+
+    async def delete_note(self, note_id: str) -> None:
+        return await self._write("delete_note", note_id)
+
+    async def delete_notes(self, note_ids: Iterable[str]) -> int:
+        return await self._write("delete_notes", list(note_ids))
+
+    async def save_notes(self, notes: List[Note]):
+        return await self._write("save_notes", list(notes))
+
+    async def rebuild_index(self) -> int:
+        return await self._exclusive("rebuild_index")
+
+    # Tasks operations
+    async def list_tasks(self) -> List[Task]:
+        return await self._read("list_tasks")
+
+    async def get_task(self, task_id: str) -> Optional[Task]:
+        return await self._read("get_task", task_id)
+
+    async def add_task(self, task: Task) -> Task:
+        return await self._write("add_task", task)
+
+    async def add_tasks(self, tasks: Iterable[Task]) -> List[Task]:
+        return await self._write("add_tasks", list(tasks))
+
+    async def update_task(self, task_id: str, **changes) -> Task:
+        return await self._write("update_task", task_id, **changes)
+
+    async def update_tasks(self, changes: Dict[str, Dict[str, Any]]) -> List[Task]:
+        return await self._write("update_tasks", changes)
+
+    async def delete_task(self, task_id: str) -> None:
+        return await self._write("delete_task", task_id)
+
+    async def delete_tasks(self, task_ids: Iterable[str]) -> int:
+        return await self._write("delete_tasks", list(task_ids))
+
+    async def save_tasks(self, tasks: List[Task]):
+        return await self._write("save_tasks", list(tasks))
+
+    async def mark_complete(self, task_id: str) -> Task:
+        return await self._write("mark_complete", task_id)
+
+    # Backup / restore
+    async def export(self, out_path: str, fmt: Optional[str] = None) -> int:
+        return await self._exclusive("export", out_path, fmt=fmt)
+
+    async def import_file(self, in_path: str, merge: bool = True, fmt: Optional[str] = None) -> int:
+        return await self._exclusive("import_file", in_path, merge=merge, fmt=fmt)
+
+    async def repair_from_backup(self, backup_path: str, fmt: Optional[str] = None) -> int:
+        return await self._exclusive("repair_from_backup", backup_path, fmt=fmt)
+
+    async def backup(self, backup_dir: str, full: bool = False) -> Dict[str, Any]:
+        return await self._exclusive("backup", backup_dir, full=full)
+
+    async def restore(self, backup_dir: str, upto: Optional[int] = None) -> Dict[str, int]:
+        return await self._exclusive("restore", backup_dir, upto=upto)
+
+    async def compact(self, force: bool = False) -> List[str]:
+        return await self._exclusive("compact", force=force)
@@ -0,0 +1,247 @@
+"""Streaming backup files for export/import.
+
+A backup format is a layout, optionally followed by a compression suffix
+("jsonl.gz"). Both are taken from the file extension unless given.
+
+Layouts:
+- `json`: `{"notes": [...], "tasks": [...]}`, the original export format.
+  It is written one record per line and read incrementally, so backups
+  written by older versions (pretty-printed) still import.
+- `jsonl` (`.jsonl`/`.ndjson`): one `{"kind": ..., "row": ...}` object per line.
+- `binary` (`.pkb`): a versioned header, then length-prefixed UTF-8 JSON
+  records, see `_write_binary`. Fastest to write and read; stdlib only.
+
+Compression: `gz` (gzip), `xz` (lzma) and `zst` (zstd, needs the optional
+`zstandard` package).
+
+Records are streamed in both directions, so memory use does not grow with
+the size of the backup.
+"""
+from __future__ import annotations
+import gzip
+import io
+import json
+import lzma
+import os
+import struct
+import tempfile
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, Optional, Tuple
+from .offsets import JSONStream
+from .storage import StorageError
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+LAYOUTS = ("json", "jsonl", "binary")
+COMPRESSIONS = ("gz", "xz", "zst")
+FORMATS = LAYOUTS + tuple(f"{layout}.{c}" for layout in LAYOUTS for c in COMPRESSIONS)
+_EXTENSIONS = {".json": "json", ".jsonl": "jsonl", ".ndjson": "jsonl", ".pkb": "binary"}
+# Records between two calls of a progress callback
+PROGRESS_EVERY = 1000
+
+Progress = Optional[Callable[[int], None]]
+
+
+def backup_format(path: str, fmt: Optional[str] = None) -> Tuple[str, Optional[str]]:
+    """(layout, compression) for `path`, from `fmt` or else the file extension."""
+    if fmt is None:
+        root, ext = os.path.splitext(path.lower())
+        compression = ext[1:] if ext[1:] in COMPRESSIONS else None
+        if compression:
+            root, ext = os.path.splitext(root)
+        return _EXTENSIONS.get(ext, "json"), compression
+    if fmt not in FORMATS:
+        raise StorageError(f"Unknown backup format: {fmt}")
+    layout, _, compression = fmt.partition(".")
+    return layout, compression or None
+
+
+def _open(path: str, mode: str, compression: Optional[str]) -> BinaryIO:
+    # Binary stream over the (de)compressed contents of `path`
+    if compression == "gz":
+        # Level 6: about twice as fast as the default 9, ~6% larger on backups
+        return gzip.open(path, mode + "b", compresslevel=6)
+    if compression == "xz":
+        return lzma.open(path, mode + "b")
+    if compression == "zst":
+        if zstandard is None:
+            raise StorageError("zstd backups need the 'zstandard' package (pip install zstandard)")
+        return zstandard.open(path, mode + "b")
+    return open(path, mode + "b")
+
+
+def counted(items: Iterable[Any], progress: Progress) -> Iterator[Any]:
+    """Pass `items` through, reporting the running count to `progress`."""
+    if progress is None:
+        yield from items
+        return
+    n = 0
+    for item in items:
+        yield item
+        n += 1
+        if n % PROGRESS_EVERY == 0:
+            progress(n)
+    if n % PROGRESS_EVERY:
+        progress(n)
+
+
+def _write_json(f, records: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+    n = 0
+    current = None
+    f.write("{")
+    for kind, row in records:
+        if kind != current:
+            if current is not None:
+                f.write("\n],")
+            f.write(f"\n{json.dumps(kind)}: [\n")
+            current = kind
+        else:
+            f.write(",\n")
+        f.write(json.dumps(row, ensure_ascii=False))
+        n += 1
+    f.write("\n]\n}\n" if current is not None else "}\n")
+    return n
+
+
+def _write_jsonl(f, records: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+    n = 0
+    for kind, row in records:
+        f.write(json.dumps({"kind": kind, "row": row}, ensure_ascii=False) + "\n")
+        n += 1
+    return n
+
+
+# Binary layout, all integers little-endian:
+#   header: the magic b"PKMSBAK", then the format version (u16)
+#   records: (type: u8, length: u32, payload), payload being UTF-8 JSON
+# A schema record ({"kind", "fields"}) precedes the rows it describes; a row
+# is the array of its field values in schema order, so field names are not
+# repeated per record. Only JSON is decoded on read, whatever the input.
+# Version 1 files (marshalled rows) are refused.
+BINARY_MAGIC = b"PKMSBAK"
+BINARY_VERSION = 2
+_HEADER = struct.Struct(f"<{len(BINARY_MAGIC)}sH")
+_FRAME = struct.Struct("<BI")
+_SCHEMA, _ROW = 0, 1
+
+
+def _write_binary(f: BinaryIO, records: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+    n = 0
+    schema = None
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    f.write(_HEADER.pack(BINARY_MAGIC, BINARY_VERSION))
+    for kind, row in records:
+        fields = tuple(row)
+        if schema != (kind, fields):
+            schema = (kind, fields)
+            payload = encode({"kind": kind, "fields": fields}).encode("utf-8")
+            f.write(_FRAME.pack(_SCHEMA, len(payload)) + payload)
+        payload = encode(list(row.values())).encode("utf-8")
+        f.write(_FRAME.pack(_ROW, len(payload)) + payload)
+        n += 1
+    return n
+
+
+def write_backup(path: str, records: Iterable[Tuple[str, Dict[str, Any]]],
+                 fmt: Optional[str] = None, progress: Progress = None) -> int:
+    """Write (kind, row) pairs to `path` atomically. Returns the number of records.
+
+    In the json layout, pairs of one kind must be consecutive.
+    """
+    layout, compression = backup_format(path, fmt)
+    tmpfd, tmppath = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    os.close(tmpfd)
+    # mkstemp makes the file 0600; give the export the mode open() would
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(tmppath, 0o666 & ~umask)
+    try:
+        with _open(tmppath, "w", compression) as raw:
+            records = counted(records, progress)
+            if layout == "binary":
+                n = _write_binary(raw, records)
+            else:
+                f = io.TextIOWrapper(raw, encoding="utf-8")
+                n = (_write_jsonl if layout == "jsonl" else _write_json)(f, records)
+                # Hand the stream back so `raw` finishes the compressed frame on close
+                f.detach()
+        os.replace(tmppath, path)
+    finally:
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+    return n
+
+
+def _read_json(f) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    stream = JSONStream(f)
+    stream.expect("{")
+    if stream.peek() == "}":
+        return
+    while True:
+        key = stream.value()
+        stream.expect(":")
+        if stream.peek() == "[":
+            for row in stream.array():
+                yield key, row
+        else:
+            stream.value()
+        if stream.peek() == "}":
+            return
+        stream.expect(",")
+
+
+def _read_jsonl(f) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    for line in f:
+        if line.strip():
+            entry = json.loads(line)
+            yield entry["kind"], entry["row"]
+
+
+def _read_binary(f: BinaryIO) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    header = f.read(_HEADER.size)
+    if len(header) < _HEADER.size or not header.startswith(BINARY_MAGIC):
+        raise ValueError("not a pkms binary backup")
+    magic, version = _HEADER.unpack(header)
+    if version != BINARY_VERSION:
+        raise ValueError(f"unsupported binary backup version {version} (this version reads {BINARY_VERSION})")
+    decode = json.JSONDecoder().decode
+    kind = fields = None
+    while True:
+        frame = f.read(_FRAME.size)
+        if not frame:
+            return
+        if len(frame) < _FRAME.size:
+            raise ValueError("truncated record header")
+        rtype, size = _FRAME.unpack(frame)
+        payload = f.read(size)
+        if len(payload) < size:
+            raise ValueError("truncated record")
+        if rtype == _SCHEMA:
+            schema = decode(payload.decode("utf-8"))
+            kind, fields = schema["kind"], schema["fields"]
+            if not isinstance(kind, str) or not isinstance(fields, list):
+                raise ValueError("malformed schema record")
+            continue
+        if rtype != _ROW or fields is None:
+            raise ValueError(f"unexpected record type {rtype}")
+        values = decode(payload.decode("utf-8"))
+        if type(values) is not list or len(values) != len(fields):
+            raise ValueError("malformed record")
+        yield kind, dict(zip(fields, values))
+
+
+def read_backup(path: str, fmt: Optional[str] = None,
+                progress: Progress = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Stream (kind, row) pairs from a backup, in file order."""
+    layout, compression = backup_format(path, fmt)
+    with _open(path, "r", compression) as raw:
+        try:
+            if layout == "binary":
+                yield from counted(_read_binary(raw), progress)
+            else:
+                f = io.TextIOWrapper(raw, encoding="utf-8")
+                yield from counted((_read_jsonl if layout == "jsonl" else _read_json)(f), progress)
+        except (ValueError, KeyError, TypeError, EOFError, OSError, lzma.LZMAError) as exc:
+            raise StorageError(f"Failed to read backup {path}: {exc}")
@@ -4,10 +4,26 @@ Provides subcommands to manage notes and tasks and call the simple agent.
 """
 from __future__ import annotations
 import argparse
+import os
 import sys
-from .storage import StorageManager, StorageError
+from .storage import StorageManager, StorageError, BACKENDS, MATCH_MODES, default_data_dir, migrate
+from .backup import FORMATS
+from .daemon import forward, serve, socket_path
+from .agent import SUMMARY_METHODS
 from .models import Note, Task
-from .agent import summarize_text, suggest_tasks
+
+
+def _storage(args) -> StorageManager:
+    # Set by `pkms serve`, which keeps one warm manager for every command
+    storage = getattr(args, "storage", None)
+    if storage is not None:
+        return storage
+    return StorageManager(args.data_dir, backend=args.backend)
+
+
+def _same_store(args, storage: StorageManager) -> bool:
+    data_dir = os.path.realpath(args.data_dir or default_data_dir())
+    return data_dir == os.path.realpath(storage.data_dir) and args.backend in (None, storage.backend.name)
 
 
 def _print_note(n: Note):
@@ -27,7 +43,7 @@ def _print_task(t: Task):
 
 
 def cmd_add_note(args):
-    sm = StorageManager(args.data_dir)
+    sm = _storage(args)
     tags = [t.strip() for t in (args.tags or "").split(",") if t.strip()]
     note = Note.create(args.title, args.body, tags=tags)
     sm.add_note(note)
@@ -36,31 +52,34 @@ def cmd_add_note(args):
 
 
 def cmd_list_notes(args):
-    sm = StorageManager(args.data_dir)
-    notes = sm.list_notes()
+    sm = _storage(args)
+    if args.tag:
+        notes = sm.list_notes_by_tags(args.tag, match=args.tag_match)
+    else:
+        notes = sm.list_notes()
     for n in notes:
         print(f"- {n.id} | {n.title} | tags={','.join(n.tags)} | updated={n.updated_at}")
 
 
 def cmd_view_note(args):
-    sm = StorageManager(args.data_dir)
-    for n in sm.list_notes():
-        if n.id == args.id:
-            _print_note(n)
-            return
-    print("Note not found", file=sys.stderr)
-    sys.exit(2)
+    sm = _storage(args)
+    n = sm.get_note(args.id)
+    if n is None:
+        print("Note not found", file=sys.stderr)
+        sys.exit(2)
+    _print_note(n)
 
 
 def cmd_search_notes(args):
-    sm = StorageManager(args.data_dir)
-    results = sm.search_notes(args.query, tag=args.tag)
+    sm = _storage(args)
+    results = sm.search_notes(args.query, tags=args.tag, tag_match=args.tag_match, match=args.match,
+                              limit=args.limit, ranked=args.ranked)
     for n in results:
         print(f"- {n.id} | {n.title} | tags={','.join(n.tags)}")
 
 
 def cmd_add_task(args):
-    sm = StorageManager(args.data_dir)
+    sm = _storage(args)
     task = Task.create(title=args.title, description=args.description, due_date=args.due)
     sm.add_task(task)
     print("Task added:")
@@ -68,7 +87,7 @@ def cmd_add_task(args):
 
 
 def cmd_list_tasks(args):
-    sm = StorageManager(args.data_dir)
+    sm = _storage(args)
     tasks = sm.list_tasks()
     if args.status:
         tasks = [t for t in tasks if t.status == args.status]
@@ -77,7 +96,7 @@ def cmd_list_tasks(args):
 
 
 def cmd_complete_task(args):
-    sm = StorageManager(args.data_dir)
+    sm = _storage(args)
     try:
         t = sm.mark_complete(args.id)
         print("Marked complete:")
@@ -88,25 +107,37 @@ def cmd_complete_task(args):
 
 
 def cmd_summarize(args):
-    sm = StorageManager(args.data_dir)
-    note = None
-    for n in sm.list_notes():
-        if n.id == args.id:
-            note = n
-            break
+    from .agent_cache import AgentCache, analyze
+    sm = _storage(args)
+    note = sm.get_note(args.id)
     if not note:
         print("Note not found", file=sys.stderr)
         sys.exit(2)
-    summary = summarize_text(note.body, max_sentences=args.sentences)
-    suggestions = suggest_tasks(note.body, max_suggestions=args.max_suggestions)
-    print("Summary:\n", summary)
-    if getattr(args, "save", False):
-        # Save the summary as a new note attributed to the agent
-        summary_title = f"Summary: {note.title}" if note.title else "Summary"
-        summary_note = Note.create(title=summary_title, body=summary, tags=["summary", "agent"], source="agent")
-        sm.add_note(summary_note)
-        print("Saved summary as note:")
-        _print_note(summary_note)
+    cache = None if args.no_cache else AgentCache(sm.data_dir)
+    try:
+        key, result = analyze(cache, note.id, note.body, args.sentences, args.max_suggestions, args.method)
+        summary, suggestions = result.summary, result.suggestions
+        print("Summary:\n", summary)
+        if getattr(args, "save", False):
+            saved_id = cache.saved_note(note.id, key) if cache is not None else None
+            saved = sm.get_note(saved_id) if saved_id else None
+            if saved is not None:
+                # The same summary was saved before; don't add a duplicate
+                print("Summary already saved as note:")
+                _print_note(saved)
+            else:
+                # Save the summary as a new note attributed to the agent
+                summary_title = f"Summary: {note.title}" if note.title else "Summary"
+                summary_note = Note.create(title=summary_title, body=summary, tags=["summary", "agent"],
+                                           source="agent")
+                sm.add_note(summary_note)
+                if cache is not None:
+                    cache.mark_saved(note.id, key, summary_note.id)
+                print("Saved summary as note:")
+                _print_note(summary_note)
+    finally:
+        if cache is not None:
+            cache.close()
     if suggestions:
         print("\nSuggested tasks:")
         for i, s in enumerate(suggestions, 1):
@@ -121,8 +152,25 @@ def cmd_summarize(args):
             _print_task(task)
 
 
+def cmd_summarize_all(args):
+    from .pipeline import summarize_all
+    sm = _storage(args)
+    progress = _progress("Summarized")
+    try:
+        counts = summarize_all(sm, max_sentences=args.sentences, max_suggestions=args.max_suggestions,
+                               workers=args.workers, chunk_size=args.chunk_size, resume=not args.restart,
+                               cache=not args.no_cache, method=args.method, progress=progress)
+        _end_progress(progress)
+    except Exception as e:
+        print("Error:", e)
+        sys.exit(2)
+    resumed = f" (resumed; {counts['skipped']} already done)" if counts["skipped"] else ""
+    cached = f", {counts['cached']} from cache" if counts["cached"] else ""
+    print(f"Summarized {counts['summarized']} notes{cached}{resumed}")
+
+
 def cmd_update_note(args):
-    sm = StorageManager(args.data_dir)
+    sm = _storage(args)
     changes = {}
     if args.title:
         changes["title"] = args.title
@@ -141,7 +189,7 @@ def cmd_update_note(args):
 
 
 def cmd_delete_note(args):
-    sm = StorageManager(args.data_dir)
+    sm = _storage(args)
     try:
         if not getattr(args, "yes", False):
             yn = input(f"Delete note {args.id}? This action cannot be undone. (y/N): ")
@@ -156,7 +204,7 @@ def cmd_delete_note(args):
 
 
 def cmd_update_task(args):
-    sm = StorageManager(args.data_dir)
+    sm = _storage(args)
     changes = {}
     if args.title:
         changes["title"] = args.title
@@ -176,7 +224,7 @@ def cmd_update_task(args):
 
 
 def cmd_delete_task(args):
-    sm = StorageManager(args.data_dir)
+    sm = _storage(args)
     try:
         if not getattr(args, "yes", False):
             yn = input(f"Delete task {args.id}? This action cannot be undone. (y/N): ")
@@ -190,44 +238,153 @@ def cmd_delete_task(args):
         sys.exit(2)
 
 
+def _progress(verb: str):
+    """Running record counter on stderr, only when it is a terminal."""
+    if not sys.stderr.isatty():
+        return None
+
+    def report(n: int):
+        print(f"\r{verb} {n} records...", end="", file=sys.stderr, flush=True)
+    return report
+
+
+def _end_progress(progress):
+    if progress is not None:
+        print(file=sys.stderr)
+
+
 def cmd_export(args):
-    sm = StorageManager(args.data_dir)
+    sm = _storage(args)
+    progress = _progress("Exported")
     try:
-        sm.export(args.path)
-        print(f"Exported data to {args.path}")
+        count = sm.export(args.path, fmt=args.format, progress=progress)
+        _end_progress(progress)
+        print(f"Exported {count} records to {args.path}")
     except Exception as e:
         print("Error:", e)
         sys.exit(2)
 
 
 def cmd_import(args):
-    sm = StorageManager(args.data_dir)
+    sm = _storage(args)
+    progress = _progress("Read")
     try:
-        sm.import_file(args.path, merge=not args.replace)
-        print(f"Imported data from {args.path}")
+        count = sm.import_file(args.path, merge=not args.replace, fmt=args.format, progress=progress)
+        _end_progress(progress)
+        print(f"Imported {count} records from {args.path}")
     except Exception as e:
         print("Error:", e)
         sys.exit(2)
 
 
 def cmd_repair(args):
-    sm = StorageManager(args.data_dir)
+    sm = _storage(args)
     try:
         if not getattr(args, "yes", False):
             yn = input(f"Repair current data from backup {args.path}? This will overwrite current data. (y/N): ")
             if yn.strip().lower() not in ("y", "yes"):
                 print("Aborted")
                 return
-        sm.repair_from_backup(args.path)
+        progress = _progress("Read")
+        sm.repair_from_backup(args.path, fmt=args.format, progress=progress)
+        _end_progress(progress)
         print(f"Repaired data from backup {args.path}")
     except Exception as e:
         print("Error:", e)
         sys.exit(2)
 
 
+def cmd_backup(args):
+    sm = _storage(args)
+    progress = _progress("Scanned")
+    result = sm.backup(args.dir, full=args.full, progress=progress)
+    _end_progress(progress)
+    if result["file"] is None:
+        print("No changes since the last backup")
+    else:
+        print(f"Wrote {result['file']}: {result['puts']} changed, {result['deletes']} deleted")
+
+
+def cmd_restore(args):
+    sm = _storage(args)
+    if not args.yes:
+        yn = input(f"Restore data from backups in {args.dir}? This will overwrite current data. (y/N): ")
+        if yn.strip().lower() not in ("y", "yes"):
+            print("Aborted")
+            return
+    counts = sm.restore(args.dir, upto=args.upto)
+    print(f"Restored {counts['notes']} notes and {counts['tasks']} tasks from {args.dir}")
+
+
+def cmd_serve(args):
+    if args.stop:
+        from .daemon import Client
+        try:
+            with Client(socket_path(args.data_dir), timeout=5) as client:
+                client.call("shutdown")
+        except OSError:
+            print("No pkms server is running", file=sys.stderr)
+            return 1
+        print("Server stopped")
+        return
+    print(f"Serving {args.data_dir or default_data_dir()} on {socket_path(args.data_dir)} (Ctrl-C to stop)")
+    sys.stdout.flush()
+    serve(args.data_dir, backend=args.backend)
+
+
+def cmd_migrate(args):
+    try:
+        counts = migrate(args.data_dir or default_data_dir(), args.target, source=args.backend)
+        print(f"Migrated {counts['notes']} notes and {counts['tasks']} tasks to {args.target}")
+    except Exception as e:
+        print("Error:", e)
+        sys.exit(2)
+
+
+def cmd_reshard(args):
+    from .sharded_backend import reshard
+    try:
+        counts = reshard(args.data_dir or default_data_dir(), args.shards)
+        print(f"Resharded {counts['notes']} notes and {counts['tasks']} tasks into {args.shards} shards each")
+    except Exception as e:
+        print("Error:", e)
+        sys.exit(2)
+
+
+def cmd_compact(args):
+    sm = _storage(args)
+    done = sm.compact(force=args.force)
+    if done:
+        print(f"Compacted journal for: {', '.join(done)}")
+    else:
+        print("Nothing to compact")
+
+
+def cmd_reindex(args):
+    sm = _storage(args)
+    count = sm.rebuild_index()
+    print(f"Indexed {count} notes")
+
+
+def _add_tag_filter(a: argparse.ArgumentParser):
+    a.add_argument("--tag", action="append", help="Only notes with this tag (repeat for several tags)")
+    g = a.add_mutually_exclusive_group()
+    g.add_argument("--all-tags", dest="tag_match", action="store_const", const="all",
+                   help="Notes must carry every --tag (default)")
+    g.add_argument("--any-tag", dest="tag_match", action="store_const", const="any",
+                   help="Notes may carry any of the --tag values")
+    a.set_defaults(tag_match="all")
+
+
+def _add_format(a: argparse.ArgumentParser):
+    a.add_argument("--format", choices=FORMATS,
+                   help="Backup format, optionally compressed, e.g. jsonl.gz (default: from the file extension)")
+
+
 def build_parser() -> argparse.ArgumentParser:
     p = argparse.ArgumentParser(prog="pkms", description="Simple PKMS CLI (notes + tasks + agent)")
     p.add_argument("--data-dir", help="Path to data directory (overrides default)")
+    p.add_argument("--backend", choices=BACKENDS, help="Storage backend (default: detected from data directory)")
     sub = p.add_subparsers(dest="cmd")
 
     a = sub.add_parser("add-note")
@@ -237,6 +394,7 @@ def build_parser() -> argparse.ArgumentParser:
     a.set_defaults(func=cmd_add_note)
 
     a = sub.add_parser("list-notes")
+    _add_tag_filter(a)
     a.set_defaults(func=cmd_list_notes)
 
     a = sub.add_parser("view-note")
@@ -245,7 +403,11 @@ def build_parser() -> argparse.ArgumentParser:
 
     a = sub.add_parser("search-notes")
     a.add_argument("query")
-    a.add_argument("--tag")
+    _add_tag_filter(a)
+    a.add_argument("--match", choices=MATCH_MODES, default="phrase",
+                   help="phrase: whole query as one substring; all/any: every/some word of the query")
+    a.add_argument("--limit", type=int, help="Show at most this many results")
+    a.add_argument("--ranked", action="store_true", help="Order results by relevance (BM25) instead of storage order")
     a.set_defaults(func=cmd_search_notes)
 
     a = sub.add_parser("add-task")
@@ -266,10 +428,24 @@ def build_parser() -> argparse.ArgumentParser:
     a.add_argument("id")
     a.add_argument("--sentences", type=int, default=2)
     a.add_argument("--max-suggestions", type=int, default=3)
+    a.add_argument("--method", choices=SUMMARY_METHODS, default="lead",
+                   help="lead: first sentences; textrank: most central sentences")
     a.add_argument("--accept", action="store_true", help="Auto-accept first suggestion and create a task")
     a.add_argument("--save", action="store_true", help="Save the generated summary as a new note (source=agent)")
+    a.add_argument("--no-cache", action="store_true", help="Recompute instead of using the agent cache")
     a.set_defaults(func=cmd_summarize)
 
+    a = sub.add_parser("summarize-all")
+    a.add_argument("--sentences", type=int, default=2)
+    a.add_argument("--max-suggestions", type=int, default=3)
+    a.add_argument("--method", choices=SUMMARY_METHODS, default="lead",
+                   help="lead: first sentences; textrank: most central sentences")
+    a.add_argument("--workers", type=int, help="Worker processes (default: one per CPU)")
+    a.add_argument("--chunk-size", type=int, default=256, help="Notes handed to a worker at a time")
+    a.add_argument("--restart", action="store_true", help="Start a new run instead of resuming an unfinished one")
+    a.add_argument("--no-cache", action="store_true", help="Recompute instead of using the agent cache")
+    a.set_defaults(func=cmd_summarize_all)
+
     a = sub.add_parser("update-note")
     a.add_argument("id")
     a.add_argument("--title")
@@ -297,29 +473,73 @@ def build_parser() -> argparse.ArgumentParser:
 
     a = sub.add_parser("export")
     a.add_argument("path", help="Path to write exported JSON")
+    _add_format(a)
     a.set_defaults(func=cmd_export)
 
     a = sub.add_parser("import")
     a.add_argument("path", help="Path to read exported JSON")
     a.add_argument("--replace", action="store_true", help="Replace existing data instead of merge")
+    _add_format(a)
     a.set_defaults(func=cmd_import)
 
     a = sub.add_parser("repair")
     a.add_argument("path", help="Backup file to restore from")
+    _add_format(a)
     a.add_argument("--yes", action="store_true", help="Auto-confirm destructive action")
     a.set_defaults(func=cmd_repair)
 
+    a = sub.add_parser("backup")
+    a.add_argument("dir", help="Backup directory; only changes since the last backup are written")
+    a.add_argument("--full", action="store_true", help="Start a new chain with a full copy")
+    a.set_defaults(func=cmd_backup)
+
+    a = sub.add_parser("restore")
+    a.add_argument("dir", help="Backup directory written by the backup command")
+    a.add_argument("--upto", type=int, help="Replay only the first N backups of the chain")
+    a.add_argument("--yes", action="store_true", help="Auto-confirm destructive action")
+    a.set_defaults(func=cmd_restore)
+
+    a = sub.add_parser("serve")
+    a.add_argument("--stop", action="store_true", help="Stop the running server")
+    a.set_defaults(func=cmd_serve)
+
+    a = sub.add_parser("migrate")
+    a.add_argument("target", choices=BACKENDS, help="Backend to move all records into")
+    a.set_defaults(func=cmd_migrate)
+
+    a = sub.add_parser("reshard")
+    a.add_argument("shards", type=int, help="Number of files per record kind (the store moves to the sharded backend)")
+    a.set_defaults(func=cmd_reshard)
+
+    a = sub.add_parser("compact")
+    a.add_argument("--force", action="store_true", help="Compact even if the journal is below the size threshold")
+    a.set_defaults(func=cmd_compact)
+
+    a = sub.add_parser("reindex")
+    a.set_defaults(func=cmd_reindex)
+
     return p
 
 
-def main(argv=None):
-    parser = build_parser()
+def run(argv, parser=None, storage=None):
+    """Parse and run one command; `storage` is reused if it serves the same store."""
+    parser = parser or build_parser()
     args = parser.parse_args(argv)
     if not hasattr(args, "func"):
         parser.print_help()
         return 1
+    if storage is not None and _same_store(args, storage):
+        args.storage = storage
     try:
         return args.func(args)
     except Exception as exc:
         print("Error:", exc, file=sys.stderr)
         return 2
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    code = forward(argv)
+    if code is not None:
+        return code
+    return run(argv)
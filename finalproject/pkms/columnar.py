@@ -0,0 +1,82 @@
+"""Columnar, read-only collections of records.
+
+`Columns` holds one record type as parallel lists, one per field, instead of
+one object per record. That drops the per-object overhead and lets equal
+values share storage:
+
+- tag lists are stored as tuples, one shared tuple per distinct tag set
+- low-cardinality fields (source, status, due_date) are interned
+- updated_at is stored as None when it equals created_at
+
+Records are only built (as Note/Task objects) when indexed or iterated, so
+a scan of one column (e.g. every note's tags) never materializes the rest.
+Use `StorageManager.columns(kind)` to load one from a store.
+"""
+from __future__ import annotations
+import dataclasses
+import sys
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+_SHARED_FIELDS = {"source", "status", "due_date"}
+
+
+class Columns:
+    def __init__(self, model, rows: Iterable[Dict[str, Any]] = ()):
+        self.model = model
+        self.fields: Tuple[str, ...] = tuple(f.name for f in dataclasses.fields(model))
+        self._columns: Dict[str, List[Any]] = {name: [] for name in self.fields}
+        self._tagsets: Dict[tuple, tuple] = {}
+        self.extend(rows)
+
+    @classmethod
+    def from_records(cls, model, records: Iterable[Any]) -> "Columns":
+        return cls(model, (r.to_dict() for r in records))
+
+    def extend(self, rows: Iterable[Dict[str, Any]]):
+        """Append rows (dicts as stored by the backends), normalized like `model.from_dict`."""
+        # Defaults are filled by from_dict, then columns keep only what differs
+        from_dict = self.model.from_dict
+        appends = [(name, self._columns[name].append) for name in self.fields]
+        tagsets = self._tagsets
+        for row in rows:
+            record = from_dict(row)
+            for name, append in appends:
+                value = getattr(record, name)
+                if name == "tags":
+                    value = tuple(value)
+                    value = tagsets.setdefault(value, value)
+                elif name == "updated_at" and value == record.created_at:
+                    value = None
+                elif name in _SHARED_FIELDS and type(value) is str:
+                    value = sys.intern(value)
+                append(value)
+
+    def __len__(self) -> int:
+        return len(self._columns["id"])
+
+    def value(self, name: str, i: int) -> Any:
+        value = self._columns[name][i]
+        if name == "tags":
+            return list(value)
+        if name == "updated_at" and value is None:
+            return self._columns["created_at"][i]
+        return value
+
+    def column(self, name: str) -> List[Any]:
+        """All values of one field, in record order (tags as tuples)."""
+        if name == "updated_at":
+            return [self.value(name, i) for i in range(len(self))]
+        return list(self._columns[name])
+
+    def __getitem__(self, i: int):
+        if i < 0:
+            i += len(self)
+        return self.model(**{name: self.value(name, i) for name in self.fields})
+
+    def __iter__(self) -> Iterator[Any]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def rows(self) -> Iterator[Dict[str, Any]]:
+        for i in range(len(self)):
+            yield {name: self.value(name, i) for name in self.fields}
@@ -0,0 +1,250 @@
+"""Long-running pkms server on a Unix domain socket.
+
+`pkms serve` keeps one `StorageManager` (with its record cache and search
+indexes) and the argument parser in memory, and runs CLI commands sent over
+`<data_dir>/pkms.sock`. The CLI forwards to a running server on its own, so
+scripts need no changes; `Client` keeps one connection open for loops that
+issue many commands.
+
+Protocol: JSON-RPC 2.0, one request or response object per line.
+- `run` {"argv": [...], "cwd": "..."} -> {"exit": int, "stdout": str, "stderr": str}
+- `ping` -> "pong"
+- `shutdown` -> null, then the server exits
+
+Each connection gets a thread, but commands run one at a time (they share
+the process's cwd and stdout), so they never interleave.
+"""
+from __future__ import annotations
+import contextlib
+import io
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from .storage import StorageManager
+
+# pkms.storage is imported only where needed, so forwarding a command from
+# pkms_cli.py stays cheap
+
+SOCKET_NAME = "pkms.sock"
+# Commands never forwarded: they manage the server or the backend files it
+# holds open, or run long enough to hold every other client up
+_LOCAL_COMMANDS = {"serve", "migrate", "reshard", "summarize-all"}
+# Commands that prompt for confirmation unless given --yes
+_PROMPTING_COMMANDS = {"delete-note", "delete-task", "repair", "restore"}
+
+_PARSE_ERROR, _INVALID_REQUEST, _METHOD_NOT_FOUND, _INVALID_PARAMS = -32700, -32600, -32601, -32602
+
+
+def socket_path(data_dir: Optional[str] = None) -> str:
+    if os.getenv("PKMS_SOCKET"):
+        return os.environ["PKMS_SOCKET"]
+    if data_dir is None:
+        from .storage import default_data_dir
+        data_dir = default_data_dir()
+    return os.path.join(data_dir, SOCKET_NAME)
+
+
+def supported() -> bool:
+    return hasattr(socket, "AF_UNIX")
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            response = self.server.dispatch(line)
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+            self.wfile.flush()
+            if self.server.stopping:
+                return
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    # handle_request() returns this often so serve() notices a shutdown
+    timeout = 0.2
+
+    def __init__(self, path: str, storage: StorageManager):
+        from .cli import build_parser
+        self.storage = storage
+        self.parser = build_parser()
+        self.stopping = False
+        self._run_lock = threading.Lock()
+        super().__init__(path, _Handler)
+
+    def server_bind(self):
+        # The socket is created 0600, so no other user can connect between
+        # bind() and a chmod
+        umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+
+    def dispatch(self, line: bytes) -> Dict[str, Any]:
+        try:
+            request = json.loads(line)
+        except ValueError as exc:
+            return _error(None, _PARSE_ERROR, f"Parse error: {exc}")
+        if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+            return _error(None, _INVALID_REQUEST, "Invalid request")
+        rid, method, params = request.get("id"), request["method"], request.get("params") or {}
+        if method == "ping":
+            return {"jsonrpc": "2.0", "id": rid, "result": "pong"}
+        if method == "shutdown":
+            self.stopping = True
+            return {"jsonrpc": "2.0", "id": rid, "result": None}
+        if method != "run":
+            return _error(rid, _METHOD_NOT_FOUND, f"Method not found: {method}")
+        argv = params.get("argv")
+        if not isinstance(argv, list) or not all(isinstance(a, str) for a in argv):
+            return _error(rid, _INVALID_PARAMS, "params.argv must be a list of strings")
+        return {"jsonrpc": "2.0", "id": rid, "result": self.run(argv, params.get("cwd"))}
+
+    def run(self, argv: List[str], cwd: Optional[str] = None) -> Dict[str, Any]:
+        out, err = io.StringIO(), io.StringIO()
+        with self._run_lock:
+            code = self._run(argv, cwd, out, err)
+        if code is None:
+            code = 0
+        elif not isinstance(code, int):
+            # sys.exit("message") prints the message and exits with 1
+            err.write(f"{code}\n")
+            code = 1
+        return {"exit": code, "stdout": out.getvalue(), "stderr": err.getvalue()}
+
+    def _run(self, argv, cwd, out, err):
+        from .cli import run
+        here = os.getcwd()
+        try:
+            # Relative paths (export, import, ...) are the client's
+            if cwd:
+                os.chdir(cwd)
+            with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+                try:
+                    code = run(argv, parser=self.parser, storage=self.storage)
+                except SystemExit as exc:
+                    code = exc.code
+        finally:
+            os.chdir(here)
+        return code
+
+
+def _error(rid, code: int, message: str) -> Dict[str, Any]:
+    return {"jsonrpc": "2.0", "id": rid, "error": {"code": code, "message": message}}
+
+
+class Client:
+    """Connection to a running server; reuse one for many commands."""
+
+    def __init__(self, path: str, timeout: Optional[float] = None):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        try:
+            self.sock.connect(path)
+        except OSError:
+            self.sock.close()
+            raise
+        self.rfile = self.sock.makefile("rb")
+        self._next_id = 0
+
+    def call(self, method: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        self._next_id += 1
+        request = {"jsonrpc": "2.0", "id": self._next_id, "method": method}
+        if params is not None:
+            request["params"] = params
+        self.sock.sendall(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+        line = self.rfile.readline()
+        if not line:
+            raise ConnectionError("pkms server closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            from .storage import StorageError
+            raise StorageError(f"pkms server error: {response['error']['message']}")
+        return response["result"]
+
+    def run(self, argv: List[str]) -> Dict[str, Any]:
+        return self.call("run", {"argv": list(argv), "cwd": os.getcwd()})
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _global_options(argv: List[str]) -> Dict[str, Optional[str]]:
+    # Just enough of the global options to find the server, without argparse
+    found: Dict[str, Optional[str]] = {"--data-dir": None, "--backend": None}
+    it = iter(argv)
+    for arg in it:
+        name, eq, value = arg.partition("=")
+        if name in found:
+            found[name] = value if eq else next(it, None)
+        elif not arg.startswith("-"):
+            found["command"] = arg
+            break
+    return found
+
+
+def forward(argv: List[str]) -> Optional[int]:
+    """Run `argv` on a running server if there is one; None means run it locally."""
+    if not supported() or os.getenv("PKMS_NO_DAEMON"):
+        return None
+    opts = _global_options(argv)
+    command = opts.get("command")
+    if command is None or command in _LOCAL_COMMANDS:
+        return None
+    if command in _PROMPTING_COMMANDS and "--yes" not in argv:
+        return None
+    path = socket_path(opts["--data-dir"])
+    if not os.path.exists(path):
+        return None
+    try:
+        with Client(path) as client:
+            result = client.run(argv)
+    except OSError:
+        # Stale socket or server gone: fall back to running locally
+        return None
+    sys.stdout.write(result["stdout"])
+    sys.stderr.write(result["stderr"])
+    return result["exit"]
+
+
+def serve(data_dir: Optional[str] = None, backend: Optional[str] = None, path: Optional[str] = None):
+    """Serve `data_dir` until a shutdown request or Ctrl-C."""
+    from .storage import StorageError, StorageManager, default_data_dir
+    if not supported():
+        raise StorageError("pkms serve needs Unix domain sockets, which this platform lacks")
+    data_dir = data_dir or default_data_dir()
+    path = path or socket_path(data_dir)
+    if os.path.exists(path):
+        try:
+            Client(path, timeout=1).close()
+        except OSError:
+            os.remove(path)  # left by a server that did not exit cleanly
+        else:
+            raise StorageError(f"A pkms server is already listening on {path}")
+    storage = StorageManager(data_dir, backend=backend, cache=True)
+    server = Server(path, storage)
+    try:
+        while not server.stopping:
+            server.handle_request()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.remove(path)
+        storage.close()
@@ -0,0 +1,168 @@
+"""Group commit: buffer writes from a tight loop and commit them together.
+
+`StorageManager.group_commit()` returns a `GroupCommitter`. Its write
+methods queue the change and return a `concurrent.futures.Future` at once; a
+background thread commits everything queued in one `batch()` (one atomic
+write per record kind) when the oldest queued write is `window` seconds old
+or `max_records` writes are waiting, whichever comes first. A future
+resolves, with what the StorageManager method would have returned, only once
+its write is on disk.
+
+Writes submitted while a group is being committed form the next group, so
+the group size grows with the backlog and a slow store still does one write
+per group.
+"""
+from __future__ import annotations
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, List, Tuple
+
+Op = Tuple[str, tuple, dict]
+
+
+def commit_group(storage, ops: List[Op]) -> List[Tuple[bool, Any]]:
+    """Run `(method name, args, kwargs)` writes in one batch; (ok, result or exception) each.
+
+    A write that raises aborts the batch, which then writes nothing; it is
+    retried without that write, so only the failing caller sees an error.
+    """
+    results: List[Tuple[bool, Any]] = [(False, None)] * len(ops)
+    todo = list(range(len(ops)))
+    while todo:
+        done: List[Any] = []
+        failed = None
+        try:
+            with storage.batch():
+                for i in todo:
+                    failed = i
+                    name, args, kwargs = ops[i]
+                    done.append(getattr(storage, name)(*args, **kwargs))
+                failed = None
+        except Exception as exc:
+            if failed is None:  # the commit itself failed
+                for i in todo:
+                    results[i] = (False, exc)
+                break
+            results[failed] = (False, exc)
+            todo.remove(failed)
+            continue
+        for i, r in zip(todo, done):
+            results[i] = (True, r)
+        break
+    return results
+
+
+class GroupCommitter:
+    """Queue StorageManager writes and commit them in groups on a background thread.
+
+    Writes may be submitted from any thread. While the committer is open,
+    other threads must hold `lock` to use the manager directly, since the
+    committer writes through it on its own thread.
+    """
+
+    def __init__(self, storage, window: float = 0.01, max_records: int = 1000):
+        if window < 0 or max_records < 1:
+            raise ValueError("window must be >= 0 and max_records >= 1")
+        self.storage = storage
+        self.window = window
+        self.max_records = max_records
+        self.lock = threading.RLock()
+        self._cond = threading.Condition()
+        self._queue: List[Tuple[Op, Future]] = []
+        self._first_queued = 0.0
+        self._submitted = 0
+        self._committed = 0
+        self._flush_now = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="pkms-group-commit", daemon=True)
+        self._thread.start()
+
+    def submit(self, name: str, *args, **kwargs) -> Future:
+        future: Future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("GroupCommitter is closed")
+            if not self._queue:
+                self._first_queued = time.monotonic()
+            self._queue.append(((name, args, kwargs), future))
+            self._submitted += 1
+            # Wake the committer only when it has something new to decide
+            if len(self._queue) in (1, self.max_records):
+                self._cond.notify_all()
+        return future
+
+    def flush(self):
+        """Commit what is queued now and wait until it is on disk."""
+        with self._cond:
+            target = self._submitted
+            self._flush_now = True
+            self._cond.notify_all()
+            while self._committed < target:
+                self._cond.wait()
+
+    def close(self):
+        """Commit what is queued and stop the background thread."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                deadline = self._first_queued + self.window
+                while len(self._queue) < self.max_records and not (self._flush_now or self._closed):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                group, self._queue = self._queue, []
+                self._flush_now = False
+            with self.lock:
+                try:
+                    results = commit_group(self.storage, [op for op, _ in group])
+                except BaseException as exc:  # keep waiters from hanging
+                    results = [(False, exc)] * len(group)
+            for (_, future), (ok, value) in zip(group, results):
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+            with self._cond:
+                self._committed += len(group)
+                self._cond.notify_all()
+
+    # Write methods, as on StorageManager but returning futures
+    def add_note(self, note) -> Future:
+        return self.submit("add_note", note)
+
+    def update_note(self, note_id: str, **changes) -> Future:
+        return self.submit("update_note", note_id, **changes)
+
+    def delete_note(self, note_id: str) -> Future:
+        return self.submit("delete_note", note_id)
+
+    def add_task(self, task) -> Future:
+        return self.submit("add_task", task)
+
+    def update_task(self, task_id: str, **changes) -> Future:
+        return self.submit("update_task", task_id, **changes)
+
+    def delete_task(self, task_id: str) -> Future:
+        return self.submit("delete_task", task_id)
+
+    def mark_complete(self, task_id: str) -> Future:
+        return self.submit("mark_complete", task_id)
@@ -0,0 +1,234 @@
+"""Incremental, content-addressed backups.
+
+A backup directory holds a chain of delta files and `manifest.json`. The
+first delta of a chain is a full copy; every later one holds only the
+records put or deleted since the previous backup, so a nightly backup costs
+O(churn) in bytes written.
+
+Deltas are gzipped JSON lines (`{"op": "put", "kind", "row"}`,
+`{"op": "del", "kind", "id"}` or `{"op": "order", "kind", "ids"}`), named `<seq>-<sha256 prefix>.jsonl.gz` after
+their content; the manifest keeps the full digest of each, and restore
+refuses a chain whose files do not match it.
+
+The manifest also maps every backed-up record id to `[content hash,
+updated_at, position]`, position being the record's index in its kind. Every record is hashed as read from the store (its canonical
+JSON), and only records whose hash differs from the manifest's are written,
+so any change to a record is backed up whether or not its `updated_at`
+moved. A backup run is one streaming read and hash of the store plus work
+proportional to what changed.
+
+Replaying a chain keeps records in place: a put of a known id leaves it
+where it was, a new id goes to the end and a delete drops it. When the
+store's order is not what that replay gives (a save that reordered
+records), the delta ends with an `order` op listing the kind's ids, and
+restore applies it, so a restored store lists records in the same order.
+"""
+from __future__ import annotations
+import hashlib
+import io
+import json
+import os
+import tempfile
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, Optional
+from .backup import Progress, _open, counted
+from .storage import KINDS, StorageError, _MODELS
+
+MANIFEST = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+# Canonical JSON of a row; one encoder for all rows saves its setup per call
+_canonical = json.JSONEncoder(sort_keys=True, ensure_ascii=False, check_circular=False).encode
+
+
+def record_hash(row: Dict[str, Any]) -> str:
+    data = _canonical(row).encode("utf-8")
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+def _file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_manifest(backup_dir: str) -> Dict[str, Any]:
+    path = os.path.join(backup_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {"version": MANIFEST_VERSION, "deltas": [], "records": {k: {} for k in KINDS}}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except ValueError as exc:
+        raise StorageError(f"Failed to read backup manifest {path}: {exc}")
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise StorageError(f"Unsupported backup manifest version in {path}")
+    return manifest
+
+
+def _write_manifest(backup_dir: str, manifest: Dict[str, Any]):
+    tmpfd, tmppath = tempfile.mkstemp(dir=backup_dir)
+    try:
+        with os.fdopen(tmpfd, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmppath, os.path.join(backup_dir, MANIFEST))
+    finally:
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+
+
+def backup(backend, backup_dir: str, full: bool = False, progress: Progress = None) -> Dict[str, Any]:
+    """Write the changes since the last backup in `backup_dir` as a new delta.
+
+    With `full`, or when the directory holds no chain yet, a new chain is
+    started from a full copy and the old delta files are removed once the
+    new manifest is in place. Returns the delta file name (None if nothing
+    changed) and the number of puts and deletes written.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    manifest = load_manifest(backup_dir)
+    rebase = full or not manifest["deltas"]
+    old_records = {k: {} for k in KINDS} if rebase else manifest["records"]
+    records: Dict[str, Dict[str, list]] = {k: {} for k in KINDS}
+    puts = deletes = 0
+    reordered = False
+
+    tmpfd, tmppath = tempfile.mkstemp(dir=backup_dir, suffix=".partial")
+    os.close(tmpfd)
+    try:
+        with _open(tmppath, "w", "gz") as raw:
+            f = io.TextIOWrapper(raw, encoding="utf-8")
+            rows = counted(((kind, row) for kind in KINDS for row in backend.iter_load(kind)), progress)
+            for kind, row in rows:
+                record_id = row.get("id")
+                old = old_records[kind].get(record_id)
+                # The stored row, not `updated_at`, decides: a change that
+                # didn't bump the timestamp is still backed up
+                digest = record_hash(row)
+                records[kind][record_id] = [digest, row.get("updated_at"), len(records[kind])]
+                if old is None or old[0] != digest:
+                    row = _MODELS[kind].from_dict(row).to_dict()
+                    f.write(json.dumps({"op": "put", "kind": kind, "row": row}, ensure_ascii=False) + "\n")
+                    puts += 1
+            for kind in KINDS:
+                for record_id in old_records[kind].keys() - records[kind].keys():
+                    f.write(json.dumps({"op": "del", "kind": kind, "id": record_id}, ensure_ascii=False) + "\n")
+                    deletes += 1
+                # What restore's replay would give; if the store differs, say so
+                old, new = old_records[kind], records[kind]
+                # (manifests without positions list records in store order)
+                expected = [r for r in sorted(old, key=lambda r: old[r][2:]) if r in new]
+                expected.extend(r for r in new if r not in old)
+                if expected != list(new):
+                    f.write(json.dumps({"op": "order", "kind": kind, "ids": list(new)}, ensure_ascii=False) + "\n")
+                    reordered = True
+            f.detach()
+
+        name = None
+        stale = []
+        if puts or deletes or reordered or rebase:
+            digest = _file_digest(tmppath)
+            seq = 1 if rebase else len(manifest["deltas"]) + 1
+            name = f"{seq:06d}-{digest[:16]}.jsonl.gz"
+            os.replace(tmppath, os.path.join(backup_dir, name))
+            if rebase:
+                stale = [d["file"] for d in manifest["deltas"]]
+                manifest["deltas"] = []
+            manifest["deltas"].append({
+                "file": name,
+                "sha256": digest,
+                "puts": puts,
+                "deletes": deletes,
+                "created_at": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+            })
+            manifest["records"] = records
+            _write_manifest(backup_dir, manifest)
+    finally:
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+    for stale_name in stale:
+        path = os.path.join(backup_dir, stale_name)
+        if stale_name != name and os.path.exists(path):
+            os.remove(path)
+    return {"file": name, "puts": puts, "deletes": deletes}
+
+
+def _read_delta(path: str) -> Iterator[Dict[str, Any]]:
+    with _open(path, "r", "gz") as raw:
+        for i, line in enumerate(io.TextIOWrapper(raw, encoding="utf-8")):
+            try:
+                yield json.loads(line)
+            except ValueError as exc:
+                raise StorageError(f"Corrupt backup delta {path} at line {i + 1}: {exc}")
+
+
+def restore(backend, backup_dir: str, upto: Optional[int] = None) -> Dict[str, int]:
+    """Replace the store with the state recorded by the chain in `backup_dir`.
+
+    `upto` replays only the first N deltas (a point-in-time restore). Only a
+    map of id -> delta holding its final version is kept in memory; rows are
+    streamed from the deltas into the backend, in the order the store had
+    them. Returns record counts.
+    """
+    manifest = load_manifest(backup_dir)
+    deltas = manifest["deltas"][:upto] if upto is not None else manifest["deltas"]
+    if not deltas:
+        raise StorageError(f"No backups in {backup_dir}")
+    paths = []
+    for d in deltas:
+        path = os.path.join(backup_dir, d["file"])
+        if not os.path.exists(path) or _file_digest(path) != d["sha256"]:
+            raise StorageError(f"Backup delta {d['file']} is missing or does not match the manifest")
+        paths.append(path)
+
+    # Pass 1: which delta holds the surviving version of each record, in
+    # store order (dicts keep a re-put id in place)
+    final: Dict[str, Dict[str, int]] = {k: {} for k in KINDS}
+    for i, path in enumerate(paths):
+        for e in _read_delta(path):
+            if e.get("op") == "put":
+                final[e["kind"]][e["row"]["id"]] = i
+            elif e.get("op") == "del":
+                final[e["kind"]].pop(e["id"], None)
+            elif e.get("op") == "order":
+                kept = final[e["kind"]]
+                final[e["kind"]] = {r: kept[r] for r in e["ids"] if r in kept}
+
+    # Pass 2, per kind: stream those versions into the backend. Each delta
+    # is read alongside the others and holds its rows in store order, so the
+    # next row wanted from it is usually the next one it yields; rows that
+    # come early (after an `order` op) wait in `early`
+    def rows(kind: str) -> Iterator[Dict[str, Any]]:
+        wanted = final[kind]
+
+        def stream(i: int) -> Iterator[Dict[str, Any]]:
+            for e in _read_delta(paths[i]):
+                if e.get("op") == "put" and e["kind"] == kind and wanted.get(e["row"]["id"]) == i:
+                    yield e["row"]
+
+        streams: Dict[int, Iterator[Dict[str, Any]]] = {}
+        early: Dict[str, Dict[str, Any]] = {}
+        try:
+            for record_id, i in wanted.items():
+                row = early.pop(record_id, None)
+                while row is None:
+                    if i not in streams:
+                        streams[i] = stream(i)
+                    row = next(streams[i])
+                    if row["id"] != record_id:
+                        early[row["id"]] = row
+                        row = None
+                yield row
+        finally:
+            for s in streams.values():
+                s.close()
+
+    counts = {kind: len(final[kind]) for kind in KINDS}
+    for kind in KINDS:
+        backend.save(kind, rows(kind))
+    return counts
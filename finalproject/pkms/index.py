@@ -0,0 +1,543 @@
+"""Persistent indexes for note search.
+
+`SearchIndex` is an inverted index in SQLite (`search_index.db`): per-term
+postings with each note's term counts per field (title, body, tags), and
+the notes' field lengths, so candidates are found and ranked with BM25F by
+reading only the postings of the query's terms. Every note mutation updates
+the rows of that note, so keeping it in sync costs O(note) per write.
+
+Query terms match any indexed term that contains them, which keeps the
+original substring semantics of `search_notes`: candidates are a superset of
+the real hits and only those candidates are verified against note text.
+
+`TagIndex` lives next to the records as `tag_index.json` (a snapshot) plus
+`tag_index.log` (JSON lines appended by every note mutation).
+"""
+from __future__ import annotations
+import json
+import math
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+from array import array
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Any, Tuple
+from .journal import append_lines, read_lines
+from .models import Note
+
+INDEX_VERSION = 3
+_TOKEN_RE = re.compile(r"\w+")
+
+# BM25F parameters; boosts are per field, in FIELDS order
+FIELDS = ("title", "body", "tags")
+FIELD_BOOSTS = (2.0, 1.0, 1.5)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def note_text(note: Note) -> str:
+    # Same haystack search_notes has always matched against
+    return " ".join([note.title, note.body, " ".join(note.tags)])
+
+
+class _LoggedIndex:
+    """Index persisted as a JSON snapshot plus a JSON-lines log of note changes.
+
+    Subclasses hold the in-memory structures and define how a note is turned
+    into a log entry and how entries and snapshots are applied.
+    """
+    name = ""
+    version = 1
+    # Log size (bytes) after which loading folds the log into the snapshot
+    compact_bytes = 1 << 20
+
+    def __init__(self, data_dir: str, lock=None):
+        self.data_dir = data_dir
+        # Serializes log appends and snapshot rewrites with other processes
+        self.lock = lock if lock is not None else nullcontext()
+        self.path = os.path.join(data_dir, f"{self.name}.json")
+        self.log_path = os.path.join(data_dir, f"{self.name}.log")
+        self.loaded = False
+        self._sig = None
+        self._reset()
+
+    def _reset(self):
+        raise NotImplementedError
+
+    def _load_snapshot(self, data: Dict[str, Any]):
+        raise NotImplementedError
+
+    def _snapshot(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def _apply(self, entries: Iterable[Dict[str, Any]]):
+        raise NotImplementedError
+
+    def _entry(self, note: Note) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def _signature(self):
+        sig = []
+        for p in (self.path, self.log_path):
+            try:
+                st = os.stat(p)
+                sig.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                sig.append(None)
+        return tuple(sig)
+
+    def load(self) -> bool:
+        """(Re)load the index if it changed on disk. Returns False if it was never built."""
+        if not self.exists():
+            self.loaded = False
+            return False
+        sig = self._signature()
+        if self.loaded and sig == self._sig:
+            return True
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != self.version:
+            self.loaded = False
+            return False
+        self._reset()
+        self._load_snapshot(data)
+        self._apply(read_lines(self.log_path))
+        self.loaded = True
+        self._sig = sig
+        if sig[1] is not None and sig[1][1] >= self.compact_bytes:
+            with self.lock:
+                # Unless another process appended since we read the log
+                if self._signature() == sig:
+                    self._write_snapshot()
+        return True
+
+    def _write_snapshot(self):
+        data = self._snapshot()
+        data["version"] = self.version
+        tmpfd, tmppath = tempfile.mkstemp(dir=self.data_dir)
+        try:
+            with os.fdopen(tmpfd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmppath, self.path)
+        finally:
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+        # A log left behind by a crash here only replays entries already folded in
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        self.loaded = True
+        self._sig = self._signature()
+
+    # Write path, called by StorageManager
+    def _log(self, entries: List[Dict[str, Any]]):
+        if not entries or not self.exists():
+            # Never built: the first query builds it from the full store
+            return
+        with self.lock:
+            fresh = self.loaded and self._signature() == self._sig
+            append_lines(self.log_path, entries)
+            if fresh:
+                self._apply(entries)
+                self._sig = self._signature()
+
+    def update(self, notes: Iterable[Note]):
+        self._log([self._entry(n) for n in notes])
+
+    def remove(self, note_ids: Iterable[str]):
+        self._log([{"op": "del", "id": i} for i in note_ids])
+
+    def drop(self):
+        """Delete the index files; the next query rebuilds them from the store."""
+        with self.lock:
+            for p in (self.path, self.log_path):
+                if os.path.exists(p):
+                    os.remove(p)
+        self._reset()
+        self.loaded = False
+        self._sig = None
+
+    def rebuild(self, notes: Iterable[Note]):
+        self._reset()
+        self._apply(self._entry(n) for n in notes)
+        with self.lock:
+            self._write_snapshot()
+
+
+# Typecode of the term ids listed in `docs.terms` (32-bit)
+_TERM_ID = "i"
+
+
+def _grams(term: str) -> Set[str]:
+    return {term[i:i + 3] for i in range(len(term) - 2)}
+
+
+def _chunks(items: List[Any], size: int = 500) -> Iterator[List[Any]]:
+    # Keeps `IN (...)` lists under SQLite's limit on query parameters
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _marks(items: List[Any]) -> str:
+    return ",".join("?" * len(items))
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stats (id INTEGER PRIMARY KEY CHECK (id = 0), version INTEGER, docs INTEGER NOT NULL,
+    title_len INTEGER NOT NULL, body_len INTEGER NOT NULL, tags_len INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY, term TEXT NOT NULL UNIQUE, df INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS grams (gram TEXT NOT NULL, term INTEGER NOT NULL, PRIMARY KEY (gram, term)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS docs (id INTEGER PRIMARY KEY, note_id TEXT NOT NULL UNIQUE, title_len INTEGER NOT NULL,
+    body_len INTEGER NOT NULL, tags_len INTEGER NOT NULL, terms BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS postings (term INTEGER NOT NULL, doc INTEGER NOT NULL, title INTEGER NOT NULL,
+    body INTEGER NOT NULL, tags INTEGER NOT NULL, PRIMARY KEY (term, doc)) WITHOUT ROWID;
+INSERT OR IGNORE INTO stats VALUES (0, NULL, 0, 0, 0, 0);
+"""
+
+
+class SearchIndex:
+    """Inverted index of note terms, kept in SQLite (`search_index.db`).
+
+    `postings` holds one row per (term, note) with the term's count in each
+    field; `docs` maps notes to small integer ids and keeps their field
+    lengths; `stats` keeps the totals BM25 needs. A query reads only the
+    postings of its own terms, so its cost follows the number of hits, not
+    the size of the store, and a write touches only the rows of its notes.
+
+    Query terms match any indexed term containing them. Terms are found
+    through `grams` (the 3-letter substrings of every term); a 1- or
+    2-letter query term is matched by scanning the vocabulary instead.
+    """
+    name = "search_index"
+    version = INDEX_VERSION
+
+    def __init__(self, data_dir: str, lock=None):
+        self.data_dir = data_dir
+        # Serializes index writes with the note writes they follow
+        self.lock = lock if lock is not None else nullcontext()
+        self.path = os.path.join(data_dir, f"{self.name}.db")
+        self._conn: Optional[sqlite3.Connection] = None
+        # One connection is shared by the threads of a manager (aio, group commit)
+        self._mutex = threading.RLock()
+
+    def _db(self, create: bool = False) -> Optional[sqlite3.Connection]:
+        if self._conn is None:
+            if not create and not os.path.exists(self.path):
+                return None
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    @contextmanager
+    def _writing(self):
+        with self.lock, self._mutex:
+            db = self._db(create=True)
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def close(self):
+        with self._mutex:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def exists(self) -> bool:
+        """Whether the index was built (and not dropped since)."""
+        with self._mutex:
+            db = self._db()
+            if db is None:
+                return False
+            row = db.execute("SELECT version FROM stats").fetchone()
+            return row is not None and row[0] == self.version
+
+    def load(self) -> bool:
+        """Kept for the StorageManager protocol: nothing is loaded up front. False if never built."""
+        return self.exists()
+
+    @staticmethod
+    def analyze(note: Note) -> Tuple[List[int], Dict[str, List[int]]]:
+        """(token count per field, {term: count per field}) of `note`."""
+        terms: Dict[str, List[int]] = {}
+        lengths = []
+        for i, text in enumerate((note.title, note.body, " ".join(note.tags))):
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            for term, count in Counter(tokens).items():
+                terms.setdefault(term, [0, 0, 0])[i] = count
+        return lengths, terms
+
+    # Write path, called by StorageManager
+    def rebuild(self, notes: Iterable[Note]):
+        with self._writing() as db:
+            for table in ("terms", "grams", "docs", "postings"):
+                db.execute(f"DELETE FROM {table}")
+            # Postings are staged in note order and copied in key order, which
+            # SQLite sorts on disk: far faster than inserting them out of order
+            db.execute("CREATE TEMP TABLE IF NOT EXISTS staged (term, doc, title, body, tags)")
+            db.execute("DELETE FROM staged")
+            vocab: Dict[str, int] = {}
+            df: Counter = Counter()
+            totals = [0, 0, 0]
+            doc = 0
+            for note in notes:
+                lengths, terms = self.analyze(note)
+                doc += 1
+                ids = [vocab.setdefault(t, len(vocab) + 1) for t in terms]
+                df.update(ids)
+                totals = [a + b for a, b in zip(totals, lengths)]
+                db.execute("INSERT INTO docs VALUES (?, ?, ?, ?, ?, ?)",
+                           (doc, note.id, *lengths, array(_TERM_ID, ids).tobytes()))
+                db.executemany("INSERT INTO staged VALUES (?, ?, ?, ?, ?)",
+                               [(i, doc, *counts) for i, counts in zip(ids, terms.values())])
+            db.execute("INSERT INTO postings SELECT * FROM staged ORDER BY term, doc")
+            db.execute("DROP TABLE staged")
+            db.executemany("INSERT INTO terms VALUES (?, ?, ?)", ((i, t, df[i]) for t, i in vocab.items()))
+            db.executemany("INSERT INTO grams VALUES (?, ?)", ((g, i) for t, i in vocab.items() for g in _grams(t)))
+            db.execute("UPDATE stats SET version = ?, docs = ?, title_len = ?, body_len = ?, tags_len = ?",
+                       (self.version, doc, *totals))
+        # Files of the JSON index this one replaced
+        for old in ("search_index.json", "search_index.log"):
+            path = os.path.join(self.data_dir, old)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _term_ids(self, db: sqlite3.Connection, terms: List[str]) -> Dict[str, int]:
+        # Ids of `terms`, adding the ones not indexed yet
+        ids: Dict[str, int] = {}
+        for part in _chunks(terms):
+            ids.update((t, i) for i, t in db.execute(f"SELECT id, term FROM terms WHERE term IN ({_marks(part)})", part))
+        new = [t for t in terms if t not in ids]
+        for t in new:
+            ids[t] = db.execute("INSERT INTO terms (term, df) VALUES (?, 0)", (t,)).lastrowid
+        db.executemany("INSERT INTO grams VALUES (?, ?)", ((g, ids[t]) for t in new for g in _grams(t)))
+        return ids
+
+    def _unlink(self, db: sqlite3.Connection, doc: int, blob: bytes):
+        # Drop the postings of `doc` and the terms no other note uses
+        ids = array(_TERM_ID)
+        ids.frombytes(blob)
+        db.executemany("DELETE FROM postings WHERE term = ? AND doc = ?", ((i, doc) for i in ids))
+        db.executemany("UPDATE terms SET df = df - 1 WHERE id = ?", ((i,) for i in ids))
+        for part in _chunks(list(ids)):
+            unused = db.execute(f"SELECT id, term FROM terms WHERE id IN ({_marks(part)}) AND df <= 0", part).fetchall()
+            db.executemany("DELETE FROM grams WHERE gram = ? AND term = ?", ((g, i) for i, t in unused for g in _grams(t)))
+            db.executemany("DELETE FROM terms WHERE id = ?", ((i,) for i, _ in unused))
+
+    def _change(self, puts: Iterable[Note], deletes: Iterable[str]):
+        if not self.exists():
+            # Never built: the first query builds it from the full store
+            return
+        with self._writing() as db:
+            delta = [0, 0, 0, 0]  # docs, then the three field lengths
+            for note_id in deletes:
+                row = db.execute("SELECT id, title_len, body_len, tags_len, terms FROM docs WHERE note_id = ?",
+                                 (note_id,)).fetchone()
+                if row is not None:
+                    self._unlink(db, row[0], row[4])
+                    db.execute("DELETE FROM docs WHERE id = ?", (row[0],))
+                    delta = [a - b for a, b in zip(delta, (1, *row[1:4]))]
+            for note in puts:
+                lengths, terms = self.analyze(note)
+                row = db.execute("SELECT id, title_len, body_len, tags_len, terms FROM docs WHERE note_id = ?",
+                                 (note.id,)).fetchone()
+                if row is not None:
+                    doc = row[0]
+                    self._unlink(db, doc, row[4])
+                    delta = [a - b for a, b in zip(delta, (0, *row[1:4]))]
+                else:
+                    doc = db.execute("INSERT INTO docs (note_id, title_len, body_len, tags_len, terms) "
+                                     "VALUES (?, 0, 0, 0, x'')", (note.id,)).lastrowid
+                    delta[0] += 1
+                ids = self._term_ids(db, list(terms))
+                db.executemany("INSERT INTO postings VALUES (?, ?, ?, ?, ?)",
+                               ((ids[t], doc, *counts) for t, counts in terms.items()))
+                db.executemany("UPDATE terms SET df = df + 1 WHERE id = ?", ((ids[t],) for t in terms))
+                db.execute("UPDATE docs SET title_len = ?, body_len = ?, tags_len = ?, terms = ? WHERE id = ?",
+                           (*lengths, array(_TERM_ID, (ids[t] for t in terms)).tobytes(), doc))
+                delta = [a + b for a, b in zip(delta, (0, *lengths))]
+            db.execute("UPDATE stats SET docs = docs + ?, title_len = title_len + ?, body_len = body_len + ?, "
+                       "tags_len = tags_len + ?", delta)
+
+    def update(self, notes: Iterable[Note]):
+        self._change(list(notes), [])
+
+    def remove(self, note_ids: Iterable[str]):
+        self._change([], list(note_ids))
+
+    def drop(self):
+        """Empty the index; the next query rebuilds it from the store."""
+        with self._writing() as db:
+            for table in ("terms", "grams", "docs", "postings"):
+                db.execute(f"DELETE FROM {table}")
+            db.execute("UPDATE stats SET version = NULL, docs = 0, title_len = 0, body_len = 0, tags_len = 0")
+
+    # Query path
+    def _expand(self, db: sqlite3.Connection, token: str) -> Dict[int, int]:
+        # {term id: document frequency} of the indexed terms containing `token`
+        grams = sorted(_grams(token))
+        if not grams:
+            rows = db.execute("SELECT id, term, df FROM terms WHERE instr(term, ?) > 0", (token,))
+        else:
+            rows = db.execute(
+                "SELECT id, term, df FROM terms WHERE id IN ("
+                + " INTERSECT ".join("SELECT term FROM grams WHERE gram = ?" for _ in grams) + ")", grams)
+        return {i: df for i, term, df in rows if token in term}
+
+    def _query_terms(self, db: sqlite3.Connection, query: str) -> int:
+        # Fill the temp table `query_terms` with (token number, term id, idf)
+        # for the indexed terms each query token expands to; returns the
+        # number of tokens
+        n_docs = db.execute("SELECT docs FROM stats").fetchone()[0] or 1
+        db.execute("CREATE TEMP TABLE IF NOT EXISTS query_terms (token INTEGER, term INTEGER, idf REAL)")
+        db.execute("DELETE FROM query_terms")
+        tokens = list(dict.fromkeys(tokenize(query)))
+        for i, token in enumerate(tokens):
+            db.executemany("INSERT INTO query_terms VALUES (?, ?, ?)",
+                           ((i, term, math.log(1 + (n_docs - df + 0.5) / (df + 0.5)))
+                            for term, df in self._expand(db, token).items()))
+        return len(tokens)
+
+    def candidates(self, query: str, match: str = "all") -> Optional[Set[str]]:
+        """Ids of notes that may match `query`, or None if the index cannot tell.
+
+        `match` is "all" (every query term, also used for phrases) or "any".
+        """
+        with self._mutex:
+            db = self._db(create=True)
+            tokens = self._query_terms(db, query)
+            if not tokens:
+                return None
+            docs = "SELECT p.doc FROM query_terms q JOIN postings p ON p.term = q.term"
+            if match == "any":
+                rows = db.execute(f"SELECT note_id FROM docs WHERE id IN ({docs})")
+            else:
+                every = " INTERSECT ".join(f"{docs} WHERE q.token = {i}" for i in range(tokens))
+                rows = db.execute(f"SELECT note_id FROM docs WHERE id IN ({every})")
+            return {note_id for note_id, in rows}
+
+    def scores(self, query: str, note_ids: Iterable[str]) -> Dict[str, float]:
+        """BM25F score of each of `note_ids` for the words of `query`.
+
+        A query word contributes through every indexed term containing it, so
+        "road" scores notes mentioning "roadmap" as well.
+        """
+        result = dict.fromkeys(note_ids, 0.0)
+        with self._mutex:
+            db = self._db(create=True)
+            n_docs, *totals = db.execute("SELECT docs, title_len, body_len, tags_len FROM stats").fetchone()
+            avg_len = [(t / (n_docs or 1)) or 1.0 for t in totals]
+            if not self._query_terms(db, query):
+                return result
+            # tf is the boosted, length-normalized count summed over the fields
+            tf = " + ".join(f"{boost!r} * p.{field} / ({1 - BM25_B!r} + {BM25_B!r} * d.{field}_len / ?)"
+                            for field, boost in zip(FIELDS, FIELD_BOOSTS))
+            rows = db.execute(
+                f"SELECT note_id, SUM(idf * tf / ({BM25_K1!r} + tf)) FROM ("
+                f"SELECT d.note_id, q.idf, {tf} AS tf FROM query_terms q "
+                f"JOIN postings p ON p.term = q.term JOIN docs d ON d.id = p.doc) GROUP BY note_id", avg_len)
+            for note_id, score in rows:
+                if note_id in result:
+                    result[note_id] = score
+        return result
+
+
+def _bits(bitmap: int) -> List[int]:
+    # Positions of set bits, lowest first; one pass over the binary string
+    digits = bin(bitmap)[:1:-1]
+    out = []
+    i = digits.find("1")
+    while i != -1:
+        out.append(i)
+        i = digits.find("1", i + 1)
+    return out
+
+
+class TagIndex(_LoggedIndex):
+    """Tag -> bitmap of note ordinals.
+
+    Ordinals are assigned in insertion order and freed ordinals are only
+    reclaimed when the snapshot is rewritten, so bit order is store order.
+    Bitmaps are Python ints, which makes AND/OR of tags single operations.
+    """
+    name = "tag_index"
+
+    def _reset(self):
+        self.ids: List[Optional[str]] = []
+        self.ordinals: Dict[str, int] = {}
+        self.tags: Dict[str, int] = {}
+
+    def _load_snapshot(self, data: Dict[str, Any]):
+        self.ids = data.get("ids", [])
+        self.ordinals = {note_id: i for i, note_id in enumerate(self.ids) if note_id is not None}
+        self.tags = {tag: int(bitmap, 16) for tag, bitmap in data.get("tags", {}).items()}
+
+    def _snapshot(self) -> Dict[str, Any]:
+        # Renumber to drop the ordinals of deleted notes
+        live = [note_id for note_id in self.ids if note_id is not None]
+        remap = {self.ordinals[note_id]: i for i, note_id in enumerate(live)}
+        tags = {}
+        for tag, bitmap in self.tags.items():
+            digits = bytearray(b"0" * len(live))
+            for pos in _bits(bitmap):
+                digits[remap[pos]] = ord("1")
+            tags[tag] = int(digits[::-1].decode() or "0", 2)
+        self.ids, self.tags = live, tags
+        self.ordinals = {note_id: i for i, note_id in enumerate(live)}
+        return {"ids": self.ids, "tags": {tag: format(b, "x") for tag, b in self.tags.items()}}
+
+    def _entry(self, note: Note) -> Dict[str, Any]:
+        return {"op": "put", "id": note.id, "tags": list(note.tags)}
+
+    def _clear(self, ordinal: int):
+        mask = ~(1 << ordinal)
+        for tag in [t for t, b in self.tags.items() if b >> ordinal & 1]:
+            self.tags[tag] &= mask
+            if not self.tags[tag]:
+                del self.tags[tag]
+
+    def _apply(self, entries: Iterable[Dict[str, Any]]):
+        for e in entries:
+            note_id = e["id"]
+            ordinal = self.ordinals.get(note_id)
+            if e.get("op") == "del":
+                if ordinal is not None:
+                    self._clear(ordinal)
+                    self.ids[ordinal] = None
+                    del self.ordinals[note_id]
+                continue
+            if ordinal is None:
+                ordinal = self.ordinals[note_id] = len(self.ids)
+                self.ids.append(note_id)
+            else:
+                self._clear(ordinal)
+            bit = 1 << ordinal
+            for tag in e.get("tags", []):
+                self.tags[tag] = self.tags.get(tag, 0) | bit
+
+    def lookup(self, tags: Iterable[str], match: str = "all") -> List[str]:
+        """Ids of notes carrying all (or, with match="any", some) of `tags`, in store order."""
+        bitmap = None
+        for tag in tags:
+            b = self.tags.get(tag, 0)
+            if bitmap is None:
+                bitmap = b
+            else:
+                bitmap = bitmap | b if match == "any" else bitmap & b
+        return [self.ids[i] for i in _bits(bitmap or 0)]
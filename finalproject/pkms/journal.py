@@ -0,0 +1,424 @@
+"""Append-only journal storage backend.
+
+Each mutation is appended as one JSON line to `notes.log`/`tasks.log` and
+fsynced, so a write costs O(record) and a crash loses at most the line being
+written. Reads replay `<kind>.snapshot.json` plus the journal. Once a journal
+passes `compact_bytes` it is folded back into the snapshot in a background
+thread.
+
+Files per kind, and the order they are replayed in:
+- `<kind>.snapshot.json`: JSON array, same layout as the plain JSON backend
+- `<kind>.log.1`: journal frozen by a running compaction
+- `<kind>.log`: active journal
+"""
+from __future__ import annotations
+import itertools
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from .locking import FileLock
+from .offsets import JSONStream, OffsetIndex, write_index, write_records
+from .storage import JSONBackend, StorageError, KINDS, _stat_signature
+
+
+def read_lines(path: str, needle: Optional[bytes] = None, offset: int = 0) -> List[Dict[str, Any]]:
+    """Parse a JSON-lines file, ignoring a torn (unterminated) final line.
+
+    With `needle`, lines not containing those bytes are skipped unparsed.
+    `offset` skips that many bytes, which must end on a line boundary.
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    lines = data.split(b"\n")
+    # Everything after the last newline is either empty or a torn write
+    lines.pop()
+    entries = []
+    for i, line in enumerate(lines):
+        if not line.strip() or (needle is not None and needle not in line):
+            continue
+        try:
+            entries.append(json.loads(line))
+        except ValueError as exc:
+            raise StorageError(f"Corrupt journal entry in {path} at line {i + 1}: {exc}")
+    return entries
+
+
+def append_lines(path: str, entries: Iterable[Dict[str, Any]]) -> int:
+    """Append entries as JSON lines and fsync. Returns the new file size."""
+    payload = b"".join(json.dumps(e, ensure_ascii=False).encode("utf-8") + b"\n" for e in entries)
+    with open(path, "ab+") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size:
+            # Drop a torn tail left by a crash so it cannot swallow the next entry
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.seek(0)
+                keep = f.read().rfind(b"\n") + 1
+                f.truncate(keep)
+                size = keep
+        f.seek(0, os.SEEK_END)
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    return size + len(payload)
+
+
+def _fsync_write(path: str, rows: List[Dict[str, Any]], index_path: str):
+    with open(path, "wb") as f:
+        entries = write_records(f, rows)
+        f.flush()
+        os.fsync(f.fileno())
+    # Written before the rename into place; see pkms.offsets
+    write_index(index_path, path, entries)
+
+
+# Lock-free read attempts before a reader waits for the kind lock
+_READ_RETRIES = 3
+
+
+def _entry_id(entry: Dict[str, Any]) -> Optional[str]:
+    return entry["row"].get("id") if entry.get("op") == "put" else entry.get("id")
+
+
+def _remove(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+class JournalBackend(JSONBackend):
+    name = "journal"
+    # Journal size (bytes) after which a background compaction is started
+    compact_bytes = 1 << 20
+
+    def __init__(self, data_dir: str):
+        super().__init__(data_dir)
+        self.paths = {kind: os.path.join(data_dir, f"{kind}.snapshot.json") for kind in KINDS}
+        self.logs = {kind: os.path.join(data_dir, f"{kind}.log") for kind in KINDS}
+        # Guards this process's view of the files; `self.locks` (held first)
+        # serializes writers across processes
+        self._lock = threading.RLock()
+        self._compactions: Dict[str, threading.Thread] = {}
+        # Held for a whole fold, so two processes never compact one kind at once
+        self._compact_locks = {kind: FileLock(os.path.join(data_dir, f"{kind}.compact.lock")) for kind in KINDS}
+
+    def exists(self) -> bool:
+        logs = [p + suffix for p in self.logs.values() for suffix in ("", ".1")]
+        return any(os.path.exists(p) for p in list(self.paths.values()) + logs)
+
+    def signature(self, kind: str) -> tuple:
+        log = self.logs[kind]
+        return _stat_signature([self.paths[kind], log + ".1", log])
+
+    def _recover(self, kind: str):
+        # Finish or roll back a snapshot replacement interrupted by a crash.
+        # Only the holder of the kind lock may: without it, a `.new` may be
+        # another process's save in progress rather than one that died
+        if not self.locks[kind].held:
+            raise RuntimeError("_recover() needs the kind lock")
+        snap = self.paths[kind]
+        log = self.logs[kind]
+        new, reset = snap + ".new", snap + ".reset"
+        if os.path.exists(reset):
+            # A save() committed to its new snapshot: drop the journals, then install it
+            _remove(log + ".1")
+            _remove(log)
+            if os.path.exists(new):
+                os.replace(new, snap)
+            _remove(reset)
+        elif os.path.exists(new):
+            # A save died before committing; the old files are intact
+            _remove(new)
+        if os.path.exists(snap + ".compact") and self._compact_locks[kind].acquire(blocking=False):
+            # Left by a compaction that died (this thread may be the one
+            # starting the next compaction, which is fine too)
+            try:
+                _remove(snap + ".compact")
+            finally:
+                self._compact_locks[kind].release()
+
+    def _settle(self, kind: str):
+        # Readers finish crash recovery only when no writer holds the lock;
+        # otherwise they leave the files alone and read around them (`_view`)
+        lock = self.locks[kind]
+        if lock.acquire(blocking=False):
+            try:
+                self._recover(kind)
+            finally:
+                lock.release()
+
+    def _view(self, kind: str) -> Tuple[str, List[str]]:
+        """(snapshot, journals) holding the committed state, changing no file."""
+        snap = self.paths[kind]
+        if os.path.exists(snap + ".reset"):
+            # A save committed but its snapshot is not installed yet; the journals are void
+            new = snap + ".new"
+            return (new if os.path.exists(new) else snap), []
+        # A `.new` without `.reset` is a save in progress, or one that died: ignore it
+        log = self.logs[kind]
+        return snap, [log + ".1", log]
+
+    def _state(self, kind: str) -> tuple:
+        snap = self.paths[kind]
+        return self.signature(kind) + _stat_signature([snap + ".new", snap + ".reset"])
+
+    def _read(self, kind: str, read: Callable[[str, List[str]], Any],
+              discard: Optional[Callable[[Any], None]] = None) -> Any:
+        """`read(snapshot, journals)` on a committed state.
+
+        Lock-free: a read that saw the files change under it is retried (its
+        result passed to `discard`), and after a few tries it takes the kind lock.
+        """
+        for _ in range(_READ_RETRIES):
+            self._settle(kind)
+            before = self._state(kind)
+            try:
+                result = read(*self._view(kind))
+            except (OSError, StorageError):
+                if self._state(kind) == before:
+                    raise
+                continue
+            if self._state(kind) == before:
+                return result
+            if discard is not None:
+                discard(result)
+        with self.locks[kind]:
+            self._recover(kind)
+            return read(*self._view(kind))
+
+    @staticmethod
+    def _replay(rows: Dict[str, Dict[str, Any]], entries: List[Dict[str, Any]]):
+        for e in entries:
+            if e.get("op") == "put":
+                rows[e["row"]["id"]] = e["row"]
+            elif e.get("op") == "del":
+                rows.pop(e["id"], None)
+
+    def _load_from(self, kind: str, frozen_only: bool = False) -> List[Dict[str, Any]]:
+        log = self.logs[kind]
+        return self._load_view(self.paths[kind], [log + ".1"] if frozen_only else [log + ".1", log])
+
+    def _load_view(self, snap: str, journals: List[str]) -> List[Dict[str, Any]]:
+        rows = {r.get("id"): r for r in self._read_file(snap)}
+        for path in journals:
+            self._replay(rows, read_lines(path))
+        return list(rows.values())
+
+    def load(self, kind: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return self._read(kind, self._load_view)
+
+    def iter_load(self, kind: str) -> Iterator[Dict[str, Any]]:
+        """Stream the snapshot with the journals applied, in the order `load` returns.
+
+        Only the journals (kept small by compaction) and the set of snapshot
+        ids are held in memory.
+        """
+        def opened(snap: str, journals: List[str]):
+            # Open the snapshot and read the journals together: a compaction
+            # may replace the file later, but these handles keep the old one
+            try:
+                ids_f = open(snap, "r", encoding="utf-8")
+                rows_f = open(snap, "r", encoding="utf-8")
+            except FileNotFoundError:
+                ids_f = rows_f = None
+            try:
+                entries = [e for path in journals for e in read_lines(path)]
+            except BaseException:
+                for f in (ids_f, rows_f):
+                    if f is not None:
+                        f.close()
+                raise
+            return snap, ids_f, rows_f, entries
+
+        def closed(result):
+            for f in result[1:3]:
+                if f is not None:
+                    f.close()
+
+        with self._lock:
+            snap, ids_f, rows_f, entries = self._read(kind, opened, closed)
+        try:
+            # Replay over the snapshot without loading it: updates of snapshot
+            # records are patched in place, other puts go to the tail
+            stored = {r.get("id") for r in JSONStream(ids_f).array()} if ids_f and entries else set()
+            patched: Dict[str, Dict[str, Any]] = {}
+            removed = set()
+            tail: Dict[str, Dict[str, Any]] = {}
+            for e in entries:
+                record_id = _entry_id(e)
+                if e.get("op") == "put":
+                    if record_id in tail or record_id not in stored or record_id in removed:
+                        tail[record_id] = e["row"]
+                    else:
+                        patched[record_id] = e["row"]
+                elif e.get("op") == "del":
+                    if tail.pop(record_id, None) is None and record_id in stored:
+                        removed.add(record_id)
+                        patched.pop(record_id, None)
+            if rows_f is not None:
+                for row in JSONStream(rows_f).array():
+                    record_id = row.get("id")
+                    if record_id not in removed:
+                        yield patched.get(record_id, row)
+            yield from tail.values()
+        except ValueError as exc:
+            raise StorageError(f"Failed to read JSON from {snap}: {exc}")
+        finally:
+            for f in (ids_f, rows_f):
+                if f is not None:
+                    f.close()
+
+    def save(self, kind: str, rows: Iterable[Dict[str, Any]]):
+        if not self.locks[kind].held:
+            # The compaction thread needs the kind lock to finish
+            self._join(kind)
+        snap = self.paths[kind]
+        with self.locks[kind].writing(), self._lock:
+            self._recover(kind)
+            _fsync_write(snap + ".new", rows, snap + ".idx")
+            with open(snap + ".reset", "w"):
+                pass
+            self._recover(kind)
+
+    def get(self, kind: str, record_id: str) -> Optional[Dict[str, Any]]:
+        rows = self.get_many(kind, [record_id])
+        return rows[0] if rows else None
+
+    def get_many(self, kind: str, record_ids) -> List[Dict[str, Any]]:
+        """Read records through the snapshot's offset index, then apply the journals.
+
+        Journals stay small (see `compact_bytes`), so scanning them is cheap;
+        for a single id, lines not mentioning it are not even parsed.
+        """
+        wanted = set(record_ids)
+        needle = None
+        if len(wanted) == 1:
+            encoded = json.dumps(next(iter(wanted)), ensure_ascii=False)
+            needle = encoded.encode("utf-8")
+        def read(snap: str, journals: List[str]) -> List[Dict[str, Any]]:
+            index = OffsetIndex.open(snap, self.paths[kind] + ".idx")
+            found = index.read_many(wanted) if index is not None else []
+            if found is None or (index is None and os.path.exists(snap)):
+                return [r for r in self._load_view(snap, journals) if r.get("id") in wanted]
+            rows = {r["id"]: r for r in found}
+            for path in journals:
+                entries = read_lines(path, needle)
+                self._replay(rows, [e for e in entries if _entry_id(e) in wanted])
+            return list(rows.values())
+
+        with self._lock:
+            return self._read(kind, read)
+
+    def _append(self, kind: str, entries: List[Dict[str, Any]]):
+        # Callers hold the kind lock
+        with self._lock:
+            self._recover(kind)
+            size = append_lines(self.logs[kind], entries)
+        if size >= self.compact_bytes:
+            self._start_compaction(kind)
+
+    def extend(self, kind: str, rows: Iterable[Dict[str, Any]]) -> int:
+        """Journal records with ids not yet stored, a chunk at a time. Returns how many."""
+        written = 0
+        rows = iter(rows)
+        for chunk in iter(lambda: list(itertools.islice(rows, 1000)), []):
+            with self.locks[kind].writing():
+                self._append(kind, [{"op": "put", "row": row} for row in chunk])
+            written += len(chunk)
+        return written
+
+    def apply(self, kind: str, puts: List[Dict[str, Any]], deletes: List[str]) -> set:
+        # Tombstones only for records that exist, so the journal never grows on no-ops
+        with self.locks[kind]:
+            gone = {r["id"] for r in self.get_many(kind, deletes)} if deletes else set()
+            entries = [{"op": "put", "row": row} for row in puts]
+            entries += [{"op": "del", "id": i} for i in deletes if i in gone]
+            if entries:
+                with self.locks[kind].writing():
+                    self._append(kind, entries)
+        return gone
+
+    # Compaction
+    def _compacting(self, kind: str) -> bool:
+        t = self._compactions.get(kind)
+        return t is not None and t.is_alive() and t is not threading.current_thread()
+
+    def _start_compaction(self, kind: str):
+        with self._lock:
+            if self._compacting(kind):
+                return
+            # Not a daemon thread: the interpreter waits for it before exiting
+            t = threading.Thread(target=self.compact, args=(kind,), name=f"pkms-compact-{kind}")
+            self._compactions[kind] = t
+            t.start()
+
+    def _join(self, kind: str):
+        if self._compacting(kind):
+            self._compactions[kind].join()
+
+    def compact(self, kind: str):
+        """Fold the journal of `kind` into its snapshot.
+
+        The active journal is frozen as `<kind>.log.1` first, so writers keep
+        appending to a fresh `<kind>.log` while the snapshot is rebuilt.
+        Replaying a frozen journal on top of the snapshot it was folded into
+        is harmless, so a crash at any point leaves a readable store.
+        """
+        log = self.logs[kind]
+        snap = self.paths[kind]
+        tmp = snap + ".compact"
+        if not self._compact_locks[kind].acquire(blocking=False):
+            return  # another process is compacting this kind
+        try:
+            with self.locks[kind], self._lock:
+                self._recover(kind)
+                if not os.path.exists(log + ".1"):
+                    if not os.path.exists(log) or not os.path.getsize(log):
+                        return
+                    os.replace(log, log + ".1")
+                # A save() in any process replaces the snapshot, making this fold stale
+                base = _stat_signature([snap])
+            # The index goes next to the new snapshot until it replaces the old
+            # one: a fold that is thrown away must not clobber the current index
+            try:
+                _fsync_write(tmp, self._load_from(kind, frozen_only=True), tmp + ".idx")
+            except (OSError, StorageError):
+                with self.locks[kind], self._lock:
+                    if _stat_signature([snap]) != base:
+                        # A concurrent save() replaced the files we were reading
+                        _remove(tmp)
+                        _remove(tmp + ".idx")
+                        return
+                raise
+            with self.locks[kind], self._lock:
+                if _stat_signature([snap]) != base:
+                    _remove(tmp)
+                    _remove(tmp + ".idx")
+                    return
+                os.replace(tmp, snap)
+                os.replace(tmp + ".idx", snap + ".idx")
+                _remove(log + ".1")
+        finally:
+            self._compact_locks[kind].release()
+
+    def journal_size(self, kind: str) -> int:
+        log = self.logs[kind]
+        return sum(os.path.getsize(p) for p in (log, log + ".1") if os.path.exists(p))
+
+    def retire(self):
+        for kind in KINDS:
+            self._join(kind)
+        for path in list(self.paths.values()) + list(self.logs.values()):
+            for p in (path, path + ".1"):
+                if os.path.exists(p):
+                    os.replace(p, p + ".migrated")
+        for path in self.paths.values():
+            _remove(path + ".idx")
+
+    def close(self):
+        for kind in KINDS:
+            self._join(kind)
@@ -0,0 +1,141 @@
+"""Cross-process advisory locks and write generations.
+
+Every record kind has a lock file `<kind>.lock` in the data directory. Writers
+hold an exclusive lock on it for their whole read-modify-write cycle, and the
+file stores a generation number that each committed write increments. A
+reader that wants to write back what it read compares generations first (see
+`StorageManager._update`), so a stale writer retries instead of clobbering a
+concurrent change.
+
+Locks use `fcntl.flock` where available and `msvcrt.locking` on Windows;
+elsewhere they only serialize threads of this process. They are reentrant
+per thread, so backend methods can nest them freely.
+"""
+from __future__ import annotations
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+# Bytes reserved for the generation number at the start of the lock file
+_GEN_WIDTH = 20
+
+
+def _os_lock(fd: int, blocking: bool) -> bool:
+    if fcntl is not None:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            return False
+        return True
+    if msvcrt is not None:
+        # Lock a byte past the generation, which must stay readable
+        os.lseek(fd, _GEN_WIDTH, os.SEEK_SET)
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+                time.sleep(0.01)
+    return True
+
+
+def _os_unlock(fd: int):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    elif msvcrt is not None:
+        os.lseek(fd, _GEN_WIDTH, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+class FileLock:
+    """Exclusive lock on `path`, reentrant within a thread."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._owner: Optional[int] = None
+        self._fd: Optional[int] = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if not self._thread_lock.acquire(blocking):
+            return False
+        if self._depth == 0:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                locked = _os_lock(fd, blocking)
+            except BaseException:
+                os.close(fd)
+                self._thread_lock.release()
+                raise
+            if not locked:
+                os.close(fd)
+                self._thread_lock.release()
+                return False
+            self._fd = fd
+            self._owner = threading.get_ident()
+        self._depth += 1
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            fd, self._fd, self._owner = self._fd, None, None
+            try:
+                _os_unlock(fd)
+            finally:
+                os.close(fd)
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    @property
+    def held(self) -> bool:
+        """True if the calling thread holds the lock."""
+        return self._owner == threading.get_ident()
+
+    def generation(self) -> int:
+        """Number of writes committed under this lock so far."""
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read(_GEN_WIDTH)
+        except FileNotFoundError:
+            return 0
+        # Written in place with a single small write, so never half-updated
+        return int(data.strip() or b"0")
+
+    def bump(self):
+        if not self.held:
+            raise RuntimeError("bump() needs the lock")
+        value = str(self.generation() + 1).encode("ascii").ljust(_GEN_WIDTH)
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        os.write(self._fd, value)
+
+    @contextmanager
+    def writing(self):
+        """Hold the lock for a write; the generation moves on if it succeeds."""
+        with self:
+            yield
+            self.bump()
+
+
+def kind_locks(data_dir: str, kinds: Iterable[str]) -> Dict[str, FileLock]:
+    return {kind: FileLock(os.path.join(data_dir, f"{kind}.lock")) for kind in kinds}
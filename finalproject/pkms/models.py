@@ -1,7 +1,8 @@
 from __future__ import annotations
-from dataclasses import dataclass, field, asdict
+from dataclasses import dataclass, field
 from typing import List, Optional
 from datetime import datetime, timezone
+import sys
 import uuid
 
 
@@ -10,7 +11,33 @@ def _now_iso() -> str:
     return datetime.now(timezone.utc).astimezone(timezone.utc).isoformat().replace('+00:00', 'Z')
 
 
-@dataclass
+# Loaded records share one copy of repeated strings: tags, source and status
+# values are interned (so equal to the literals below by identity), and
+# updated_at reuses created_at when a record was never edited.
+SOURCE_MANUAL = "manual"
+STATUS_TODO = "todo"
+STATUS_DONE = "done"
+
+
+_intern = sys.intern
+# Marks a missing key, so defaults are only computed when needed
+_MISSING = object()
+
+
+def _shared(value):
+    return _intern(value) if type(value) is str else value
+
+
+def _shared_tags(tags) -> List[str]:
+    if not tags:
+        return []
+    try:
+        return list(map(_intern, tags))
+    except TypeError:  # a non-string tag
+        return [_intern(t) if type(t) is str else t for t in tags]
+
+
+@dataclass(slots=True)
 class Note:
     id: str
     title: str
@@ -22,33 +49,118 @@ class Note:
 
     @staticmethod
     def create(title: str, body: str, tags: Optional[List[str]] = None, source: str = "manual") -> "Note":
+        now = _now_iso()
         return Note(
             id=str(uuid.uuid4()),
             title=title,
             body=body,
             tags=tags or [],
-            created_at=_now_iso(),
-            updated_at=_now_iso(),
+            created_at=now,
+            updated_at=now,
             source=source,
         )
 
+    # to_dict/from_dict are written out field by field: they run once per
+    # record on every load and save (dataclasses.asdict recurses and deep-copies)
     def to_dict(self) -> dict:
-        return asdict(self)
+        return {
+            "id": self.id,
+            "title": self.title,
+            "body": self.body,
+            "tags": list(self.tags),
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "source": self.source,
+        }
 
     @staticmethod
     def from_dict(d: dict) -> "Note":
+        get = d.get
+        created_at = get("created_at", _MISSING)
+        if created_at is _MISSING:
+            created_at = _now_iso()
+        updated_at = get("updated_at", _MISSING)
+        if updated_at is _MISSING:
+            updated_at = _now_iso()
+        elif updated_at == created_at:
+            updated_at = created_at
         return Note(
-            id=d.get("id"),
-            title=d.get("title", ""),
-            body=d.get("body", ""),
-            tags=d.get("tags", []),
-            created_at=d.get("created_at", _now_iso()),
-            updated_at=d.get("updated_at", _now_iso()),
-            source=d.get("source", "manual"),
+            get("id"),
+            get("title", ""),
+            get("body", ""),
+            _shared_tags(get("tags", ())),
+            created_at,
+            updated_at,
+            _shared(get("source", SOURCE_MANUAL)),
         )
 
 
-@dataclass
+# The slot holding Note.body; LazyNote fills it on first access
+_NOTE_BODY = Note.body
+
+
+class LazyNote(Note):
+    """A Note whose body is read from the store the first time it is used.
+
+    Built by backends that keep bodies apart from the other fields (see
+    pkms.split_backend). Equal to a Note with the same fields; pickles and
+    copies as a plain Note.
+    """
+
+    __slots__ = ("_load_body",)
+
+    @classmethod
+    def lazy(cls, load_body, id: str, title: str, tags: List[str], created_at: str,
+             updated_at: str, source: str) -> "LazyNote":
+        note = cls.__new__(cls)
+        note._load_body = load_body
+        note.id = id
+        note.title = title
+        note.tags = tags
+        note.created_at = created_at
+        note.updated_at = updated_at
+        note.source = source
+        return note
+
+    @property
+    def body(self) -> str:
+        try:
+            return _NOTE_BODY.__get__(self)
+        except AttributeError:
+            value = self._load_body()
+            _NOTE_BODY.__set__(self, value)
+            return value
+
+    @body.setter
+    def body(self, value: str):
+        _NOTE_BODY.__set__(self, value)
+
+    def copy(self) -> "LazyNote":
+        """Shallow copy that leaves an unread body unread."""
+        note = LazyNote.lazy(self._load_body, self.id, self.title, self.tags, self.created_at,
+                             self.updated_at, self.source)
+        if self.body_loaded:
+            note.body = self.body
+        return note
+
+    @property
+    def body_loaded(self) -> bool:
+        try:
+            _NOTE_BODY.__get__(self)
+        except AttributeError:
+            return False
+        return True
+
+    def __eq__(self, other):
+        if not isinstance(other, Note):
+            return NotImplemented
+        return Note.to_dict(self) == Note.to_dict(other)
+
+    def __reduce__(self):
+        return Note, (self.id, self.title, self.body, list(self.tags), self.created_at, self.updated_at, self.source)
+
+
+@dataclass(slots=True)
 class Task:
     id: str
     title: str
@@ -61,35 +173,54 @@ class Task:
 
     @staticmethod
     def create(title: str, description: str = "", due_date: Optional[str] = None, source: str = "manual") -> "Task":
+        now = _now_iso()
         return Task(
             id=str(uuid.uuid4()),
             title=title,
             description=description,
             due_date=due_date,
             status="todo",
-            created_at=_now_iso(),
-            updated_at=_now_iso(),
+            created_at=now,
+            updated_at=now,
             source=source,
         )
 
     def to_dict(self) -> dict:
-        return asdict(self)
+        return {
+            "id": self.id,
+            "title": self.title,
+            "description": self.description,
+            "due_date": self.due_date,
+            "status": self.status,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "source": self.source,
+        }
 
     @staticmethod
     def from_dict(d: dict) -> "Task":
+        get = d.get
+        created_at = get("created_at", _MISSING)
+        if created_at is _MISSING:
+            created_at = _now_iso()
+        updated_at = get("updated_at", _MISSING)
+        if updated_at is _MISSING:
+            updated_at = _now_iso()
+        elif updated_at == created_at:
+            updated_at = created_at
         return Task(
-            id=d.get("id"),
-            title=d.get("title", ""),
-            description=d.get("description", ""),
-            due_date=d.get("due_date"),
-            status=d.get("status", "todo"),
-            created_at=d.get("created_at", _now_iso()),
-            updated_at=d.get("updated_at", _now_iso()),
-            source=d.get("source", "manual"),
+            get("id"),
+            get("title", ""),
+            get("description", ""),
+            _shared(get("due_date")),
+            _shared(get("status", STATUS_TODO)),
+            created_at,
+            updated_at,
+            _shared(get("source", SOURCE_MANUAL)),
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class AgentResult:
     id: str
     note_id: Optional[str]
@@ -99,4 +230,26 @@ class AgentResult:
     created_at: str = field(default_factory=_now_iso)
 
     def to_dict(self) -> dict:
-        return asdict(self)
+        return {
+            "id": self.id,
+            "note_id": self.note_id,
+            "summary": self.summary,
+            "suggestions": [dict(s) for s in self.suggestions],
+            "confidence": self.confidence,
+            "created_at": self.created_at,
+        }
+
+    @staticmethod
+    def from_dict(d: dict) -> "AgentResult":
+        get = d.get
+        created_at = get("created_at", _MISSING)
+        if created_at is _MISSING:
+            created_at = _now_iso()
+        return AgentResult(
+            get("id"),
+            get("note_id"),
+            get("summary", ""),
+            [dict(s) for s in get("suggestions") or ()],
+            get("confidence"),
+            created_at,
+        )
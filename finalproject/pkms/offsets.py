@@ -0,0 +1,230 @@
+"""Persisted id -> byte-offset index for JSON record files.
+
+Record files are written as a JSON array with one record per line, so the
+byte range of every record is known at write time. The ranges are stored in a
+sidecar `<file>.idx`: a header holding the (inode, size, mtime) of the data
+file it describes, then fixed-width entries sorted by an 8-byte hash of the
+record id. A lookup is a binary search plus one small read of the data file;
+an index whose header does not match the data file is ignored.
+
+Readers don't hold the writers' lock, so the data file may be replaced
+between opening the index and reading it. `read_many` checks the header
+against the file handle it reads from, and returns None (callers then parse
+the whole file) if the file changed or a record fails to decode.
+"""
+from __future__ import annotations
+import bisect
+import hashlib
+import json
+import os
+import struct
+import tempfile
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+MAGIC = b"PKMSIDX1"
+_HEADER = struct.Struct("<8sQQQ")
+_ENTRY = struct.Struct("<8sQI")
+
+
+def _key(record_id: str) -> bytes:
+    return hashlib.blake2b(record_id.encode("utf-8"), digest_size=8).digest()
+
+
+def _stat_key(path: str) -> Tuple[int, int, int]:
+    st = os.stat(path)
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def _fstat_key(fd: int) -> Tuple[int, int, int]:
+    st = os.fstat(fd)
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def write_records(f: BinaryIO, rows: Iterable[Dict[str, Any]]) -> List[Tuple[str, int, int]]:
+    """Write rows as a one-record-per-line JSON array; return (id, offset, length) per row."""
+    entries = []
+    f.write(b"[\n")
+    pos = 2
+    for i, row in enumerate(rows):
+        line = json.dumps(row, ensure_ascii=False).encode("utf-8")
+        if i:
+            f.write(b",\n")
+            pos += 2
+        if row.get("id") is not None:
+            entries.append((row["id"], pos, len(line)))
+        f.write(line)
+        pos += len(line)
+    f.write(b"\n]\n")
+    return entries
+
+
+class JSONStream:
+    """Incremental reader for large JSON documents made of records.
+
+    Only the record being decoded is held in memory, plus one read chunk, so
+    arrays of any size can be walked in bounded memory. Works on any layout,
+    not just the one-record-per-line files written by `write_records`.
+    """
+    chunk_size = 1 << 16
+    _ws = " \t\r\n"
+
+    def __init__(self, f: TextIO):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character, or "" at end of input."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in self._ws:
+                self.pos += 1
+            if self.pos < len(self.buf) or not self._fill():
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, ch: str):
+        found = self.peek()
+        if found != ch:
+            raise ValueError(f"expected {ch!r}, found {found or 'end of input'!r}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                # Most likely the value continues past the buffered text
+                if not self._fill():
+                    raise
+                continue
+            if end == len(self.buf) and not self.eof and not isinstance(value, (dict, list, str)):
+                # A bare number or literal may be cut at the chunk boundary
+                if self._fill():
+                    continue
+            self.pos = end
+            return value
+
+    def array(self) -> Iterator[Any]:
+        """Yield the elements of the array starting at the current position."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == "]":
+                self.pos += 1
+                return
+            self.expect(",")
+
+
+def iter_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Stream the records of a JSON array file; yields nothing if it does not exist."""
+    try:
+        f = open(path, "r", encoding="utf-8")
+    except FileNotFoundError:
+        return
+    with f:
+        yield from JSONStream(f).array()
+
+
+def write_index(index_path: str, data_path: str, entries: List[Tuple[str, int, int]]):
+    """Write the sidecar for `data_path`, which must already be fully written."""
+    packed = sorted(_ENTRY.pack(_key(i), off, length) for i, off, length in entries)
+    tmpfd, tmppath = tempfile.mkstemp(dir=os.path.dirname(index_path) or ".")
+    try:
+        with os.fdopen(tmpfd, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, *_stat_key(data_path)))
+            f.write(b"".join(packed))
+        os.replace(tmppath, index_path)
+    finally:
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+
+
+class _Keys:
+    # Sequence view over the entry keys, for bisect
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def __len__(self):
+        return (len(self.data) - _HEADER.size) // _ENTRY.size
+
+    def __getitem__(self, i: int) -> bytes:
+        start = _HEADER.size + i * _ENTRY.size
+        return self.data[start:start + 8]
+
+
+class OffsetIndex:
+    def __init__(self, data_path: str, data: bytes):
+        self.data_path = data_path
+        self.data = data
+        self.keys = _Keys(data)
+
+    @classmethod
+    def open(cls, data_path: str, index_path: Optional[str] = None) -> Optional["OffsetIndex"]:
+        """Load the index of `data_path`, or None if it is missing or stale."""
+        index_path = index_path or data_path + ".idx"
+        try:
+            with open(index_path, "rb") as f:
+                data = f.read()
+            current = _stat_key(data_path)
+        except FileNotFoundError:
+            return None
+        if len(data) < _HEADER.size:
+            return None
+        magic, *sig = _HEADER.unpack_from(data)
+        if magic != MAGIC or tuple(sig) != current:
+            return None
+        return cls(data_path, data)
+
+    def ranges(self, record_id: str) -> List[Tuple[int, int]]:
+        key = _key(record_id)
+        i = bisect.bisect_left(self.keys, key)
+        found = []
+        while i < len(self.keys) and self.keys[i] == key:
+            _, off, length = _ENTRY.unpack_from(self.data, _HEADER.size + i * _ENTRY.size)
+            found.append((off, length))
+            i += 1
+        return found
+
+    def read_many(self, record_ids: Iterable[str], field: str = "id") -> Optional[List[Dict[str, Any]]]:
+        """Rows for the ids present in the data file, in file order.
+
+        `field` is the row field the index was keyed by. None if the data
+        file no longer is the one indexed (it was replaced since `open`).
+        """
+        wanted = set(record_ids)
+        spans = sorted(span for rid in wanted for span in self.ranges(rid))
+        rows = []
+        try:
+            f = open(self.data_path, "rb")
+        except FileNotFoundError:
+            return None
+        with f:
+            # The file read from must be the one the header describes
+            if _fstat_key(f.fileno()) != tuple(_HEADER.unpack_from(self.data)[1:]):
+                return None
+            for off, length in spans:
+                f.seek(off)
+                try:
+                    row = json.loads(f.read(length))
+                except ValueError:
+                    return None
+                # Hash collisions are possible; the id inside the record decides
+                if isinstance(row, dict) and row.get(field) in wanted:
+                    rows.append(row)
+        return rows
@@ -0,0 +1,118 @@
+"""Summarize a whole store: `pkms summarize-all`.
+
+Notes are streamed from the backend and cut into chunks, which run through
+`summarize_text` and `suggest_tasks` on a process pool; only a bounded
+number of chunks is in flight, so memory does not grow with the store.
+Each finished chunk is appended to the `AgentResultStore` in one fsynced
+write, which doubles as the checkpoint: a run that is interrupted picks up
+where it stopped (see pkms.results). Bodies analyzed before are answered
+from the agent cache without reaching a worker (see pkms.agent_cache).
+"""
+from __future__ import annotations
+import itertools
+import os
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from .agent import summarize_text, suggest_tasks
+from .models import AgentResult
+from .results import AgentResultStore
+from .sentences import Document
+
+# Chunks queued per worker: keeps every worker busy without reading ahead far
+_QUEUED_PER_WORKER = 2
+
+
+def analyze_chunk(chunk: List[Tuple[str, str]], max_sentences: int, max_suggestions: int,
+                  method: str = "lead") -> List[AgentResult]:
+    """AgentResults for `(note id, body)` pairs; runs in the worker processes."""
+    results = []
+    for note_id, body in chunk:
+        doc = Document(body)  # split once for both analyzers
+        results.append(AgentResult(str(uuid.uuid4()), note_id,
+                                   summarize_text(doc, max_sentences=max_sentences, method=method),
+                                   suggest_tasks(doc, max_suggestions=max_suggestions)))
+    return results
+
+
+def _chunks(rows: Iterable[dict], skip: Set[str], size: int) -> Iterator[List[Tuple[str, str]]]:
+    pairs = ((r.get("id"), r.get("body") or "") for r in rows if r.get("id") not in skip)
+    while True:
+        chunk = list(itertools.islice(pairs, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def summarize_all(storage, max_sentences: int = 2, max_suggestions: int = 3, workers: Optional[int] = None,
+                  chunk_size: int = 256, resume: bool = True, cache: bool = True, method: str = "lead",
+                  progress=None) -> Dict[str, int]:
+    """Store an AgentResult for every note of `storage`; returns counts.
+
+    `workers` processes share the work (default: one per CPU; 1 runs it in
+    this process). With `resume`, an unfinished run with the same
+    parameters continues instead of starting over. With `cache`, notes whose
+    body was analyzed before are answered from the agent cache
+    (pkms.agent_cache) and only the rest reach the workers. `method` is
+    the summary method of `summarize_text`. `progress` is
+    called with the running count of notes summarized. Returns
+    {"summarized": n, "cached": of which answered from the cache,
+    "skipped": notes already done by the resumed run}.
+    """
+    from .agent_cache import AgentCache, cache_key, cache_params, for_note
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be >= 1")
+    workers = workers or os.cpu_count() or 1
+    results = AgentResultStore(storage.data_dir)
+    params = {"max_sentences": max_sentences, "max_suggestions": max_suggestions, "method": method}
+    checkpoint = results.start_run(params, resume=resume)
+    skip = results.done(checkpoint)
+    chunks = _chunks(storage.backend.iter_load("notes"), skip, chunk_size)
+    agent_cache = AgentCache(storage.data_dir) if cache else None
+    cached_with = cache_params(max_sentences, max_suggestions, method)
+    counts = {"summarized": 0, "cached": 0, "skipped": len(skip)}
+
+    def store(batch: List[AgentResult], keys: Optional[List[str]] = None):
+        counts["summarized"] += results.append(batch)
+        if keys is not None:
+            agent_cache.put_many(zip(keys, batch), cached_with)
+        if progress is not None:
+            progress(counts["summarized"])
+
+    def misses(chunk: List[Tuple[str, str]]) -> Tuple[List[Tuple[str, str]], Optional[List[str]]]:
+        # Stores the chunk's cache hits; returns the rest with their keys
+        if agent_cache is None:
+            return chunk, None
+        keys = [cache_key(body, max_sentences, max_suggestions, method) for _, body in chunk]
+        hits = agent_cache.get_many(keys)
+        if hits:
+            store([for_note(hits[k], note_id) for k, (note_id, _) in zip(keys, chunk) if k in hits])
+            counts["cached"] += sum(k in hits for k in keys)
+        todo = [(k, pair) for k, pair in zip(keys, chunk) if k not in hits]
+        return [pair for _, pair in todo], [k for k, _ in todo]
+
+    try:
+        if workers == 1:
+            for chunk in chunks:
+                chunk, keys = misses(chunk)
+                if chunk:
+                    store(analyze_chunk(chunk, max_sentences, max_suggestions, method), keys)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending: Dict[Any, Optional[List[str]]] = {}
+                for chunk in chunks:
+                    chunk, keys = misses(chunk)
+                    if not chunk:
+                        continue
+                    if len(pending) >= workers * _QUEUED_PER_WORKER:
+                        finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            store(future.result(), pending.pop(future))
+                    pending[pool.submit(analyze_chunk, chunk, max_sentences, max_suggestions, method)] = keys
+                for future, keys in pending.items():
+                    store(future.result(), keys)
+    finally:
+        if agent_cache is not None:
+            agent_cache.close()
+    results.finish_run(checkpoint)
+    return counts
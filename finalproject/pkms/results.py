@@ -0,0 +1,144 @@
+"""Persistent store of agent results (summaries and task suggestions).
+
+`AgentResult` records are appended as JSON lines to
+`<data_dir>/agent_results.jsonl`, fsynced per append; a note's latest
+result is the one that counts. A crash can only leave a torn last line,
+which readers ignore and the next append drops.
+
+`agent_results.checkpoint.json` describes the last `summarize_all` run:
+its parameters, the size of the results file when it started and whether it
+finished. Every result after that offset belongs to the run, so an
+interrupted run resumes by skipping the notes it already has results for.
+
+When a run finishes, the file is compacted to the latest result of each
+note, so reruns don't grow it, and an offset index keyed by note id
+(`agent_results.jsonl.idx`, see pkms.offsets) is written next to it for
+`get`. Until the file changes again, `get` reads only that note's line.
+"""
+from __future__ import annotations
+import json
+import os
+import tempfile
+import uuid
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
+from .journal import append_lines, read_lines
+from .locking import FileLock
+from .offsets import OffsetIndex, write_index
+from .models import AgentResult, _now_iso
+
+RESULTS_NAME = "agent_results.jsonl"
+CHECKPOINT_NAME = "agent_results.checkpoint.json"
+
+
+class AgentResultStore:
+    def __init__(self, data_dir: str):
+        self.data_dir = data_dir
+        self.path = os.path.join(data_dir, RESULTS_NAME)
+        self.checkpoint_path = os.path.join(data_dir, CHECKPOINT_NAME)
+        self.lock = FileLock(os.path.join(data_dir, "agent_results.lock"))
+
+    def append(self, results: Iterable[AgentResult]) -> int:
+        """Append `results` durably in one write; returns how many."""
+        rows = [r.to_dict() for r in results]
+        if rows:
+            with self.lock:
+                append_lines(self.path, rows)
+        return len(rows)
+
+    def _rows(self, offset: int = 0) -> List[Dict[str, Any]]:
+        return read_lines(self.path, offset=offset)
+
+    def __iter__(self) -> Iterator[AgentResult]:
+        """Every stored result, oldest first (one per note after a finished run)."""
+        return (AgentResult.from_dict(row) for row in self._rows())
+
+    def latest(self) -> Dict[str, AgentResult]:
+        """The newest result of each note, by note id."""
+        found: Dict[str, Dict[str, Any]] = {}
+        for row in self._rows():
+            found[row.get("note_id")] = row
+        return {note_id: AgentResult.from_dict(row) for note_id, row in found.items()}
+
+    def get(self, note_id: str) -> Optional[AgentResult]:
+        index = OffsetIndex.open(self.path)
+        found = index.read_many([note_id], field="note_id") if index is not None else None
+        if found is not None:
+            row = found[0] if found else None
+        else:
+            # Appended to since the last compaction (or compacted while reading):
+            # parse only the lines that may match
+            needle = json.dumps(note_id, ensure_ascii=False).encode("utf-8")
+            rows = [r for r in read_lines(self.path, needle=needle) if r.get("note_id") == note_id]
+            row = rows[-1] if rows else None
+        return AgentResult.from_dict(row) if row is not None else None
+
+    def compact(self):
+        """Rewrite the results file with only the latest result of each note, and index it."""
+        with self.lock:
+            latest: Dict[Any, Dict[str, Any]] = {}
+            for row in self._rows():
+                # Re-inserted, so notes stay in the order of their latest result
+                latest.pop(row.get("note_id"), None)
+                latest[row.get("note_id")] = row
+            entries = []
+            fd, tmp = tempfile.mkstemp(dir=self.data_dir)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    pos = 0
+                    for note_id, row in latest.items():
+                        line = json.dumps(row, ensure_ascii=False).encode("utf-8")
+                        f.write(line + b"\n")
+                        if note_id is not None:
+                            entries.append((note_id, pos, len(line)))
+                        pos += len(line) + 1
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.path)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            write_index(self.path + ".idx", self.path, entries)
+
+    # Checkpoints of summarize_all runs
+    def checkpoint(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError:  # torn by a crash before the rename; start over
+            return None
+
+    def _write_checkpoint(self, checkpoint: Dict[str, Any]):
+        fd, tmp = tempfile.mkstemp(dir=self.data_dir)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(checkpoint, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.checkpoint_path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def start_run(self, params: Dict[str, Any], resume: bool = True) -> Dict[str, Any]:
+        """The checkpoint of an unfinished run with the same `params`, or a new one."""
+        with self.lock:
+            current = self.checkpoint()
+            if resume and current and not current.get("finished") and current.get("params") == params:
+                return current
+            offset = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            checkpoint = {"run": str(uuid.uuid4()), "params": params, "offset": offset,
+                          "started_at": _now_iso(), "finished": False}
+            self._write_checkpoint(checkpoint)
+            return checkpoint
+
+    def done(self, checkpoint: Dict[str, Any]) -> Set[str]:
+        """Ids of the notes the run of `checkpoint` has stored results for."""
+        return {row.get("note_id") for row in self._rows(checkpoint["offset"])}
+
+    def finish_run(self, checkpoint: Dict[str, Any]):
+        with self.lock:
+            # Finished first: compaction moves the offset an unfinished run would resume from
+            self._write_checkpoint(dict(checkpoint, finished=True, finished_at=_now_iso()))
+            self.compact()
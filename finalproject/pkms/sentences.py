@@ -0,0 +1,207 @@
+"""Sentence splitting shared by the agent's analyzers.
+
+A `Document` splits a text once, after sentence-ending punctuation followed
+by whitespace, and is handed to every analyzer (`summarize_text`,
+`suggest_tasks`, ...) instead of each one splitting the text again.
+Sentences are kept as `(start, end)` offsets into the original string and
+are found lazily, so an analyzer that only looks at the first few sentences
+doesn't split the rest. The lowercase text and the words of a sentence are
+computed once, the first time an analyzer asks for them.
+
+A `SentenceStream` splits text that arrives in chunks (`text_chunks` cuts
+a file or an mmap into them) while holding only a bounded part of it, for
+texts too large to keep whole.
+"""
+from __future__ import annotations
+import codecs
+import itertools
+import mmap
+import re
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# The whitespace after sentence-ending punctuation; the same boundaries as
+# splitting on r"(?<=[.!?])\s+", which is several times slower to scan for
+_BOUNDARY = re.compile(r"[.!?]\s+")
+
+
+class Document:
+    """A text and its sentences; indexing yields the sentences as strings."""
+
+    __slots__ = ("text", "start", "end", "spans", "_boundaries", "_pos", "_lower", "_words")
+
+    def __init__(self, text: str):
+        self.text = text
+        # The sentences cover text.strip()
+        self.start = len(text) - len(text.lstrip())
+        self.end = max(len(text.rstrip()), self.start)
+        self.spans: List[Tuple[int, int]] = []
+        self._boundaries: Optional[Iterator] = _BOUNDARY.finditer(text, self.start, self.end)
+        self._pos = self.start
+        self._lower: List[Optional[str]] = []
+        self._words: List[Optional[List[str]]] = []
+
+    def _split_to(self, index: Optional[int]) -> bool:
+        # Find spans until `index` exists (None: all of them); False if it doesn't.
+        # Splits in growing batches, so long texts cost few calls per sentence.
+        spans = self.spans
+        while self._boundaries is not None and (index is None or index >= len(spans)):
+            want = None if index is None else max(index + 1 - len(spans), len(spans), 8)
+            matches = list(itertools.islice(self._boundaries, want))
+            pos = self._pos
+            for m in matches:
+                start, end = m.span()
+                spans.append((pos, start + 1))
+                pos = end
+            self._pos = pos
+            if want is None or len(matches) < want:
+                spans.append((pos, self.end))
+                self._boundaries = None
+            grown = len(spans) - len(self._lower)
+            self._lower.extend([None] * grown)
+            self._words.extend([None] * grown)
+        return index is None or index < len(spans)
+
+    def __len__(self) -> int:
+        if self._boundaries is not None:
+            self._split_to(None)
+        return len(self.spans)
+
+    def __getitem__(self, index: int) -> str:
+        if index < 0:
+            index += len(self)
+        if index < 0 or (index >= len(self.spans) and not self._split_to(index)):
+            raise IndexError("sentence index out of range")
+        start, end = self.spans[index]
+        return self.text[start:end]
+
+    def __iter__(self) -> Iterator[str]:
+        text, spans = self.text, self.spans
+        i = 0
+        while i < len(spans) or self._split_to(i):
+            start, end = spans[i]
+            yield text[start:end]
+            i += 1
+
+    def lower(self, index: int) -> str:
+        """Sentence `index`, lowercased."""
+        if index >= len(self.spans):
+            self._split_to(index)
+        low = self._lower[index]
+        if low is None:
+            start, end = self.spans[index]
+            low = self._lower[index] = self.text[start:end].lower()
+        return low
+
+    def words(self, index: int) -> List[str]:
+        """The whitespace-separated words of sentence `index`, lowercased."""
+        words = self._words[index] if index < len(self.spans) else None
+        if words is None:
+            words = self._words[index] = self.lower(index).split()
+        return words
+
+    @property
+    def stripped(self) -> str:
+        """The whole text without surrounding whitespace."""
+        return self.text[self.start:self.end]
+
+
+# A sentence longer than this is cut (at a space when there is one), which
+# bounds the memory a SentenceStream holds
+MAX_SENTENCE_CHARS = 1 << 16
+CHUNK_SIZE = 1 << 16
+
+
+def text_chunks(source, size: int = CHUNK_SIZE) -> Iterator[str]:
+    """Chunks of about `size` characters of `source`, for a SentenceStream.
+
+    `source` is a str, a text or binary file, or a bytes-like object such
+    as an mmap; bytes are decoded as UTF-8, a chunk at a time.
+    """
+    if isinstance(source, str):
+        for i in range(0, len(source), size):
+            yield source[i:i + size]
+        return
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    if hasattr(source, "read") and not isinstance(source, mmap.mmap):
+        while True:
+            data = source.read(size)
+            if not data:
+                break
+            yield data if isinstance(data, str) else decoder.decode(data)
+    else:
+        with memoryview(source) as view:
+            for i in range(0, len(view), size):
+                yield decoder.decode(view[i:i + size])
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+class SentenceStream:
+    """The sentences of a text that arrives in chunks, one at a time.
+
+    Splits like `Document`, except that a sentence over `max_sentence_chars`
+    is cut in pieces, so at most about `max_sentence_chars` plus one chunk of
+    text is held at a time. Chunks are read only as far as the sentences
+    taken. While iterating, `length` is how far into the stripped text the
+    sentences reach, and `prefix` holds its first `keep_prefix` characters.
+    """
+
+    def __init__(self, chunks: Iterable[str], max_sentence_chars: int = MAX_SENTENCE_CHARS, keep_prefix: int = 0):
+        self.chunks = chunks
+        self.max_sentence_chars = max_sentence_chars
+        self.keep_prefix = keep_prefix
+        self.prefix = ""
+        self.length = 0
+
+    def __iter__(self) -> Iterator[str]:
+        buf = ""  # text not yielded yet; starts with the next sentence
+        start = 0  # offset of buf in the whole text
+        origin = None  # offset of the first character that isn't whitespace
+        read = 0  # characters read so far
+        scan = 0  # where in buf a boundary may still start
+        emitted = False
+        for chunk in self.chunks:
+            offset, read = read, read + len(chunk)
+            if not buf:
+                # Sentences start after the whitespace, which may span chunks
+                buf = chunk.lstrip()
+                if buf:
+                    start = read - len(buf)
+                    if origin is None:
+                        origin = start
+            else:
+                buf += chunk
+            if origin is not None and len(self.prefix) < self.keep_prefix:
+                self.prefix += chunk[max(origin - offset, 0):][:self.keep_prefix - len(self.prefix)]
+            if not buf:
+                continue
+            cut = 0
+            while True:
+                m = _BOUNDARY.search(buf, scan)
+                end = m.start() + 1 if m is not None else None
+                if (len(buf) if end is None else end) - cut > self.max_sentence_chars:
+                    # Too long: yield the sentence's first characters, up to a space if there is one
+                    limit = cut + self.max_sentence_chars
+                    end = max(buf.rfind(" ", cut + 1, limit), buf.rfind("\n", cut + 1, limit))
+                    piece = buf[cut:end if end > 0 else limit].rstrip()
+                    self.length = start + cut + len(piece) - origin
+                    emitted = True
+                    yield piece
+                    cut = len(buf) - len(buf[cut + len(piece):].lstrip())
+                    scan = max(scan, cut)
+                    continue
+                if end is None:
+                    scan = max(len(buf) - 1, cut)  # the punctuation may be followed by the next chunk
+                    break
+                self.length = start + end - origin
+                emitted = True
+                yield buf[cut:end]
+                # If the whitespace reaches the end of buf, the next chunk is stripped of the rest
+                cut = scan = m.end()
+            buf, start, scan = buf[cut:], start + cut, scan - cut
+        last = buf.rstrip()
+        if last or not emitted:
+            if last:
+                self.length = start + len(last) - origin
+            yield last
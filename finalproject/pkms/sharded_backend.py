@@ -0,0 +1,361 @@
+"""Sharded storage backend: each record kind split over N JSON files by id prefix.
+
+Record ids are uuid4 strings; a record lives in the shard covering the
+range of its first four hex digits (`shard_of`), so shards split the id
+space evenly. Each shard file has the JSON backend's format, `.idx` offset
+index included, and a write rewrites only the shards holding the records it
+changes.
+
+`<kind>.shards.json` is the kind's manifest: `{"shards": N, "epoch": E}`,
+naming the live files `<kind>.e<E>.<i>.json`. A write touching one shard
+replaces that file in place. A write touching several, a full save, or a
+reshard writes the changed shards under epoch E+1, hard-links the unchanged
+ones, and switches the manifest atomically, so a batch never lands half
+applied. Readers open every shard of one epoch up front and start again if
+the manifest moved on in between.
+
+`load` reads the shards on a thread pool and `iter_load` streams them; both
+merge the shards by `created_at`, which is insertion order for records
+added through pkms. Use `reshard()` (CLI:
+`pkms reshard N`) to change N or to move a store, sharded or not, into this
+layout.
+"""
+from __future__ import annotations
+import heapq
+import json
+import os
+import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from .offsets import JSONStream, OffsetIndex
+from .storage import KINDS, JSONBackend, StorageError, _merge_rows, _stat_signature
+
+DEFAULT_SHARDS = 16
+MAX_SHARDS = 1 << 16
+_HEX4 = re.compile(r"[0-9a-fA-F]{4}")
+_SHARD_RE = re.compile(r"^(notes|tasks)\.e(\d+)\.(\d+)\.json(\.idx)?$")
+# Threads reading shards in load()
+_READ_WORKERS = 8
+# Re-reads of the manifest when a shard vanishes under a reader
+_READ_RETRIES = 10
+
+
+def shard_of(record_id: str, shards: int) -> int:
+    """Shard of `record_id` among `shards`: its range of the first four hex digits."""
+    head = record_id[:4]
+    if _HEX4.fullmatch(head):
+        prefix = int(head, 16)
+    else:  # not a uuid: spread by hash instead
+        prefix = zlib.crc32(record_id.encode("utf-8")) & 0xFFFF
+    return prefix * shards >> 16
+
+
+def _parse(f) -> List[Dict[str, Any]]:
+    return json.loads(f.read())
+
+
+def _created(row: Dict[str, Any]) -> str:
+    return row.get("created_at") or ""
+
+
+class ShardedBackend(JSONBackend):
+    """Records of each kind partitioned over shard files; see the module docstring."""
+
+    name = "sharded"
+
+    def __init__(self, data_dir: str, shards: int = DEFAULT_SHARDS):
+        super().__init__(data_dir)
+        _check_count(shards)
+        # Shard count for a store that has no manifest yet
+        self.default_shards = shards
+        self.manifests = {kind: os.path.join(data_dir, f"{kind}.shards.json") for kind in KINDS}
+        self._manifest_cache: Dict[str, Tuple[tuple, Tuple[int, int]]] = {}
+
+    # Layout
+    def manifest(self, kind: str) -> Tuple[int, int]:
+        """(shard count, epoch) of `kind`; epoch 0 means nothing was written yet."""
+        sig = _stat_signature([self.manifests[kind]])
+        cached = self._manifest_cache.get(kind)
+        if cached is not None and cached[0] == sig:
+            return cached[1]
+        try:
+            with open(self.manifests[kind], "r", encoding="utf-8") as f:
+                data = json.load(f)
+            value = (int(data["shards"]), int(data["epoch"]))
+        except FileNotFoundError:
+            value = (self.default_shards, 0)
+        except (ValueError, KeyError, TypeError) as exc:
+            raise StorageError(f"Bad shard manifest {self.manifests[kind]}: {exc}")
+        self._manifest_cache[kind] = (sig, value)
+        return value
+
+    def path(self, kind: str, epoch: int, shard: int) -> str:
+        return os.path.join(self.data_dir, f"{kind}.e{epoch}.{shard}.json")
+
+    def shard_paths(self, kind: str) -> List[str]:
+        shards, epoch = self.manifest(kind)
+        return [self.path(kind, epoch, i) for i in range(shards)] if epoch else []
+
+    def _partition(self, rows: Iterable[Dict[str, Any]], shards: int) -> List[List[Dict[str, Any]]]:
+        parts: List[List[Dict[str, Any]]] = [[] for _ in range(shards)]
+        for row in rows:
+            parts[shard_of(row["id"], shards)].append(row)
+        return parts
+
+    def exists(self) -> bool:
+        return any(os.path.exists(p) for p in self.manifests.values())
+
+    def signature(self, kind: str) -> tuple:
+        return _stat_signature([self.manifests[kind]] + self.shard_paths(kind))
+
+    # Reads
+    def _read(self, kind: str, read):
+        """Run `read(shards, epoch)`; again if a writer switched epochs under it."""
+        for _ in range(_READ_RETRIES):
+            manifest = self.manifest(kind)
+            try:
+                return read(*manifest)
+            except FileNotFoundError:
+                self._manifest_cache.pop(kind, None)
+                if self.manifest(kind) == manifest:
+                    raise StorageError(f"Shard files of {kind} are missing from {self.data_dir}")
+        raise StorageError(f"Shards of {kind} kept changing while being read")
+
+    def _open_shards(self, kind: str) -> List[Any]:
+        # Open every shard of one epoch; once open, a file stays readable even
+        # if a writer switches epochs and removes it
+        def open_all(shards, epoch):
+            files = []
+            try:
+                for i in range(shards if epoch else 0):
+                    files.append(open(self.path(kind, epoch, i), "r", encoding="utf-8"))
+            except BaseException:
+                for f in files:
+                    f.close()
+                raise
+            return files
+        return self._read(kind, open_all)
+
+    def _read_shard(self, path: str) -> List[Dict[str, Any]]:
+        # Unlike _read_file, a missing shard is an error (FileNotFoundError)
+        with open(path, "r", encoding="utf-8") as f:
+            try:
+                return json.load(f)
+            except ValueError as exc:
+                raise StorageError(f"Failed to read JSON from {path}: {exc}")
+
+    def iter_load(self, kind: str) -> Iterator[Dict[str, Any]]:
+        """Stream the records of every shard, merged by created_at."""
+        files = self._open_shards(kind)
+        try:
+            yield from heapq.merge(*(JSONStream(f).array() for f in files), key=_created)
+        except ValueError as exc:
+            raise StorageError(f"Failed to read JSON from a {kind} shard: {exc}")
+        finally:
+            for f in files:
+                f.close()
+
+    def load(self, kind: str) -> List[Dict[str, Any]]:
+        files = self._open_shards(kind)
+        try:
+            if len(files) > 1:
+                # Overlaps the file reads; decoding holds the GIL either way
+                with ThreadPoolExecutor(max_workers=min(len(files), _READ_WORKERS)) as pool:
+                    parts = list(pool.map(_parse, files))
+            else:
+                parts = [_parse(f) for f in files]
+        except ValueError as exc:
+            raise StorageError(f"Failed to read JSON from a {kind} shard: {exc}")
+        finally:
+            for f in files:
+                f.close()
+        return list(heapq.merge(*parts, key=_created))
+
+    def get_many(self, kind: str, record_ids) -> List[Dict[str, Any]]:
+        record_ids = list(record_ids)
+
+        def read(shards, epoch):
+            wanted: Dict[int, set] = {}
+            for rid in record_ids if epoch else ():
+                wanted.setdefault(shard_of(rid, shards), set()).add(rid)
+            parts = []
+            for shard, ids in wanted.items():
+                path = self.path(kind, epoch, shard)
+                index = OffsetIndex.open(path)
+                rows = index.read_many(ids) if index is not None else None
+                if rows is None:
+                    rows = [r for r in self._read_shard(path) if r.get("id") in ids]
+                parts.append(rows)
+            # Store order, as from load()
+            return list(heapq.merge(*parts, key=_created))
+        return self._read(kind, read)
+
+    # Writes
+    def _switch(self, kind: str, shards: int, parts: Dict[int, List[Dict[str, Any]]]):
+        """Write `parts` (shard -> rows) as a new epoch, link the other shards over, switch."""
+        old_shards, epoch = self.manifest(kind)
+        for shard in range(shards):
+            path = self.path(kind, epoch + 1, shard)
+            if shard in parts:
+                self._atomic_write(path, parts[shard])
+            else:
+                self._carry_over(kind, epoch, shard, path)
+        self._write_manifest(kind, shards, epoch + 1)
+        self._remove_stale(kind)
+
+    def _carry_over(self, kind: str, epoch: int, shard: int, path: str):
+        # Unchanged shard, same layout: the new epoch links the old file (its
+        # .idx stays valid, being keyed on the file's inode)
+        old = self.path(kind, epoch, shard)
+        try:
+            for suffix in ("", ".idx"):
+                if os.path.exists(old + suffix):
+                    os.link(old + suffix, path + suffix)
+        except OSError:  # no hard links on this file system
+            self._atomic_write(path, self._load_shard(kind, epoch, shard))
+
+    def _load_shard(self, kind: str, epoch: int, shard: int) -> List[Dict[str, Any]]:
+        # Only called by writers, under the lock: the epoch cannot move
+        path = self.path(kind, epoch, shard)
+        try:
+            return self._read_shard(path)
+        except FileNotFoundError:
+            raise StorageError(f"Shard file {path} is missing")
+
+    def _write_manifest(self, kind: str, shards: int, epoch: int):
+        path = self.manifests[kind]
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"shards": shards, "epoch": epoch}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self._manifest_cache.pop(kind, None)
+
+    def _remove_stale(self, kind: str):
+        # Files of older epochs, including ones a crash or Windows left behind
+        _, epoch = self.manifest(kind)
+        for name in os.listdir(self.data_dir):
+            m = _SHARD_RE.match(name)
+            if m and m.group(1) == kind and int(m.group(2)) != epoch:
+                try:
+                    os.remove(os.path.join(self.data_dir, name))
+                except OSError:  # open elsewhere on Windows; removed next time
+                    pass
+
+    def save(self, kind: str, rows: Iterable[Dict[str, Any]], shards: Optional[int] = None):
+        """Replace every record of `kind`; with `shards`, also change the shard count."""
+        with self.locks[kind].writing():
+            shards = shards or self.manifest(kind)[0]
+            _check_count(shards)
+            self._switch(kind, shards, dict(enumerate(self._partition(rows, shards))))
+
+    def extend(self, kind: str, rows: Iterable[Dict[str, Any]]) -> int:
+        rows = list(rows)
+        with self.locks[kind]:
+            shards, epoch = self.manifest(kind)
+            parts = self._partition(rows, shards)
+            with self.locks[kind].writing():
+                if not epoch:
+                    self._switch(kind, shards, dict(enumerate(parts)))
+                    return len(rows)
+                changed = {i: self._load_shard(kind, epoch, i) + part for i, part in enumerate(parts) if part}
+                self._commit(kind, shards, epoch, changed)
+        return len(rows)
+
+    def _commit(self, kind: str, shards: int, epoch: int, changed: Dict[int, List[Dict[str, Any]]]):
+        if len(changed) == 1:
+            # One shard: replaced atomically in place, no epoch switch needed
+            (shard, rows), = changed.items()
+            self._atomic_write(self.path(kind, epoch, shard), rows)
+        elif changed:
+            self._switch(kind, shards, changed)
+
+    def apply(self, kind: str, puts: List[Dict[str, Any]], deletes: List[str]) -> set:
+        """Upsert `puts` and remove `deletes`, rewriting only the shards they fall in."""
+        with self.locks[kind]:
+            shards, epoch = self.manifest(kind)
+            if not epoch:
+                rows, gone = _merge_rows([], puts, deletes)
+                if rows:
+                    self.save(kind, rows)
+                return gone
+            touched: Dict[int, Tuple[list, list]] = {}
+            for row in puts:
+                touched.setdefault(shard_of(row["id"], shards), ([], []))[0].append(row)
+            for rid in deletes:
+                touched.setdefault(shard_of(rid, shards), ([], []))[1].append(rid)
+            changed, gone = {}, set()
+            for shard, (shard_puts, shard_deletes) in touched.items():
+                rows, shard_gone = _merge_rows(self._load_shard(kind, epoch, shard), shard_puts, shard_deletes)
+                if shard_puts or shard_gone:
+                    changed[shard] = rows
+                    gone |= shard_gone
+            if changed:
+                with self.locks[kind].writing():
+                    self._commit(kind, shards, epoch, changed)
+        return gone
+
+    def retire(self):
+        for kind in KINDS:
+            for path in self.shard_paths(kind):
+                for suffix in ("", ".idx"):
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+            if os.path.exists(self.manifests[kind]):
+                os.replace(self.manifests[kind], self.manifests[kind] + ".migrated")
+            self._manifest_cache.pop(kind, None)
+
+
+def _check_count(shards: int):
+    if not 1 <= shards <= MAX_SHARDS:
+        raise StorageError(f"Shard count must be between 1 and {MAX_SHARDS}")
+
+
+def _newest(rows: Iterable[Dict[str, Any]], by_id: Dict[str, Dict[str, Any]]):
+    # Same id in two stores: keep the copy edited last
+    for row in rows:
+        seen = by_id.get(row.get("id"))
+        if seen is None or (row.get("updated_at") or "") > (seen.get("updated_at") or ""):
+            by_id[row.get("id")] = row
+
+
+def reshard(data_dir: str, shards: int) -> Dict[str, int]:
+    """Rewrite the store in `data_dir` as `shards` shards per kind; returns record counts.
+
+    Works from any layout: records of an existing sharded store are
+    re-partitioned, and records of unsharded stores found in the directory
+    (json, journal, split or sqlite files, e.g. left by an interrupted
+    migration) are merged in, the copy with the latest `updated_at` winning
+    for ids stored twice. The unsharded files are then retired with a
+    `.migrated` suffix.
+    """
+    from .storage import open_backend
+    _check_count(shards)
+    dst = ShardedBackend(data_dir, shards)
+    sources = []
+    try:
+        for name in ("json", "journal", "split"):
+            backend = open_backend(name, data_dir)
+            if backend.exists():
+                sources.append(backend)
+        # Opening SQLite would create the database, so look for it first
+        if os.path.exists(os.path.join(data_dir, "pkms.db")):
+            sources.append(open_backend("sqlite", data_dir))
+        counts = {}
+        for kind in KINDS:
+            with dst.locks[kind]:
+                by_id: Dict[str, Dict[str, Any]] = {}
+                _newest(dst.load(kind), by_id)
+                for src in sources:
+                    _newest(src.load(kind), by_id)
+                dst.save(kind, sorted(by_id.values(), key=_created), shards=shards)
+                counts[kind] = len(by_id)
+        for src in sources:
+            src.retire()
+        return counts
+    finally:
+        for src in sources:
+            src.close()
+        dst.close()
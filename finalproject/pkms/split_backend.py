@@ -0,0 +1,356 @@
+"""Split storage backend: note metadata and note bodies in separate files.
+
+`notes.meta.json` holds every note field except the body, plus a
+`body_ref` of `[segment, offset, length]` pointing into
+`notes.bodies.<segment>.dat`, a file of UTF-8 bodies laid end to end. Tasks
+have no bulky field and live whole in `tasks.meta.json`. The meta files use
+the JSON backend's format, `.idx` offset index included.
+
+StorageManager asks this backend for records directly (`records`,
+`records_many`), and gets LazyNote objects whose bodies are read on first
+access, so listing notes or filtering by tag reads only the metadata. The
+plain dict methods (`load`, `iter_load`, `get_many`) return whole rows, body
+included, like every other backend. Body segments are memory-mapped, and
+`search_notes` rules out notes by scanning their body bytes in the map
+(`scan`), so only the bodies of possible hits are decoded.
+
+Writes append new bodies to the current segment and rewrite the (small)
+meta file. A full save, or a segment that has become mostly dead bodies,
+writes a new segment; the meta file is switched to it atomically before the
+old one is removed, so readers never see a ref into a missing body.
+"""
+from __future__ import annotations
+import mmap
+import os
+import re
+from typing import Any, Dict, Iterable, Iterator, List
+from .models import LazyNote, Note, Task, _shared, _shared_tags
+from .offsets import OffsetIndex
+from .storage import KINDS, JSONBackend, StorageError, _merge_rows
+
+# Rewrite a segment once dead bodies take more than half of it (and 1 MiB)
+_COMPACT_MIN_BYTES = 1 << 20
+_SEGMENT_RE = re.compile(r"^notes\.bodies\.(\d+)\.dat$")
+# Lets a scan drop the pages it mapped in (None where madvise is missing)
+_DONTNEED = getattr(mmap, "MADV_DONTNEED", None)
+# Non-ASCII characters whose lowercase holds an ASCII letter: a body with
+# one of them may match a query its ASCII-lowercased bytes do not contain
+_FOLDS_TO_ASCII = {"i": "\u0130".encode("utf-8"), "k": "\u212a".encode("utf-8")}
+
+
+class BodyStore:
+    """Append-only segment files of note bodies, addressed by (segment, offset, length).
+
+    Segments are read through read-only memory maps, so a body costs a slice
+    of the page cache rather than a read into a fresh buffer, and `view`
+    exposes the undecoded bytes for scanning.
+    """
+
+    def __init__(self, data_dir: str):
+        self.data_dir = data_dir
+        self._maps: Dict[int, mmap.mmap] = {}
+
+    def path(self, segment: int) -> str:
+        return os.path.join(self.data_dir, f"notes.bodies.{segment}.dat")
+
+    def segments(self) -> List[int]:
+        found = []
+        for name in os.listdir(self.data_dir):
+            m = _SEGMENT_RE.match(name)
+            if m:
+                found.append(int(m.group(1)))
+        return sorted(found)
+
+    def _map(self, segment: int, end: int) -> mmap.mmap:
+        m = self._maps.get(segment)
+        if m is None or len(m) < end:
+            # New segment, or one appended to since it was mapped. The old map
+            # is left to the garbage collector: views into it may still be alive.
+            # A map stays readable even if another process compacts the file away.
+            with open(self.path(segment), "rb") as f:
+                if os.fstat(f.fileno()).st_size < end:
+                    raise StorageError(f"Note body ending at {end} is truncated in {self.path(segment)}")
+                m = self._maps[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return m
+
+    def view(self, ref) -> memoryview:
+        """The undecoded UTF-8 bytes of the body at `ref`, in the map."""
+        segment, offset, length = ref
+        if not length:
+            return memoryview(b"")
+        return memoryview(self._map(segment, offset + length))[offset:offset + length]
+
+    def read(self, ref) -> str:
+        segment, offset, length = ref
+        if not length:
+            return ""
+        m = self._map(segment, offset + length)
+        with memoryview(m) as view:
+            body = str(view[offset:offset + length], "utf-8")
+        self._release(m, offset, length)
+        return body
+
+    def folded(self, ref) -> bytes:
+        """The body's UTF-8 bytes with ASCII letters lowercased, without decoding it."""
+        segment, offset, length = ref
+        if not length:
+            return b""
+        m = self._map(segment, offset + length)
+        data = m[offset:offset + length].lower()
+        self._release(m, offset, length)
+        return data
+
+    @staticmethod
+    def _release(m: mmap.mmap, offset: int, length: int):
+        # The bytes were copied out: drop the pages from this process so a
+        # pass over the whole store does not keep it all resident (they stay
+        # in the page cache, so reading them again is cheap)
+        if _DONTNEED is not None:
+            start = offset - offset % mmap.PAGESIZE
+            m.madvise(_DONTNEED, start, offset + length - start)
+
+    def append(self, segment: int, bodies: List[str]) -> List[List[int]]:
+        """Append `bodies` to `segment` durably; returns their refs."""
+        refs = []
+        with open(self.path(segment), "ab") as f:
+            offset = f.tell()
+            for body in bodies:
+                data = body.encode("utf-8")
+                f.write(data)
+                refs.append([segment, offset, len(data)])
+                offset += len(data)
+            f.flush()
+            os.fsync(f.fileno())
+        return refs
+
+    def drop(self, keep: int):
+        """Unmap and remove every segment except `keep`."""
+        for segment in self.segments():
+            if segment != keep:
+                self._unmap(segment)
+                try:
+                    os.remove(self.path(segment))
+                except OSError:  # still mapped elsewhere on Windows; dropped next time
+                    pass
+
+    def _unmap(self, segment: int):
+        m = self._maps.pop(segment, None)
+        if m is not None:
+            try:
+                m.close()
+            except BufferError:  # a view is still alive; the map goes with it
+                pass
+
+    def close(self):
+        for segment in list(self._maps):
+            self._unmap(segment)
+
+
+class _Body:
+    # LazyNote's body loader; keeps the ref so an unread body can be written back as is
+    __slots__ = ("backend", "id", "ref")
+
+    def __init__(self, backend: "SplitBackend", note_id: str, ref):
+        self.backend, self.id, self.ref = backend, note_id, ref
+
+    def __call__(self) -> str:
+        return self.backend._body({"id": self.id, "body_ref": self.ref})
+
+
+class SplitBackend(JSONBackend):
+    """Notes as metadata plus a separate body store; see the module docstring."""
+
+    name = "split"
+
+    def __init__(self, data_dir: str):
+        super().__init__(data_dir)
+        self.paths = {kind: os.path.join(data_dir, f"{kind}.meta.json") for kind in KINDS}
+        self.bodies = BodyStore(data_dir)
+
+    # Stored rows are meta rows: notes carry a body_ref instead of a body
+    def _stored(self, kind: str) -> List[Dict[str, Any]]:
+        return self._read_file(self.paths[kind])
+
+    def _stored_many(self, kind: str, record_ids) -> List[Dict[str, Any]]:
+        wanted = set(record_ids)
+        index = OffsetIndex.open(self.paths[kind])
+        if index is not None and len(wanted) * 4 < len(index.keys):
+            rows = index.read_many(wanted)
+            if rows is not None:
+                return rows
+        # Meta rows are small: for a large share of them one parse beats a seek per row
+        return [row for row in self._stored(kind) if row.get("id") in wanted]
+
+    def _body(self, row: Dict[str, Any]) -> str:
+        try:
+            return self.bodies.read(row["body_ref"])
+        except FileNotFoundError:
+            # The segment was compacted since `row` was read: look the note up again
+            current = self._stored_many("notes", [row["id"]])
+            if not current or current[0]["body_ref"] == row["body_ref"]:
+                raise StorageError(f"Body of note {row['id']} is missing from {self.data_dir}")
+            return self.bodies.read(current[0]["body_ref"])
+
+    def _full(self, kind: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        if "body_ref" not in row:
+            return row
+        row = dict(row)
+        row["body"] = self._body(row)
+        del row["body_ref"]
+        return row
+
+    def load(self, kind: str) -> List[Dict[str, Any]]:
+        return [self._full(kind, row) for row in self._stored(kind)]
+
+    def iter_load(self, kind: str) -> Iterator[Dict[str, Any]]:
+        for row in JSONBackend.iter_load(self, kind):
+            yield self._full(kind, row)
+
+    def get_many(self, kind: str, record_ids) -> List[Dict[str, Any]]:
+        return [self._full(kind, row) for row in self._stored_many(kind, record_ids)]
+
+    # Record hooks used by StorageManager instead of load/get_many + from_dict
+    def _record(self, kind: str, row: Dict[str, Any]):
+        if kind != "notes" or "body_ref" not in row:
+            return (Note if kind == "notes" else Task).from_dict(row)
+        created_at = row.get("created_at")
+        updated_at = row.get("updated_at")
+        return LazyNote.lazy(
+            _Body(self, row.get("id"), row["body_ref"]),
+            row.get("id"),
+            row.get("title", ""),
+            _shared_tags(row.get("tags", ())),
+            created_at,
+            created_at if updated_at == created_at else updated_at,
+            _shared(row.get("source", "manual")),
+        )
+
+    def records(self, kind: str) -> list:
+        return [self._record(kind, row) for row in self._stored(kind)]
+
+    def records_many(self, kind: str, record_ids) -> list:
+        return [self._record(kind, row) for row in self._stored_many(kind, record_ids)]
+
+    def encode(self, kind: str, record) -> Dict[str, Any]:
+        """Row for `record`; a LazyNote whose body was never read keeps its body_ref."""
+        loader = getattr(record, "_load_body", None)
+        if isinstance(loader, _Body) and loader.backend is self and not record.body_loaded:
+            return {"id": record.id, "title": record.title, "body_ref": loader.ref, "tags": list(record.tags),
+                    "created_at": record.created_at, "updated_at": record.updated_at, "source": record.source}
+        return record.to_dict()
+
+    def scan(self, notes: Iterable[Any], q: str, words: List[str], match: str) -> Iterator[Any]:
+        """Drop notes that cannot match a search_notes query, without decoding their bodies.
+
+        An unread body is searched in its ASCII-lowercased bytes, sliced from
+        the memory map; notes that may still match are passed on for the usual
+        check on the text.
+        """
+        needles = [q] if match == "phrase" or not words else words
+        if not all(n.isascii() for n in needles):  # non-ASCII case folding is left to the text check
+            yield from notes
+            return
+        # The searched text is "title body tags", so a phrase with a space in
+        # it may also match across a field boundary
+        spaces = [i for i, c in enumerate(q) if c == " "] if needles == [q] else []
+        encoded = [(n, n.encode("ascii"), [c for letter, c in _FOLDS_TO_ASCII.items() if letter in n])
+                   for n in needles]
+        need = all if match != "any" else any
+        for note in notes:
+            loader = getattr(note, "_load_body", None)
+            if not isinstance(loader, _Body) or loader.backend is not self or note.body_loaded:
+                yield note
+                continue
+            title, tags = note.title.lower(), " ".join(note.tags).lower()
+            if any(title.endswith(q[:i]) or tags.startswith(q[i + 1:]) for i in spaces):
+                yield note
+                continue
+            body, hits = None, []
+            try:
+                for n, raw, folds in encoded:
+                    hit = n in title or n in tags
+                    if not hit:
+                        if body is None:
+                            body = self.bodies.folded(loader.ref)
+                        hit = raw in body or (bool(folds) and not body.isascii() and any(c in body for c in folds))
+                    hits.append(hit)
+            except (OSError, StorageError):  # body moved by a compaction: let the text check decide
+                yield note
+                continue
+            if need(hits):
+                yield note
+
+    # Writes
+    def _split(self, segment: int, rows: List[Dict[str, Any]], copy: bool) -> List[Dict[str, Any]]:
+        # Move bodies of `rows` into `segment`; with `copy`, bodies already
+        # stored elsewhere are copied too (a rewrite), else their refs are kept
+        out, bodies, at = [], [], []
+        for row in rows:
+            if "body" in row or (copy and "body_ref" in row and row["body_ref"][0] != segment):
+                body = row["body"] if "body" in row else self._body(row)
+                row = {k: v for k, v in row.items() if k != "body"}
+                at.append(len(out))
+                bodies.append(body or "")
+            out.append(row)
+        for i, ref in zip(at, self.bodies.append(segment, bodies) if bodies else ()):
+            out[i]["body_ref"] = ref
+        return out
+
+    def _rewrite(self, rows: List[Dict[str, Any]]):
+        # New segment, then the meta file switches to it, then old segments go
+        segment = max(self.bodies.segments(), default=0) + 1
+        rows = self._split(segment, rows, copy=True)
+        if not any("body_ref" in r for r in rows):
+            self.bodies.append(segment, [])
+        self._atomic_write(self.paths["notes"], rows)
+        self.bodies.drop(keep=segment)
+
+    def save(self, kind: str, rows: Iterable[Dict[str, Any]]):
+        if kind != "notes":
+            return super().save(kind, rows)
+        with self.locks[kind].writing():
+            self._rewrite(list(rows))
+
+    def extend(self, kind: str, rows: Iterable[Dict[str, Any]]) -> int:
+        if kind != "notes":
+            return super().extend(kind, rows)
+        rows = list(rows)
+        with self.locks[kind].writing():
+            stored = self._stored(kind)
+            segment = self._segment()
+            self._atomic_write(self.paths[kind], stored + self._split(segment, rows, copy=False))
+        return len(rows)
+
+    def _segment(self) -> int:
+        # The newest segment takes appends; a fresh store starts with 1
+        return max(self.bodies.segments(), default=1)
+
+    def apply(self, kind: str, puts: List[Dict[str, Any]], deletes: List[str]) -> set:
+        if kind != "notes":
+            return super().apply(kind, puts, deletes)
+        with self.locks[kind]:
+            stored = self._stored(kind)
+            segment = self._segment()
+            rows, gone = _merge_rows(stored, self._split(segment, puts, copy=False), deletes)
+            if puts or gone:
+                with self.locks[kind].writing():
+                    live = sum(r["body_ref"][2] for r in rows if "body_ref" in r)
+                    size = os.path.getsize(self.bodies.path(segment)) if os.path.exists(self.bodies.path(segment)) else 0
+                    if size > max(2 * live, _COMPACT_MIN_BYTES):
+                        self._rewrite(rows)
+                    else:
+                        self._atomic_write(self.paths[kind], rows)
+        return gone
+
+    def body_bytes(self) -> int:
+        """Size of the body segments on disk."""
+        return sum(os.path.getsize(self.bodies.path(s)) for s in self.bodies.segments())
+
+    def retire(self):
+        super().retire()
+        self.bodies.close()
+        for segment in self.bodies.segments():
+            os.replace(self.bodies.path(segment), self.bodies.path(segment) + ".migrated")
+
+    def close(self):
+        self.bodies.close()
@@ -0,0 +1,157 @@
+"""SQLite storage backend.
+
+Stores notes and tasks as rows in a local `pkms.db` so single-record writes are
+row-level upserts instead of whole-file rewrites. Records are exchanged with
+`StorageManager` as plain dicts, exactly like `JSONBackend`.
+"""
+from __future__ import annotations
+import json
+import os
+import sqlite3
+from dataclasses import fields
+from typing import List, Optional, Dict, Any, Iterable, Iterator
+from .models import Note, Task
+from .locking import FileLock, kind_locks
+from .storage import KINDS, StorageError, _stat_signature
+
+
+_COLUMNS = {
+    "notes": tuple(f.name for f in fields(Note)),
+    "tasks": tuple(f.name for f in fields(Task)),
+}
+# Columns holding lists are stored as JSON text
+_JSON_COLUMNS = {"tags"}
+
+
+class SQLiteBackend:
+    name = "sqlite"
+
+    def __init__(self, data_dir: str):
+        self.data_dir = data_dir
+        self.path = os.path.join(data_dir, "pkms.db")
+        self.locks = kind_locks(data_dir, KINDS)
+        try:
+            # Writers mostly queue on the kind lock; the timeout covers the rest.
+            # Group commit writes from its own thread, serialized by its lock
+            self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            with self.conn:
+                for kind, cols in _COLUMNS.items():
+                    defs = ", ".join(f"{c} TEXT PRIMARY KEY" if c == "id" else f"{c} TEXT" for c in cols)
+                    self.conn.execute(f"CREATE TABLE IF NOT EXISTS {kind} ({defs})")
+        except sqlite3.Error as exc:
+            raise StorageError(f"Failed to open SQLite database {self.path}: {exc}")
+
+    def _to_params(self, kind: str, row: Dict[str, Any]) -> tuple:
+        values = []
+        for c in _COLUMNS[kind]:
+            v = row.get(c)
+            if c in _JSON_COLUMNS:
+                v = json.dumps(v if v is not None else [], ensure_ascii=False)
+            values.append(v)
+        return tuple(values)
+
+    def _to_row(self, kind: str, values) -> Dict[str, Any]:
+        row = dict(zip(_COLUMNS[kind], values))
+        for c in _JSON_COLUMNS:
+            if c in row:
+                row[c] = json.loads(row[c]) if row[c] else []
+        return row
+
+    def _upsert_sql(self, kind: str) -> str:
+        cols = _COLUMNS[kind]
+        updates = ", ".join(f"{c}=excluded.{c}" for c in cols if c != "id")
+        return (
+            f"INSERT INTO {kind} ({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)}) "
+            f"ON CONFLICT(id) DO UPDATE SET {updates}"
+        )
+
+    def signature(self, kind: str) -> tuple:
+        # Commits by other connections land in the WAL first, then the main file
+        return _stat_signature([self.path, self.path + "-wal"])
+
+    def lock(self, kind: str) -> FileLock:
+        return self.locks[kind]
+
+    def generation(self, kind: str) -> int:
+        return self.locks[kind].generation()
+
+    def load(self, kind: str) -> List[Dict[str, Any]]:
+        # rowid order keeps records in insertion order, like the JSON files
+        cur = self.conn.execute(f"SELECT {', '.join(_COLUMNS[kind])} FROM {kind} ORDER BY rowid")
+        return [self._to_row(kind, r) for r in cur]
+
+    def iter_load(self, kind: str) -> Iterator[Dict[str, Any]]:
+        # Rows are fetched from the cursor as the caller consumes them
+        cur = self.conn.execute(f"SELECT {', '.join(_COLUMNS[kind])} FROM {kind} ORDER BY rowid")
+        for r in cur:
+            yield self._to_row(kind, r)
+
+    def save(self, kind: str, rows: Iterable[Dict[str, Any]]):
+        try:
+            with self.locks[kind].writing(), self.conn:
+                self.conn.execute(f"DELETE FROM {kind}")
+                self.conn.executemany(self._upsert_sql(kind), (self._to_params(kind, r) for r in rows))
+        except sqlite3.Error as exc:
+            raise StorageError(f"Failed to write {kind} to {self.path}: {exc}")
+
+    def get(self, kind: str, record_id: str) -> Optional[Dict[str, Any]]:
+        cur = self.conn.execute(f"SELECT {', '.join(_COLUMNS[kind])} FROM {kind} WHERE id = ?", (record_id,))
+        r = cur.fetchone()
+        return self._to_row(kind, r) if r is not None else None
+
+    def get_many(self, kind: str, record_ids) -> List[Dict[str, Any]]:
+        ids = list(record_ids)
+        rows = []
+        # Stay below SQLite's bound-parameter limit
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            cur = self.conn.execute(
+                f"SELECT rowid, {', '.join(_COLUMNS[kind])} FROM {kind} WHERE id IN ({', '.join('?' for _ in chunk)})",
+                chunk,
+            )
+            rows.extend(cur)
+        rows.sort(key=lambda r: r[0])
+        return [self._to_row(kind, r[1:]) for r in rows]
+
+    def apply(self, kind: str, puts: List[Dict[str, Any]], deletes: List[str]) -> set:
+        """Upsert `puts` and remove `deletes` in one transaction. Returns the ids removed."""
+        try:
+            with self.locks[kind].writing(), self.conn:
+                self.conn.executemany(self._upsert_sql(kind), (self._to_params(kind, r) for r in puts))
+                gone = set()
+                for i in range(0, len(deletes), 500):
+                    chunk = deletes[i:i + 500]
+                    marks = ", ".join("?" for _ in chunk)
+                    gone.update(r[0] for r in self.conn.execute(f"SELECT id FROM {kind} WHERE id IN ({marks})", chunk))
+                    self.conn.execute(f"DELETE FROM {kind} WHERE id IN ({marks})", chunk)
+        except sqlite3.Error as exc:
+            raise StorageError(f"Failed to write {kind} to {self.path}: {exc}")
+        return gone
+
+    def extend(self, kind: str, rows: Iterable[Dict[str, Any]]) -> int:
+        """Insert records with ids not yet stored, in one transaction. Returns how many."""
+        before = self.conn.total_changes
+        try:
+            with self.locks[kind].writing(), self.conn:
+                self.conn.executemany(self._upsert_sql(kind), (self._to_params(kind, r) for r in rows))
+        except sqlite3.Error as exc:
+            raise StorageError(f"Failed to write {kind} to {self.path}: {exc}")
+        return self.conn.total_changes - before
+
+    def put(self, kind: str, row: Dict[str, Any]):
+        self.apply(kind, [row], [])
+
+    def delete(self, kind: str, record_id: str) -> bool:
+        return bool(self.apply(kind, [], [record_id]))
+
+    def retire(self):
+        self.close()
+        for suffix in ("", "-wal", "-shm"):
+            path = self.path + suffix
+            if os.path.exists(path):
+                os.replace(path, path + ".migrated")
+
+    def close(self):
+        self.conn.close()
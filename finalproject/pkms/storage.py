@@ -1,11 +1,35 @@
+import heapq
+import itertools
 import json
 import os
 import tempfile
-from typing import List, Optional, Dict, Any
+from contextlib import contextmanager
+from typing import List, Optional, Dict, Any, Iterable, Iterator
+from dataclasses import replace
+from .locking import FileLock, kind_locks
 from .models import Note, Task
+from .offsets import OffsetIndex, iter_records, write_index, write_records
 from datetime import datetime, timezone
 
 
+KINDS = ("notes", "tasks")
+_MODELS = {"notes": Note, "tasks": Task}
+# Attempts of an optimistic update before giving up under contention
+_UPDATE_RETRIES = 50
+
+
+def _stat_signature(paths: List[str]) -> tuple:
+    """Cheap change detector for a set of files: (inode, size, mtime) of each."""
+    sig = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            sig.append((st.st_ino, st.st_size, st.st_mtime_ns))
+        except FileNotFoundError:
+            sig.append(None)
+    return tuple(sig)
+
+
 def default_data_dir() -> str:
     """Return a sensible cross-platform user data directory for the application."""
     home = os.path.expanduser("~")
@@ -20,12 +44,35 @@ class StorageError(Exception):
     pass
 
 
-class StorageManager:
-    def __init__(self, data_dir: Optional[str] = None):
-        self.data_dir = data_dir or default_data_dir()
-        os.makedirs(self.data_dir, exist_ok=True)
-        self.notes_path = os.path.join(self.data_dir, "notes.json")
-        self.tasks_path = os.path.join(self.data_dir, "tasks.json")
+def _merge_rows(rows: List[Dict[str, Any]], puts: List[Dict[str, Any]], deletes: List[str]):
+    """Upsert `puts` into `rows` (in place, keeping order) and drop `deletes`; returns (rows, ids removed)."""
+    positions = {r.get("id"): i for i, r in enumerate(rows)}
+    for row in puts:
+        i = positions.get(row["id"])
+        if i is None:
+            positions[row["id"]] = len(rows)
+            rows.append(row)
+        else:
+            rows[i] = row
+    gone = set(deletes) & positions.keys()
+    if gone:
+        rows = [r for r in rows if r.get("id") not in gone]
+    return rows, gone
+
+
+class JSONBackend:
+    """Original storage format: one JSON array per record kind.
+
+    Every mutation reads and rewrites the whole file, so this backend is only
+    suitable for small stores. Records are exchanged as plain dicts.
+    """
+
+    name = "json"
+
+    def __init__(self, data_dir: str):
+        self.data_dir = data_dir
+        self.paths = {kind: os.path.join(data_dir, f"{kind}.json") for kind in KINDS}
+        self.locks = kind_locks(data_dir, KINDS)
 
     def _read_file(self, path: str) -> List[Dict[str, Any]]:
         if not os.path.exists(path):
@@ -36,11 +83,13 @@ class StorageManager:
         except Exception as exc:
             raise StorageError(f"Failed to read JSON from {path}: {exc}")
 
-    def _atomic_write(self, path: str, data: List[Dict[str, Any]]):
+    def _atomic_write(self, path: str, data: Iterable[Dict[str, Any]]):
         tmpfd, tmppath = tempfile.mkstemp(dir=self.data_dir)
         try:
-            with os.fdopen(tmpfd, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            with os.fdopen(tmpfd, "wb") as f:
+                entries = write_records(f, data)
+            # The index describes the temp file, which keeps its stat through the rename
+            write_index(path + ".idx", tmppath, entries)
             os.replace(tmppath, path)
         finally:
             if os.path.exists(tmppath):
@@ -49,127 +98,685 @@ class StorageManager:
                 except Exception:
                     pass
 
+    def exists(self) -> bool:
+        return any(os.path.exists(p) for p in self.paths.values())
+
+    def signature(self, kind: str) -> tuple:
+        return _stat_signature([self.paths[kind]])
+
+    def lock(self, kind: str) -> FileLock:
+        """Cross-process lock serializing writes of `kind` (see pkms.locking)."""
+        return self.locks[kind]
+
+    def generation(self, kind: str) -> int:
+        return self.locks[kind].generation()
+
+    def load(self, kind: str) -> List[Dict[str, Any]]:
+        return self._read_file(self.paths[kind])
+
+    def iter_load(self, kind: str) -> Iterator[Dict[str, Any]]:
+        """Stream the records of `kind` without holding them all in memory."""
+        path = self.paths[kind]
+        try:
+            yield from iter_records(path)
+        except ValueError as exc:
+            raise StorageError(f"Failed to read JSON from {path}: {exc}")
+
+    def save(self, kind: str, rows: Iterable[Dict[str, Any]]):
+        with self.locks[kind].writing():
+            self._atomic_write(self.paths[kind], rows)
+
+    def extend(self, kind: str, rows: Iterable[Dict[str, Any]]) -> int:
+        """Append records with ids not yet stored, streaming. Returns how many were written."""
+        written = 0
+
+        def fresh():
+            nonlocal written
+            for row in rows:
+                written += 1
+                yield row
+        # The old file stays readable until the rewritten one is renamed over it
+        with self.locks[kind].writing():
+            self._atomic_write(self.paths[kind], itertools.chain(self.iter_load(kind), fresh()))
+        return written
+
+    def get(self, kind: str, record_id: str) -> Optional[Dict[str, Any]]:
+        rows = self.get_many(kind, [record_id])
+        return rows[0] if rows else None
+
+    def get_many(self, kind: str, record_ids) -> List[Dict[str, Any]]:
+        wanted = set(record_ids)
+        index = OffsetIndex.open(self.paths[kind])
+        rows = index.read_many(wanted) if index is not None else None
+        if rows is not None:
+            return rows
+        # Files written before the index existed, or replaced while reading: parse it all
+        return [row for row in self.load(kind) if row.get("id") in wanted]
+
+    def apply(self, kind: str, puts: List[Dict[str, Any]], deletes: List[str]) -> set:
+        """Upsert `puts` and remove `deletes` in one rewrite. Returns the ids removed."""
+        # Locked from the read on, so a concurrent writer cannot slip in between
+        with self.locks[kind]:
+            rows, gone = _merge_rows(self.load(kind), puts, deletes)
+            if puts or gone:
+                self.save(kind, rows)
+        return gone
+
+    def put(self, kind: str, row: Dict[str, Any]):
+        self.apply(kind, [row], [])
+
+    def delete(self, kind: str, record_id: str) -> bool:
+        return bool(self.apply(kind, [], [record_id]))
+
+    def retire(self):
+        # Move the files aside after a migration so detection no longer picks them
+        for path in self.paths.values():
+            if os.path.exists(path):
+                os.replace(path, path + ".migrated")
+            if os.path.exists(path + ".idx"):
+                os.remove(path + ".idx")
+
+    def close(self):
+        pass
+
+
+BACKENDS = ("json", "journal", "sqlite", "split", "sharded")
+
+
+def open_backend(name: str, data_dir: str):
+    if name == "json":
+        return JSONBackend(data_dir)
+    if name == "journal":
+        from .journal import JournalBackend
+        return JournalBackend(data_dir)
+    if name == "sqlite":
+        from .sqlite_backend import SQLiteBackend
+        return SQLiteBackend(data_dir)
+    if name == "split":
+        from .split_backend import SplitBackend
+        return SplitBackend(data_dir)
+    if name == "sharded":
+        from .sharded_backend import ShardedBackend
+        return ShardedBackend(data_dir)
+    raise StorageError(f"Unknown storage backend: {name}")
+
+
+def detect_backend(data_dir: str) -> str:
+    """Guess the backend of an existing data directory.
+
+    JSON files win over a database so a half-finished migration never hides data.
+    """
+    env = os.getenv("PKMS_BACKEND")
+    if env:
+        return env
+    if JSONBackend(data_dir).exists():
+        return "json"
+    if open_backend("journal", data_dir).exists():
+        return "journal"
+    if open_backend("split", data_dir).exists():
+        return "split"
+    if open_backend("sharded", data_dir).exists():
+        return "sharded"
+    if os.path.exists(os.path.join(data_dir, "pkms.db")):
+        return "sqlite"
+    return "json"
+
+
+def migrate(data_dir: str, target: str, source: Optional[str] = None) -> Dict[str, int]:
+    """Copy every record from the `source` backend into `target` in one shot.
+
+    The source files are renamed with a `.migrated` suffix afterwards, so the
+    data directory is detected as `target` from then on. Returns record counts.
+    """
+    source = source or detect_backend(data_dir)
+    if source == target:
+        raise StorageError(f"Data directory already uses the {target} backend")
+    src = open_backend(source, data_dir)
+    dst = open_backend(target, data_dir)
+    try:
+        if any(dst.load(kind) for kind in KINDS):
+            raise StorageError(f"Target {target} backend already holds data")
+        counts = {}
+        for kind in KINDS:
+            rows = src.load(kind)
+            dst.save(kind, rows)
+            counts[kind] = len(rows)
+        src.retire()
+        return counts
+    finally:
+        src.close()
+        dst.close()
+
+
+MATCH_MODES = ("phrase", "all", "any")
+
+
+def _text_matches(hay: str, q: str, words: List[str], match: str) -> bool:
+    if match == "phrase" or not words:
+        return q in hay
+    if match == "all":
+        return all(w in hay for w in words)
+    return any(w in hay for w in words)
+
+
+class StorageManager:
+    """Notes and tasks on top of a storage backend, plus search indexes.
+
+    With `cache=True` the manager keeps parsed records in memory between
+    calls, which makes repeated reads in a long-lived process nearly free.
+    Cached records are shared: treat objects returned by `list_*` as read-only
+    and change them through `update_*`.
+
+    Several processes may use one data directory: writes are serialized by
+    per-kind lock files, and `update_*` retries when another process wrote
+    between its read and its write (see pkms.locking).
+    """
+
+    def __init__(self, data_dir: Optional[str] = None, backend: Optional[str] = None, cache: bool = False):
+        self.data_dir = data_dir or default_data_dir()
+        os.makedirs(self.data_dir, exist_ok=True)
+        self.notes_path = os.path.join(self.data_dir, "notes.json")
+        self.tasks_path = os.path.join(self.data_dir, "tasks.json")
+        self.backend = open_backend(backend or detect_backend(self.data_dir), self.data_dir)
+        from .index import SearchIndex, TagIndex
+        # Index logs are appended alongside note writes, under the same lock
+        self.index = SearchIndex(self.data_dir, lock=self.backend.lock("notes"))
+        self.tag_index = TagIndex(self.data_dir, lock=self.backend.lock("notes"))
+        # Opt-in: kind -> (backend signature, {id: record}) of the last load
+        self.cache = cache
+        self._cache: Dict[str, Any] = {kind: None for kind in KINDS}
+        self._pending: Optional[Dict[str, Dict[str, Any]]] = None
+        # Inside batch(): kind -> {id: record} replacing all stored records (save_*)
+        self._replaced: Dict[str, Dict[str, Any]] = {}
+
+    def close(self):
+        self.index.close()
+        self.backend.close()
+
+    def compact(self, force: bool = False) -> List[str]:
+        """Fold journals larger than the backend threshold (or all, with `force`).
+
+        Returns the record kinds that were compacted; a no-op for backends
+        without a journal.
+        """
+        if not hasattr(self.backend, "compact"):
+            return []
+        done = []
+        for kind in KINDS:
+            size = self.backend.journal_size(kind)
+            if size and (force or size >= self.backend.compact_bytes):
+                self.backend.compact(kind)
+                done.append(kind)
+        return done
+
+    # Record access shared by notes and tasks. With `cache` enabled, parsed
+    # records are kept and only re-read when the backend files change on disk
+    # (size, mtime or inode), e.g. because another process wrote to them.
+    # Inside batch(), writes are collected in `_pending` (id -> record, or None
+    # for a delete) and reads see them layered over the stored records, or
+    # over the records a save_* in the batch replaces them with (`_replaced`).
+    def _cached(self, kind: str) -> Optional[Dict[str, Any]]:
+        entry = self._cache[kind]
+        if entry is not None and entry[0] == self.backend.signature(kind):
+            return entry[1]
+        return None
+
+    # A backend may build records itself (`records`/`records_many`, e.g. notes
+    # whose bodies are read lazily) and encode them back (`encode`); the
+    # others exchange plain dicts.
+    def _load(self, kind: str) -> list:
+        if hasattr(self.backend, "records"):
+            return self.backend.records(kind)
+        from_dict = _MODELS[kind].from_dict
+        return [from_dict(d) for d in self.backend.load(kind)]
+
+    def _load_many(self, kind: str, record_ids) -> list:
+        if hasattr(self.backend, "records_many"):
+            return self.backend.records_many(kind, record_ids)
+        from_dict = _MODELS[kind].from_dict
+        return [from_dict(d) for d in self.backend.get_many(kind, record_ids)]
+
+    def _rows(self, kind: str, records) -> List[Dict[str, Any]]:
+        encode = getattr(self.backend, "encode", None)
+        if encode is not None:
+            return [encode(kind, r) for r in records]
+        return [r.to_dict() for r in records]
+
+    def _records(self, kind: str) -> Dict[str, Any]:
+        records = self._cached(kind) if self.cache else None
+        if records is None:
+            sig = self.backend.signature(kind) if self.cache else None
+            records = {r.id: r for r in self._load(kind)}
+            if self.cache:
+                self._cache[kind] = (sig, records)
+        return records
+
+    def _overlay(self, kind: str, records: list, only=None) -> list:
+        ops = self._pending[kind] if self._pending is not None else None
+        if not ops:
+            return records
+        merged = {r.id: r for r in records}
+        for record_id, r in ops.items():
+            if only is not None and record_id not in only:
+                continue
+            if r is None:
+                merged.pop(record_id, None)
+            else:
+                merged[record_id] = r
+        return list(merged.values())
+
+    def _all(self, kind: str) -> list:
+        if kind in self._replaced:
+            records = list(self._replaced[kind].values())
+        elif not self.cache:
+            records = self._load(kind)
+        else:
+            records = list(self._records(kind).values())
+        return self._overlay(kind, records)
+
+    def _get(self, kind: str, record_id: str):
+        if self._pending is not None and record_id in self._pending[kind]:
+            return self._pending[kind][record_id]
+        if kind in self._replaced:
+            return self._replaced[kind].get(record_id)
+        if self.cache:
+            return self._records(kind).get(record_id)
+        found = self._load_many(kind, [record_id])
+        return found[0] if found else None
+
+    def _get_many(self, kind: str, record_ids) -> list:
+        wanted = set(record_ids)
+        if kind in self._replaced:
+            records = [r for r in self._replaced[kind].values() if r.id in wanted]
+        elif self.cache:
+            records = [r for r in self._records(kind).values() if r.id in wanted]
+        else:
+            records = self._load_many(kind, wanted)
+        return self._overlay(kind, records, only=wanted)
+
+    def _write(self, kind: str, write, mutate):
+        """Run a backend write, then apply `mutate` to the cache if it was current.
+
+        The kind's lock is held from the currency check to the re-stat, so no
+        other writer can land in between and have its change hidden by the
+        cache (the lock is reentrant; callers usually hold it already).
+        """
+        with self.backend.lock(kind):
+            records = self._cached(kind) if self.cache else None
+            result = write()
+            if records is not None:
+                mutate(records)
+                self._cache[kind] = (self.backend.signature(kind), records)
+            else:
+                self._cache[kind] = None
+        return result
+
+    def _save(self, kind: str, records: list):
+        if self._pending is not None:
+            # Replaces everything, including what the batch queued so far;
+            # written at commit like the rest of the batch
+            self._pending[kind].clear()
+            self._replaced[kind] = {r.id: r for r in records}
+            return
+
+        def mutate(cached):
+            cached.clear()
+            cached.update((r.id, r) for r in records)
+        with self.backend.lock(kind):
+            rows = self._rows(kind, records)
+            self._write(kind, lambda: self.backend.save(kind, rows), mutate)
+            if kind == "notes":
+                for index in (self.index, self.tag_index):
+                    if index.exists():
+                        index.rebuild(records)
+
+    def _apply(self, kind: str, puts: list, deletes: List[str]) -> set:
+        def mutate(cached):
+            for r in puts:
+                cached[r.id] = r
+            for record_id in deletes:
+                cached.pop(record_id, None)
+        with self.backend.lock(kind):
+            gone = self._write(kind, lambda: self.backend.apply(kind, self._rows(kind, puts), deletes), mutate)
+            if kind == "notes":
+                for index in (self.index, self.tag_index):
+                    index.update(puts)
+                    index.remove(gone)
+        return gone
+
+    def _put(self, kind: str, record):
+        if self._pending is not None:
+            self._pending[kind][record.id] = record
+        else:
+            self._apply(kind, [record], [])
+
+    def _delete(self, kind: str, record_id: str) -> bool:
+        if self._pending is not None:
+            if self._get(kind, record_id) is None:
+                return False
+            self._pending[kind][record_id] = None
+            return True
+        return bool(self._apply(kind, [], [record_id]))
+
+    def _update(self, kind: str, record_id: str, changes: Dict[str, Any]):
+        # Optimistic: read without the lock, then write only if no other
+        # writer committed in between (same generation); otherwise re-read
+        for _ in range(_UPDATE_RETRIES):
+            generation = self.backend.generation(kind)
+            current = self._get(kind, record_id)
+            if current is None:
+                raise StorageError(f"{_MODELS[kind].__name__} not found")
+            # Copy so a failed write never leaves a half-updated record in the cache
+            # (LazyNote.copy keeps an unread body unread)
+            r = current.copy() if hasattr(current, "copy") else replace(current)
+            for k, v in changes.items():
+                if hasattr(r, k):
+                    setattr(r, k, v)
+            r.updated_at = datetime.now(timezone.utc).astimezone(timezone.utc).isoformat().replace('+00:00', 'Z')
+            if self._pending is not None:
+                self._put(kind, r)
+                return r
+            with self.backend.lock(kind):
+                if self.backend.generation(kind) == generation:
+                    self._put(kind, r)
+                    return r
+        raise StorageError(f"Gave up updating {record_id}: too many concurrent writers")
+
+    @contextmanager
+    def batch(self):
+        """Group mutations and commit them with one atomic write per record kind.
+
+        Inside the block, reads through this manager see the pending changes
+        (search indexes are only updated at commit). If the block raises,
+        nothing is written. Nested batches join the outermost one.
+        """
+        if self._pending is not None:
+            yield self
+            return
+        self._pending = {kind: {} for kind in KINDS}
+        self._replaced = {}
+        try:
+            yield self
+            pending, replaced = self._pending, self._replaced
+        finally:
+            self._pending, self._replaced = None, {}
+        for kind, ops in pending.items():
+            if kind in replaced:
+                merged = dict(replaced[kind])
+                for record_id, r in ops.items():
+                    if r is None:
+                        merged.pop(record_id, None)
+                    else:
+                        merged[record_id] = r
+                self._save(kind, list(merged.values()))
+            elif ops:
+                puts = [r for r in ops.values() if r is not None]
+                self._apply(kind, puts, [i for i, r in ops.items() if r is None])
+
+    def columns(self, kind: str):
+        """Committed `kind` records as a pkms.columnar.Columns (a compact, read-only collection)."""
+        from .columnar import Columns
+        if kind not in KINDS:
+            raise StorageError(f"Unknown record kind: {kind}")
+        return Columns(_MODELS[kind], self.backend.iter_load(kind))
+
+    def group_commit(self, window: float = 0.01, max_records: int = 1000):
+        """Return a GroupCommitter: writes queued and committed in groups (see pkms.groupcommit)."""
+        from .groupcommit import GroupCommitter
+        return GroupCommitter(self, window=window, max_records=max_records)
+
     # Notes operations
     def list_notes(self) -> List[Note]:
-        raw = self._read_file(self.notes_path)
-        return [Note.from_dict(d) for d in raw]
+        return self._all("notes")
 
     def save_notes(self, notes: List[Note]):
-        self._atomic_write(self.notes_path, [n.to_dict() for n in notes])
+        self._save("notes", notes)
 
     def add_note(self, note: Note) -> Note:
-        notes = self.list_notes()
-        notes.append(note)
-        self.save_notes(notes)
+        self._put("notes", note)
         return note
 
+    def add_notes(self, notes: Iterable[Note]) -> List[Note]:
+        with self.batch():
+            return [self.add_note(n) for n in notes]
+
     def update_note(self, note_id: str, **changes) -> Note:
-        notes = self.list_notes()
-        found = False
-        for n in notes:
-            if n.id == note_id:
-                for k, v in changes.items():
-                    if hasattr(n, k):
-                        setattr(n, k, v)
-                n.updated_at = datetime.now(timezone.utc).astimezone(timezone.utc).isoformat().replace('+00:00', 'Z')
-                found = True
-                updated = n
-                break
-        if not found:
-            raise StorageError("Note not found")
-        self.save_notes(notes)
-        return updated
+        return self._update("notes", note_id, changes)
+
+    def update_notes(self, changes: Dict[str, Dict[str, Any]]) -> List[Note]:
+        """Apply `{note_id: {field: value}}` in one write; fails as a whole on a missing id."""
+        with self.batch():
+            return [self.update_note(note_id, **c) for note_id, c in changes.items()]
+
+    def get_note(self, note_id: str) -> Optional[Note]:
+        """Look up one note by id without loading the whole store."""
+        return self._get("notes", note_id)
 
     def delete_note(self, note_id: str) -> None:
-        notes = self.list_notes()
-        notes = [n for n in notes if n.id != note_id]
-        self.save_notes(notes)
+        self._delete("notes", note_id)
+
+    def delete_notes(self, note_ids: Iterable[str]) -> int:
+        """Delete several notes in one write; returns how many existed."""
+        with self.batch():
+            return sum(self._delete("notes", i) for i in note_ids)
+
+    def rebuild_index(self) -> int:
+        # Locked throughout: a note written between the read and the index
+        # write would otherwise be missing from the new index
+        with self.backend.lock("notes"):
+            notes = self.list_notes()
+            self.index.rebuild(notes)
+            self.tag_index.rebuild(notes)
+        return len(notes)
+
+    def _tagged_ids(self, tags: List[str], match: str) -> List[str]:
+        if not self.tag_index.load():
+            with self.backend.lock("notes"):
+                self.tag_index.rebuild(self.list_notes())
+        return self.tag_index.lookup(tags, match=match)
+
+    def list_notes_by_tags(self, tags: List[str], match: str = "all") -> List[Note]:
+        """Notes carrying all (match="all") or any (match="any") of `tags`.
+
+        Answered from the tag index; only the matching notes are loaded.
+        """
+        ids = self._tagged_ids(tags, match)
+        if not ids:
+            return []
+        return self._get_many("notes", ids)
 
-    def search_notes(self, query: str, tag: Optional[str] = None) -> List[Note]:
+    def search_notes(self, query: str, tag: Optional[str] = None, match: str = "phrase",
+                     limit: Optional[int] = None, ranked: bool = False,
+                     tags: Optional[List[str]] = None, tag_match: str = "all") -> List[Note]:
+        """Find notes whose title, body or tags contain `query` (case-insensitive).
+
+        `match` is "phrase" (the whole query as one substring), "all" (every
+        query word) or "any" (at least one word). The inverted index narrows
+        the search to candidate notes, which are then verified against their text.
+        With `ranked`, hits come best first by BM25 score (title and tag hits
+        weigh more than body hits), and a query without words (e.g. "!!")
+        has none; `limit` caps the number of results.
+        `tag`/`tags` restrict hits to notes with all (or, with tag_match="any",
+        some) of the tags; the tag index is intersected with the text
+        candidates before any note is loaded.
+        """
+        from .index import note_text, tokenize
+        if match not in MATCH_MODES:
+            raise StorageError(f"Unknown match mode: {match}")
         q = query.lower().strip()
-        results = []
-        for n in self.list_notes():
-            hay = " ".join([n.title, n.body, " ".join(n.tags)]).lower()
-            if q in hay:
-                if tag:
-                    if tag in n.tags:
-                        results.append(n)
-                else:
-                    results.append(n)
-        return results
+        words = tokenize(q)
+        if ranked and not words:
+            # Nothing to score against: an unranked list of every note is not a ranking
+            return []
+        if not self.index.load():
+            self.rebuild_index()
+        ids = self.index.candidates(q, match="any" if match == "any" else "all")
+        tags = list(tags or []) + ([tag] if tag else [])
+        if tags:
+            tagged = set(self._tagged_ids(tags, tag_match))
+            ids = tagged if ids is None else ids & tagged
+        has_tags = any if tag_match == "any" else all
+        scan = getattr(self.backend, "scan", None)
+
+        def verified(notes):
+            if tags:
+                notes = (n for n in notes if has_tags(t in n.tags for t in tags))
+            if scan is not None:
+                # The backend may rule notes out without reading their bodies
+                notes = scan(notes, q, words, match)
+            for n in notes:
+                if _text_matches(note_text(n).lower(), q, words, match):
+                    yield n
+
+        if ids is None:
+            notes = self.list_notes()
+        elif ranked:
+            return self._ranked(q, ids, verified, limit)
+        elif not ids:
+            notes = []
+        else:
+            notes = self._get_many("notes", ids)
+        return list(itertools.islice(verified(notes), limit))
+
+    def _ranked(self, q: str, ids, verified, limit: Optional[int]) -> List[Note]:
+        # Heapify all candidate scores (O(n)) and pop best-first until `limit`
+        # candidates survive verification, loading notes one slice at a time.
+        heap = [(-score, note_id) for note_id, score in self.index.scores(q, ids).items()]
+        heapq.heapify(heap)
+        want = limit if limit is not None else len(heap)
+        results: List[Note] = []
+        while heap and len(results) < want:
+            chunk = [heapq.heappop(heap) for _ in range(min(len(heap), max(want - len(results), 16)))]
+            found = {n.id: n for n in self._get_many("notes", [i for _, i in chunk])}
+            ordered = [found[i] for _, i in chunk if i in found]
+            results.extend(verified(ordered))
+        return results[:want]
 
     # Tasks operations
     def list_tasks(self) -> List[Task]:
-        raw = self._read_file(self.tasks_path)
-        return [Task.from_dict(d) for d in raw]
+        return self._all("tasks")
 
     def save_tasks(self, tasks: List[Task]):
-        self._atomic_write(self.tasks_path, [t.to_dict() for t in tasks])
+        self._save("tasks", tasks)
 
     def add_task(self, task: Task) -> Task:
-        tasks = self.list_tasks()
-        tasks.append(task)
-        self.save_tasks(tasks)
+        self._put("tasks", task)
         return task
 
+    def add_tasks(self, tasks: Iterable[Task]) -> List[Task]:
+        with self.batch():
+            return [self.add_task(t) for t in tasks]
+
     def update_task(self, task_id: str, **changes) -> Task:
-        tasks = self.list_tasks()
-        found = False
-        for t in tasks:
-            if t.id == task_id:
-                for k, v in changes.items():
-                    if hasattr(t, k):
-                        setattr(t, k, v)
-                t.updated_at = datetime.now(timezone.utc).astimezone(timezone.utc).isoformat().replace('+00:00', 'Z')
-                found = True
-                updated = t
-                break
-        if not found:
-            raise StorageError("Task not found")
-        self.save_tasks(tasks)
-        return updated
+        return self._update("tasks", task_id, changes)
+
+    def update_tasks(self, changes: Dict[str, Dict[str, Any]]) -> List[Task]:
+        """Apply `{task_id: {field: value}}` in one write; fails as a whole on a missing id."""
+        with self.batch():
+            return [self.update_task(task_id, **c) for task_id, c in changes.items()]
+
+    def get_task(self, task_id: str) -> Optional[Task]:
+        """Look up one task by id without loading the whole store."""
+        return self._get("tasks", task_id)
 
     def delete_task(self, task_id: str) -> None:
-        tasks = self.list_tasks()
-        tasks = [t for t in tasks if t.id != task_id]
-        self.save_tasks(tasks)
+        self._delete("tasks", task_id)
+
+    def delete_tasks(self, task_ids: Iterable[str]) -> int:
+        """Delete several tasks in one write; returns how many existed."""
+        with self.batch():
+            return sum(self._delete("tasks", i) for i in task_ids)
 
     def mark_complete(self, task_id: str) -> Task:
         return self.update_task(task_id, status="done")
 
-    # Backup / restore helpers
-    def export(self, out_path: str) -> None:
-        data = {"notes": [n.to_dict() for n in self.list_notes()], "tasks": [t.to_dict() for t in self.list_tasks()]}
-        with open(out_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+    # Backup / restore helpers. Records are streamed between the backend and
+    # the backup file (see pkms.backup), so neither is held in memory whole.
+    def export(self, out_path: str, fmt: Optional[str] = None, progress=None) -> int:
+        """Write every note and task to `out_path`; returns the number of records.
+
+        `fmt` is "json" or "jsonl" (default: from the file extension);
+        `progress` is called with the running record count.
+        """
+        from .backup import write_backup
+        records = (
+            (kind, _MODELS[kind].from_dict(row).to_dict())
+            for kind in KINDS for row in self.backend.iter_load(kind)
+        )
+        return write_backup(out_path, records, fmt, progress)
 
-    def import_file(self, in_path: str, merge: bool = True) -> None:
-        with open(in_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+    def import_file(self, in_path: str, merge: bool = True, fmt: Optional[str] = None, progress=None) -> int:
+        """Load a backup; returns the number of records written.
+
+        With `merge`, records whose id is already stored are skipped and only
+        the set of stored ids is kept in memory. Otherwise the backup replaces
+        the store. `fmt` and `progress` are as for `export`.
+        """
+        from .backup import read_backup
+        seen: Dict[str, set] = {}
+        written = dict.fromkeys(KINDS, 0)
+        for kind, group in itertools.groupby(read_backup(in_path, fmt, progress), key=lambda r: r[0]):
+            if kind not in _MODELS:
+                for _ in group:
+                    pass
+                continue
+            if kind not in seen:
+                seen[kind] = {r.get("id") for r in self.backend.iter_load(kind)} if merge else set()
+                rows = self._fresh(kind, group, seen[kind])
+                written[kind] += self.backend.extend(kind, rows) if merge else self._replace(kind, rows)
+            else:
+                # The same kind again further down the file
+                written[kind] += self.backend.extend(kind, self._fresh(kind, group, seen[kind]))
         if not merge:
-            notes = [Note.from_dict(d) for d in data.get("notes", [])]
-            tasks = [Task.from_dict(d) for d in data.get("tasks", [])]
-        else:
-            existing_notes = {n.id: n for n in self.list_notes()}
-            existing_tasks = {t.id: t for t in self.list_tasks()}
-            notes = list(existing_notes.values())
-            for d in data.get("notes", []):
-                n = Note.from_dict(d)
-                if n.id not in existing_notes:
-                    notes.append(n)
-            tasks = list(existing_tasks.values())
-            for d in data.get("tasks", []):
-                t = Task.from_dict(d)
-                if t.id not in existing_tasks:
-                    tasks.append(t)
-        self.save_notes(notes)
-        self.save_tasks(tasks)
-
-    def repair_from_backup(self, backup_path: str) -> None:
+            for kind in KINDS:
+                if kind not in seen:
+                    self._replace(kind, iter(()))
+        self._invalidate(reindex=bool(written["notes"]) or not merge)
+        return sum(written.values())
+
+    def _invalidate(self, reindex: bool = True):
+        # After a bulk write that bypassed _write: forget cached records and,
+        # rather than updating them record by record, drop the indexes so the
+        # next query rebuilds them
+        for kind in KINDS:
+            self._cache[kind] = None
+        if reindex:
+            self.index.drop()
+            self.tag_index.drop()
+
+    @staticmethod
+    def _fresh(kind: str, group, seen: set) -> Iterator[Dict[str, Any]]:
+        # Normalised rows of `group` whose id was not seen yet
+        model = _MODELS[kind]
+        for _, row in group:
+            record = model.from_dict(row)
+            if record.id not in seen:
+                seen.add(record.id)
+                yield record.to_dict()
+
+    def _replace(self, kind: str, rows: Iterator[Dict[str, Any]]) -> int:
+        written = 0
+
+        def tally():
+            nonlocal written
+            for row in rows:
+                written += 1
+                yield row
+        self.backend.save(kind, tally())
+        return written
+
+    def repair_from_backup(self, backup_path: str, fmt: Optional[str] = None, progress=None) -> int:
         # Overwrite current files with backup; simple recovery strategy
-        with open(backup_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        notes = [Note.from_dict(d) for d in data.get("notes", [])]
-        tasks = [Task.from_dict(d) for d in data.get("tasks", [])]
-        self.save_notes(notes)
-        self.save_tasks(tasks)
+        return self.import_file(backup_path, merge=False, fmt=fmt, progress=progress)
+
+    def backup(self, backup_dir: str, full: bool = False, progress=None) -> Dict[str, Any]:
+        """Add an incremental backup to the chain in `backup_dir` (see pkms.incremental)."""
+        from .incremental import backup
+        return backup(self.backend, backup_dir, full=full, progress=progress)
+
+    def restore(self, backup_dir: str, upto: Optional[int] = None) -> Dict[str, int]:
+        """Replace the store with the state saved in `backup_dir`, replaying its delta chain."""
+        from .incremental import restore
+        counts = restore(self.backend, backup_dir, upto=upto)
+        self._invalidate()
+        return counts
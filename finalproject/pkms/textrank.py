@@ -0,0 +1,142 @@
+"""Extractive summaries by TextRank.
+
+Sentences are the nodes of a graph whose edges are the cosine similarities
+of their TF-IDF term vectors. PageRank over that graph, by power iteration,
+scores the sentences, and the best ones are kept in document order.
+
+The n x n similarity matrix is never built. With B the sentence x term
+matrix (rows normalized to unit length), the similarities are B Bᵀ minus its
+diagonal, so each iteration multiplies by Bᵀ and then by B: its cost is the
+number of (sentence, term) pairs, not n². NumPy does that with `bincount`
+when it is installed; otherwise plain Python computes the same scores.
+"""
+from __future__ import annotations
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Sequence, Tuple
+
+try:
+    import numpy
+except ImportError:  # optional
+    numpy = None
+
+DAMPING = 0.85
+_MAX_ITERATIONS = 100
+_TOLERANCE = 1e-6
+# Degrees below this are rounding noise: the sentence shares no terms
+_MIN_DEGREE = 1e-9
+
+_WORD = re.compile(r"[^\W\d_]{2,}")
+STOPWORDS = frozenset("""
+    a about above after again against all am an and any are as at be because been before being below between
+    both but by can could did do does doing down during each few for from further had has have having he her
+    here hers herself him himself his how i if in into is it its itself just me more most my myself no nor not
+    now of off on once only or other our ours ourselves out over own same she should so some such than that the
+    their theirs them themselves then there these they this those through to too under until up very was we
+    were what when where which while who whom why will with would you your yours yourself yourselves also
+    get got let may might must shall us
+""".split())
+
+# (sentence, term, weight) triples of the sparse matrix B
+_Matrix = Tuple[List[int], List[int], List[float], int]
+
+
+def _matrix(sentences: Sequence[str]) -> _Matrix:
+    docs = [[w for w in _WORD.findall(s.lower()) if w not in STOPWORDS] for s in sentences]
+    df: Counter = Counter()
+    for words in docs:
+        df.update(set(words))
+    n = len(docs)
+    idf = {t: math.log(1 + n / c) for t, c in df.items()}
+    vocab: Dict[str, int] = {}
+    rows: List[int] = []
+    cols: List[int] = []
+    vals: List[float] = []
+    for i, words in enumerate(docs):
+        weights = {t: c * idf[t] for t, c in Counter(words).items()}
+        norm = math.sqrt(sum(w * w for w in weights.values()))
+        for t, w in weights.items():
+            rows.append(i)
+            cols.append(vocab.setdefault(t, len(vocab)))
+            vals.append(w / norm)
+    return rows, cols, vals, len(vocab)
+
+
+def _pagerank_numpy(n: int, m: _Matrix) -> List[float]:
+    rows, cols, vals, terms = (numpy.asarray(m[0], dtype=numpy.intp), numpy.asarray(m[1], dtype=numpy.intp),
+                               numpy.asarray(m[2], dtype=float), m[3])
+    has_terms = numpy.bincount(rows, minlength=n) > 0
+
+    def similar(x):
+        t = numpy.bincount(cols, weights=vals * x[rows], minlength=terms)
+        return numpy.bincount(rows, weights=vals * t[cols], minlength=n) - has_terms * x
+
+    degree = similar(numpy.ones(n))
+    dangling = degree < _MIN_DEGREE
+    inverse = numpy.where(dangling, 0.0, 1.0 / numpy.where(dangling, 1.0, degree))
+    scores = numpy.full(n, 1.0 / n)
+    for _ in range(_MAX_ITERATIONS):
+        spread = similar(scores * inverse) + scores[dangling].sum() / n
+        new = (1 - DAMPING) / n + DAMPING * spread
+        done = numpy.abs(new - scores).sum() < _TOLERANCE
+        scores = new
+        if done:
+            break
+    return scores.tolist()
+
+
+def _pagerank_python(n: int, m: _Matrix) -> List[float]:
+    rows, cols, vals, terms = m
+    pairs = list(zip(rows, cols, vals))
+    has_terms = [False] * n
+    for r in rows:
+        has_terms[r] = True
+
+    def similar(x):
+        t = [0.0] * terms
+        for r, c, v in pairs:
+            t[c] += v * x[r]
+        y = [0.0] * n
+        for r, c, v in pairs:
+            y[r] += v * t[c]
+        return [y[i] - x[i] if has_terms[i] else 0.0 for i in range(n)]
+
+    degree = similar([1.0] * n)
+    inverse = [1.0 / d if d >= _MIN_DEGREE else 0.0 for d in degree]
+    dangling = [i for i in range(n) if degree[i] < _MIN_DEGREE]
+    scores = [1.0 / n] * n
+    for _ in range(_MAX_ITERATIONS):
+        spread = similar([s * inv for s, inv in zip(scores, inverse)])
+        leaked = sum(scores[i] for i in dangling) / n
+        new = [(1 - DAMPING) / n + DAMPING * (y + leaked) for y in spread]
+        done = sum(abs(a - b) for a, b in zip(new, scores)) < _TOLERANCE
+        scores = new
+        if done:
+            break
+    return scores
+
+
+def rank(sentences: Sequence[str]) -> List[float]:
+    """TextRank score of each sentence; the scores sum to 1."""
+    n = len(sentences)
+    if n == 0:
+        return []
+    m = _matrix(sentences)
+    return _pagerank_numpy(n, m) if numpy is not None else _pagerank_python(n, m)
+
+
+def top_sentences(sentences: Sequence[str], count: int) -> List[int]:
+    """Indexes of the `count` best-ranked sentences, in document order.
+
+    Ties go to the earlier sentence, so a text without shared terms
+    summarizes like its first sentences.
+    """
+    if count <= 0:
+        return []
+    if len(sentences) <= count:
+        return list(range(len(sentences)))
+    scores = rank(sentences)
+    # Round so that float noise between the two implementations can't reorder ties
+    best = sorted(range(len(scores)), key=lambda i: (-round(scores[i], 12), i))[:count]
+    return sorted(best)
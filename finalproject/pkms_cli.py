@@ -1,6 +1,12 @@
 #!/usr/bin/env python3
-from pkms import cli
+import sys
+from pkms import daemon
 
 
 if __name__ == "__main__":
-    raise SystemExit(cli.main())
+    # Hand the command to a running `pkms serve` before importing the rest
+    code = daemon.forward(sys.argv[1:])
+    if code is None:
+        from pkms import cli
+        code = cli.run(sys.argv[1:])
+    raise SystemExit(code)
@@ -13,3 +13,70 @@ def test_suggest_tasks_basic():
     suggestions = suggest_tasks(text, max_suggestions=5)
     assert isinstance(suggestions, list)
     assert any("write" in s["title"].lower() or "todo" in s["title"].lower() for s in suggestions)
+
+
+def test_textrank_keeps_central_sentences_in_order(monkeypatch):
+    import pytest
+    from pkms import textrank
+    text = ("Lunch was good. The budget plan needs more detail on hiring. Alice reviewed the budget plan. "
+            "The weather is nice. Hiring for the budget plan starts in May.")
+    assert summarize_text(text, max_sentences=2, method="textrank") == (
+        "The budget plan needs more detail on hiring. Hiring for the budget plan starts in May.")
+    # Nothing shared between sentences: same as the lead summary
+    assert summarize_text("Red fox. Blue sky. Green tea.", 2, method="textrank") == "Red fox. Blue sky."
+    with pytest.raises(ValueError):
+        summarize_text(text, method="magic")
+
+    sentences = [f"Sentence {i} mentions topic{i % 7} and topic{i % 3}." for i in range(200)] + ["..."]
+    scores = textrank.rank(sentences)
+    assert abs(sum(scores) - 1) < 1e-9
+    monkeypatch.setattr(textrank, "numpy", None)
+    assert textrank.rank(sentences) == pytest.approx(scores, abs=1e-12)
+
+
+def test_document_splits_once_for_every_analyzer():
+    import functools
+    from pkms.agent import run_analyzers
+    from pkms.sentences import Document
+    text = "  First one. Then WE should fix it!\nCall Bob?  Last  "
+    doc = Document(text)
+    long = Document("A b. " * 1000)
+    assert long[0] == "A b." and len(long.spans) < 10  # split only as far as asked
+    assert list(doc) == ["First one.", "Then WE should fix it!", "Call Bob?", "Last"]
+    assert [text[s:e] for s, e in doc.spans] == list(doc) and doc.stripped == text.strip()
+    assert doc.lower(1) == "then we should fix it!" and doc.words(2) == ["call", "bob?"]
+    assert doc[-1] == "Last" and list(Document("")) == [""]
+
+    results = run_analyzers(doc, {
+        "summary": functools.partial(summarize_text, max_sentences=1),
+        "tasks": suggest_tasks,
+        "count": len,
+    })
+    assert results["summary"] == "First one." and results["count"] == 4
+    assert [s["title"] for s in results["tasks"]] == ["Then WE should fix it!", "Call Bob?"]
+    assert results["tasks"] == suggest_tasks(text) and results["summary"] == summarize_text(text, 1)
+
+
+def test_streaming_agent_reads_chunks_only_as_needed(tmp_path):
+    import itertools
+    from pkms.agent import iter_suggestions, iter_summary
+    from pkms.sentences import SentenceStream, text_chunks
+    text = "  Intro here. We should fix the build!\nCall Bob about it. Write the report. " + "Filler words. " * 50
+    pieces = [text[i:i + 7] for i in range(0, len(text), 7)]
+    assert " ".join(iter_summary(pieces, 2)) == summarize_text(text, 2)
+    assert list(iter_suggestions(pieces, 5)) == suggest_tasks(text, 5)
+    assert list(iter_suggestions(["Nothing to do here. " * 10], 3)) == suggest_tasks("Nothing to do here. " * 10, 3)
+
+    taken = []
+    chunks = (taken.append(p) or p for p in itertools.chain(pieces, iter(lambda: "Endless text. ", None)))
+    assert [s["title"] for s in iter_suggestions(chunks, 2)] == ["We should fix the build!", "Call Bob about it."]
+    assert len(taken) < 10
+
+    # A sentence that never ends is cut into bounded pieces
+    cut = list(SentenceStream(("word " for _ in range(1000)), max_sentence_chars=64))
+    assert all(len(s) <= 64 for s in cut) and " ".join(cut).split() == ["word"] * 1000
+
+    path = tmp_path / "note.txt"
+    path.write_text("Grüße aus Köln. " * 100, encoding="utf-8")
+    with open(path, "rb") as f:
+        assert "".join(text_chunks(f, size=5)) == path.read_text(encoding="utf-8")
@@ -0,0 +1,111 @@
+from pkms import cli, pipeline
+from pkms.agent_cache import AgentCache, analyze, cache_key
+from pkms.models import Note
+from pkms.storage import StorageManager
+
+
+def _count_calls(monkeypatch):
+    real = pipeline.analyze_chunk
+    calls = []
+
+    def counting(chunk, *args):
+        calls.extend(note_id for note_id, _ in chunk)
+        return real(chunk, *args)
+    monkeypatch.setattr(pipeline, "analyze_chunk", counting)
+    return calls
+
+
+def test_results_are_reused_until_the_body_changes(tmp_path, monkeypatch):
+    data_dir = str(tmp_path / "data")
+    sm = StorageManager(data_dir)
+    notes = sm.add_notes([Note.create(f"N{i}", f"Note {i} opens here. We should fix item {i}.") for i in range(6)])
+    calls = _count_calls(monkeypatch)
+
+    counts = pipeline.summarize_all(sm, workers=1, chunk_size=4)
+    assert counts["cached"] == 0 and len(calls) == 6
+    counts = pipeline.summarize_all(sm, workers=1, chunk_size=4)
+    assert counts == {"summarized": 6, "cached": 6, "skipped": 0} and len(calls) == 6
+
+    # Only the edited note is analyzed again, and its old entry goes away
+    sm.update_note(notes[2].id, body="Rewritten. We need to ship it.")
+    cache = AgentCache(data_dir)
+    old_key = cache_key(notes[2].body, 2, 3)
+    assert cache.get(old_key) is not None
+    key, result = analyze(cache, notes[2].id, sm.get_note(notes[2].id).body, 2, 3)
+    assert calls[6:] == [notes[2].id] and result.summary.startswith("Rewritten.")
+    assert cache.get(old_key) is None and len(cache) == 6
+    cache.close()
+
+    # Different parameters make different keys
+    assert cache_key("x", 2, 3) != cache_key("x", 3, 3) != cache_key("x", 2, 4)
+    # A cached body shared by another note is answered under that note's id
+    dup = sm.add_note(Note.create("Dup", notes[0].body))
+    pipeline.summarize_all(sm, workers=1)
+    assert calls[7:] == []
+    assert {r.note_id for r in pipeline.AgentResultStore(data_dir).latest().values()} >= {dup.id}
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = AgentCache(str(tmp_path), max_entries=2)
+    keys = []
+    for i in range(3):
+        key, _ = analyze(cache, f"n{i}", f"Body {i}.", 2, 3)
+        keys.append(key)
+        if i == 1:
+            cache.get(keys[0])  # n0 is now used more recently than n1
+    assert len(cache) == 2
+    assert cache.get(keys[1]) is None and cache.get(keys[0]) is not None
+    cache.close()
+
+    (tmp_path / "small").mkdir()
+    cache = AgentCache(str(tmp_path / "small"), max_bytes=1)
+    analyze(cache, "n0", "Body.", 2, 3)
+    assert len(cache) == 0
+    cache.close()
+
+
+def test_summary_is_saved_once(tmp_path, monkeypatch, capsys):
+    data_dir = str(tmp_path / "data")
+    body = "".join(["This is a sentence. " for _ in range(50)])
+    cli.main(["--data-dir", data_dir, "add-note", "LongNote", body])
+    sm = StorageManager(data_dir)
+    nid = sm.list_notes()[0].id
+    calls = _count_calls(monkeypatch)
+
+    cli.main(["--data-dir", data_dir, "summarize-note", nid, "--save"])
+    cli.main(["--data-dir", data_dir, "summarize-note", nid, "--save"])
+    assert calls == [nid]
+    assert "Summary already saved as note:" in capsys.readouterr().out
+    assert len([n for n in sm.list_notes() if n.source == "agent"]) == 1
+
+    # --no-cache recomputes, and can't tell the summary was saved
+    cli.main(["--data-dir", data_dir, "summarize-note", nid, "--save", "--no-cache"])
+    assert calls == [nid, nid]
+    assert len([n for n in sm.list_notes() if n.source == "agent"]) == 2
+
+
+def test_saved_summary_belongs_to_its_note_and_parameters(tmp_path, capsys):
+    data_dir = str(tmp_path / "data")
+    body = "".join(f"Sentence {i} is here. " for i in range(20))
+    cli.main(["--data-dir", data_dir, "add-note", "A", body])
+    cli.main(["--data-dir", data_dir, "add-note", "B", body])
+    sm = StorageManager(data_dir)
+    ids = {n.title: n.id for n in sm.list_notes()}
+
+    def summaries():
+        return sorted(n.title for n in sm.list_notes() if n.source == "agent")
+
+    # Same body, different notes: each gets its own summary note
+    cli.main(["--data-dir", data_dir, "summarize-note", ids["A"], "--save"])
+    cli.main(["--data-dir", data_dir, "summarize-note", ids["B"], "--save"])
+    assert summaries() == ["Summary: A", "Summary: B"]
+
+    # Results for other parameters don't make the cache forget the saved summary
+    cli.main(["--data-dir", data_dir, "summarize-note", ids["A"], "--sentences", "3"])
+    capsys.readouterr()
+    cli.main(["--data-dir", data_dir, "summarize-note", ids["A"], "--save"])
+    assert "Summary already saved as note:" in capsys.readouterr().out
+    assert summaries() == ["Summary: A", "Summary: B"]
+    cache = AgentCache(data_dir)
+    assert cache.get(cache_key(body, 3, 3)) is not None
+    cache.close()
@@ -1,3 +1,4 @@
+import os
 from pkms import cli
 from pkms.storage import StorageManager
 
@@ -21,3 +22,52 @@ def test_summarize_and_save(tmp_path):
     tasks = sm.list_tasks()
     agent_tasks = [t for t in tasks if t.source == "agent"]
     assert len(agent_tasks) >= 1
+
+
+def test_summarize_all_resumes_from_checkpoint(tmp_path, monkeypatch, capsys):
+    from pkms import pipeline
+    from pkms.models import AgentResult, Note
+    from pkms.results import AgentResultStore
+    data_dir = str(tmp_path / "data")
+    sm = StorageManager(data_dir)
+    notes = sm.add_notes([Note.create(f"N{i}", f"Note {i} opens here. We should fix item {i}.") for i in range(10)])
+
+    # The first run dies after two chunks were stored
+    real = pipeline.analyze_chunk
+    calls = []
+
+    def flaky(chunk, *args):
+        calls.append(len(chunk))
+        if len(calls) == 3:
+            raise RuntimeError("worker crashed")
+        return real(chunk, *args)
+    monkeypatch.setattr(pipeline, "analyze_chunk", flaky)
+    try:
+        pipeline.summarize_all(sm, workers=1, chunk_size=3)
+    except RuntimeError:
+        pass
+    store = AgentResultStore(data_dir)
+    assert len(store.latest()) == 6 and not store.checkpoint()["finished"]
+
+    monkeypatch.setattr(pipeline, "analyze_chunk", real)
+    cli.main(["--data-dir", data_dir, "summarize-all", "--workers", "2", "--chunk-size", "3"])
+    assert "Summarized 4 notes (resumed; 6 already done)" in capsys.readouterr().out
+    latest = store.latest()
+    assert sorted(latest) == sorted(n.id for n in notes)
+    assert len(list(store)) == 10 and store.checkpoint()["finished"]
+    result = latest[notes[4].id]
+    assert isinstance(result, AgentResult) and result.summary.startswith("Note 4 opens here.")
+    assert result.suggestions[0]["title"] == "We should fix item 4."
+    assert AgentResult.from_dict(result.to_dict()) == result
+
+    # A finished run is not resumed: the next one redoes every note, and the
+    # store is compacted to the latest result of each note
+    cli.main(["--data-dir", data_dir, "summarize-all", "--workers", "1"])
+    assert "Summarized 10 notes" in capsys.readouterr().out
+    assert len(list(store)) == 10
+    newest = store.latest()[notes[4].id]
+    assert store.get(notes[4].id) == newest
+    assert os.path.exists(store.path + ".idx") and store.get("missing") is None
+    # Results appended since the compaction are still found
+    store.append([AgentResult("r", notes[4].id, "Later.", [])])
+    assert store.get(notes[4].id).summary == "Later."
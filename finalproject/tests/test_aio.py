@@ -0,0 +1,52 @@
+import asyncio
+import pytest
+from pkms.aio import AsyncStorageManager
+from pkms.models import Note, Task
+from pkms.storage import StorageError, StorageManager
+
+
+def _count_calls(monkeypatch, obj, name):
+    calls = []
+    original = getattr(obj, name)
+
+    def counted(*args, **kwargs):
+        calls.append(args)
+        return original(*args, **kwargs)
+    monkeypatch.setattr(obj, name, counted)
+    return calls
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_concurrent_writes_are_coalesced(tmp_path, monkeypatch, backend):
+    data_dir = str(tmp_path / backend)
+
+    async def main():
+        async with AsyncStorageManager(data_dir, backend=backend) as asm:
+            applies = _count_calls(monkeypatch, asm.sync.backend, "apply")
+            tasks = await asyncio.gather(*(asm.add_task(Task.create(f"t{i}")) for i in range(200)))
+            # The first write goes alone, everything queued behind it in one group
+            assert len(applies) <= 2
+            done, missing = await asyncio.gather(asm.mark_complete(tasks[0].id), asm.update_task("nope", status="done"),
+                                                 return_exceptions=True)
+            assert done.status == "done"
+            assert isinstance(missing, StorageError)
+            assert len(await asm.list_tasks()) == 200
+    asyncio.run(main())
+    stored = StorageManager(data_dir, backend=backend).list_tasks()
+    assert len(stored) == 200 and sum(t.status == "done" for t in stored) == 1
+
+
+def test_concurrent_reads_share_one_load(tmp_path, monkeypatch):
+    data_dir = str(tmp_path / "data")
+    StorageManager(data_dir).add_notes([Note.create(f"N{i}", "body") for i in range(10)])
+
+    async def main():
+        async with AsyncStorageManager(data_dir) as asm:
+            loads = _count_calls(monkeypatch, asm.sync, "list_notes")
+            results = await asyncio.gather(*(asm.list_notes() for _ in range(50)))
+            assert len(loads) == 1
+            assert all(len(r) == 10 for r in results) and results[0] is not results[1]
+            # A read issued after a write sees it, never an older shared result
+            await asm.add_note(Note.create("new", "body"))
+            assert len(await asm.list_notes()) == 11
+    asyncio.run(main())
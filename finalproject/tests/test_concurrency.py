@@ -0,0 +1,43 @@
+import multiprocessing
+import pytest
+from pkms.storage import StorageManager
+from pkms.models import Note, Task
+
+if "fork" not in multiprocessing.get_all_start_methods():
+    pytest.skip("needs fork", allow_module_level=True)
+
+WORKERS = 6
+PER_WORKER = 15
+
+
+def _worker(data_dir, backend, n, start):
+    start.wait()
+    sm = StorageManager(data_dir, backend=backend)
+    for i in range(PER_WORKER):
+        sm.add_task(Task.create(f"w{n}-{i}"))
+        if i % 5 == 0:
+            sm.update_note(sm.list_notes_by_tags([f"w{n}"])[0].id, body=f"v{i}")
+
+
+@pytest.mark.parametrize("backend", ["json", "journal", "sqlite", "sharded"])
+def test_concurrent_writers_lose_nothing(tmp_path, backend):
+    data_dir = str(tmp_path / backend)
+    sm = StorageManager(data_dir, backend=backend)
+    sm.add_notes([Note.create(f"N{n}", "v", tags=[f"w{n}"]) for n in range(WORKERS)])
+    ctx = multiprocessing.get_context("fork")
+    start = ctx.Event()
+    procs = [ctx.Process(target=_worker, args=(data_dir, backend, n, start)) for n in range(WORKERS)]
+    for p in procs:
+        p.start()
+    start.set()
+    for p in procs:
+        p.join(60)
+        assert p.exitcode == 0
+
+    fresh = StorageManager(data_dir, backend=backend)
+    titles = sorted(t.title for t in fresh.list_tasks())
+    assert titles == sorted(f"w{n}-{i}" for n in range(WORKERS) for i in range(PER_WORKER))
+    # each worker's last update of its own note survived the others' writes
+    assert sorted(n.body for n in fresh.list_notes()) == ["v10"] * WORKERS
+    assert len(fresh.search_notes("v10")) == WORKERS
+    fresh.close()
@@ -0,0 +1,64 @@
+import os
+import threading
+import time
+import pytest
+from pkms import cli, daemon
+from pkms.storage import StorageManager
+
+if not daemon.supported():
+    pytest.skip("needs Unix domain sockets", allow_module_level=True)
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.delenv("PKMS_SOCKET", raising=False)
+    monkeypatch.delenv("PKMS_NO_DAEMON", raising=False)
+    data_dir = str(tmp_path / "data")
+    os.makedirs(data_dir)
+    thread = threading.Thread(target=daemon.serve, args=(data_dir,), daemon=True)
+    thread.start()
+    path = daemon.socket_path(data_dir)
+    for _ in range(200):
+        if os.path.exists(path):
+            break
+        time.sleep(0.01)
+    yield data_dir
+    with daemon.Client(path, timeout=5) as client:
+        client.call("shutdown")
+    thread.join(5)
+    assert not thread.is_alive() and not os.path.exists(path)
+
+
+def test_cli_forwards_to_server(server, tmp_path, capsys, monkeypatch):
+    data_dir = server
+    assert os.stat(daemon.socket_path(data_dir)).st_mode & 0o777 == 0o600
+    assert cli.main(["--data-dir", data_dir, "add-note", "Served", "warm body", "--tags", "x"]) == 0
+    out = capsys.readouterr().out
+    assert "Note added" in out
+    nid = out.split("ID: ")[1].split()[0]
+    # Written through the server's manager, visible to a fresh one
+    assert StorageManager(data_dir).get_note(nid).title == "Served"
+
+    monkeypatch.chdir(tmp_path)
+    assert cli.main(["--data-dir", data_dir, "export", "out.json"]) == 0
+    assert os.path.exists(tmp_path / "out.json")
+
+    with daemon.Client(daemon.socket_path(data_dir)) as client:
+        assert client.call("ping") == "pong"
+        result = client.run(["--data-dir", data_dir, "search-notes", "warm"])
+        assert result["exit"] == 0 and "Served" in result["stdout"]
+        result = client.run(["--data-dir", data_dir, "view-note", "missing"])
+        assert result["exit"] != 0
+        result = client.run(["--data-dir", data_dir, "no-such-command"])
+        assert result["exit"] == 2 and "invalid choice" in result["stderr"]
+        # An open connection does not block other callers
+        assert cli.main(["--data-dir", data_dir, "list-notes"]) == 0
+        assert "Served" in capsys.readouterr().out
+
+
+def test_no_daemon_runs_locally(server, capsys, monkeypatch):
+    monkeypatch.setenv("PKMS_NO_DAEMON", "1")
+    assert daemon.forward(["--data-dir", server, "list-notes"]) is None
+    # Prompting commands without --yes stay local too
+    monkeypatch.delenv("PKMS_NO_DAEMON")
+    assert daemon.forward(["--data-dir", server, "delete-note", "x"]) is None
@@ -0,0 +1,86 @@
+import os
+from pkms.storage import StorageManager
+from pkms.models import Note
+
+
+def _titles(notes):
+    return sorted(n.title for n in notes)
+
+
+def test_search_uses_index_and_stays_in_sync(tmp_path):
+    data_dir = str(tmp_path / "data")
+    sm = StorageManager(data_dir)
+    a = Note.create("Roadmap", "Discuss the quarterly roadmap", tags=["work"])
+    b = Note.create("Groceries", "Buy milk and bread", tags=["home"])
+    sm.add_note(a)
+    sm.add_note(b)
+
+    # first search builds the index; substring semantics are preserved
+    assert _titles(sm.search_notes("road")) == ["Roadmap"]
+    assert os.path.exists(os.path.join(data_dir, "search_index.db"))
+    assert _titles(sm.search_notes("milk bread", match="all")) == ["Groceries"]
+    assert _titles(sm.search_notes("bread roadmap", match="all")) == []
+    assert _titles(sm.search_notes("bread roadmap", match="any")) == ["Groceries", "Roadmap"]
+    assert _titles(sm.search_notes("bread and")) == []
+    assert _titles(sm.search_notes("milk and")) == ["Groceries"]
+
+    # later mutations are applied to the index
+    c = Note.create("Standup", "Notes from standup")
+    sm.add_note(c)
+    sm.update_note(b.id, body="Buy eggs")
+    sm.delete_note(a.id)
+    fresh = StorageManager(data_dir)
+    assert _titles(fresh.search_notes("standup")) == ["Standup"]
+    assert fresh.search_notes("milk") == []
+    assert _titles(fresh.search_notes("eggs")) == ["Groceries"]
+    assert fresh.search_notes("roadmap") == []
+    assert _titles(fresh.search_notes("")) == ["Groceries", "Standup"]
+
+
+def test_index_rebuilt_on_replace(tmp_path):
+    data_dir = str(tmp_path / "data")
+    sm = StorageManager(data_dir, backend="sqlite")
+    sm.add_note(Note.create("Old", "alpha"))
+    assert len(sm.search_notes("alpha")) == 1
+    sm.save_notes([Note.create("New", "beta")])
+    assert sm.search_notes("alpha") == []
+    assert _titles(sm.search_notes("beta")) == ["New"]
+
+
+def test_ranked_search_with_limit(tmp_path):
+    data_dir = str(tmp_path / "data")
+    sm = StorageManager(data_dir)
+    sm.add_note(Note.create("Misc", "some words about a budget among many other words here"))
+    sm.add_note(Note.create("Budget", "Q3 budget"))
+    sm.add_note(Note.create("Other", "nothing relevant"))
+    sm.add_note(Note.create("Plans", "plans", tags=["budget"]))
+
+    ranked = sm.search_notes("budget", ranked=True)
+    assert [n.title for n in ranked] == ["Budget", "Plans", "Misc"]
+    assert [n.title for n in sm.search_notes("budget", ranked=True, limit=1)] == ["Budget"]
+    assert sm.search_notes("!!", ranked=True) == []
+    assert sm.search_notes("", ranked=True, tag="budget") == []
+    assert len(sm.search_notes("budget", limit=2)) == 2
+
+
+def test_tag_index_queries(tmp_path):
+    data_dir = str(tmp_path / "data")
+    sm = StorageManager(data_dir)
+    a = Note.create("A", "alpha", tags=["work", "urgent"])
+    b = Note.create("B", "beta", tags=["work"])
+    c = Note.create("C", "alpha beta", tags=["home"])
+    for n in (a, b, c):
+        sm.add_note(n)
+
+    assert _titles(sm.list_notes_by_tags(["work"])) == ["A", "B"]
+    assert _titles(sm.list_notes_by_tags(["work", "urgent"])) == ["A"]
+    assert _titles(sm.list_notes_by_tags(["urgent", "home"], match="any")) == ["A", "C"]
+    assert _titles(sm.search_notes("alpha", tag="work")) == ["A"]
+    assert _titles(sm.search_notes("beta", tags=["urgent", "home"], tag_match="any")) == ["C"]
+
+    sm.update_note(b.id, tags=["home"])
+    sm.delete_note(a.id)
+    sm.tag_index._write_snapshot()  # renumbers ordinals after the delete
+    fresh = StorageManager(data_dir)
+    assert fresh.list_notes_by_tags(["work"]) == []
+    assert _titles(fresh.list_notes_by_tags(["home"])) == ["B", "C"]
@@ -0,0 +1,103 @@
+import os
+from dataclasses import replace
+from pkms import cli
+from pkms.models import Note, Task
+from pkms.sharded_backend import ShardedBackend, reshard, shard_of
+from pkms.storage import StorageManager, migrate
+
+
+def _notes(n, **kwargs):
+    # Distinct timestamps: shards are merged by created_at
+    return [replace(Note.create(f"N{i}", f"body {i}", **kwargs), created_at=f"2026-01-01T00:{i // 60:02d}:{i % 60:02d}Z")
+            for i in range(n)]
+
+
+def _stats(backend, kind="notes"):
+    return {p: os.stat(p).st_ino for p in backend.shard_paths(kind)}
+
+
+def test_writes_rewrite_only_their_shards(tmp_path):
+    data_dir = str(tmp_path / "data")
+    sm = StorageManager(data_dir, backend="sharded")
+    notes = sm.add_notes(_notes(64))
+    backend = sm.backend
+    assert backend.manifest("notes") == (16, 1)
+    assert [n.title for n in StorageManager(data_dir).list_notes()] == [f"N{i}" for i in range(64)]
+
+    before = _stats(backend)
+    target = notes[5]
+    sm.update_note(target.id, title="renamed")
+    after = _stats(backend)
+    # One shard replaced in place, every other file untouched
+    changed = [p for p in before if before[p] != after[p]]
+    assert changed == [backend.path("notes", 1, shard_of(target.id, 16))]
+    assert sm.get_note(target.id).title == "renamed"
+
+    # A batch over several shards switches epoch; unchanged shards are linked over
+    sm.delete_notes([n.id for n in notes[:20]])
+    assert backend.manifest("notes")[1] == 2
+    linked = [p for p in _stats(backend).values() if p in before.values()]
+    assert linked and len(linked) < 16
+    assert not [name for name in os.listdir(data_dir) if name.startswith("notes.e1.")]
+    assert [n.title for n in StorageManager(data_dir).list_notes()] == [f"N{i}" for i in range(20, 64)]
+
+
+def test_reader_retries_after_epoch_switch(tmp_path):
+    data_dir = str(tmp_path / "data")
+    sm = StorageManager(data_dir, backend="sharded")
+    notes = sm.add_notes([Note.create(f"N{i}", "b") for i in range(32)])
+    reader = ShardedBackend(data_dir)
+    stale = reader.manifest("notes")
+    sm.delete_notes([n.id for n in notes[:16]])
+    calls = []
+    real = ShardedBackend.manifest
+
+    def first_stale(self, kind):
+        calls.append(kind)
+        return stale if len(calls) == 1 else real(self, kind)
+    reader.manifest = first_stale.__get__(reader)
+    assert len(reader.load("notes")) == 16
+    calls.clear()
+    assert [r["id"] for r in reader.get_many("notes", [notes[20].id, notes[0].id])] == [notes[20].id]
+
+
+def test_reshard_merges_mixed_stores(tmp_path):
+    data_dir = str(tmp_path / "data")
+    sharded = StorageManager(data_dir, backend="sharded")
+    kept = sharded.add_notes([Note.create(f"S{i}", "sharded") for i in range(10)])
+    sharded.add_task(Task.create("sharded task"))
+    # An unsharded json store in the same directory, e.g. from an old client:
+    # one note of its own and a newer copy of a sharded note
+    plain = StorageManager(data_dir, backend="json")
+    plain.save_notes([Note.create("J", "json"), replace(kept[3], title="S3 edited", updated_at="2999-01-01T00:00:00Z")])
+    plain.save_tasks([Task.create("json task")])
+
+    counts = reshard(data_dir, 4)
+    assert counts == {"notes": 11, "tasks": 2}
+    assert os.path.exists(os.path.join(data_dir, "notes.json.migrated"))
+    sm = StorageManager(data_dir)
+    assert sm.backend.name == "sharded" and sm.backend.manifest("notes")[0] == 4
+    titles = sorted(n.title for n in sm.list_notes())
+    assert "J" in titles and "S3 edited" in titles and "S3" not in titles
+    assert sorted(t.title for t in sm.list_tasks()) == ["json task", "sharded task"]
+
+    # Resharding a sharded store changes the file count and keeps the records
+    assert cli.main(["--data-dir", data_dir, "reshard", "2"]) is None
+    sm = StorageManager(data_dir)
+    assert sm.backend.manifest("notes")[0] == 2
+    assert len([n for n in os.listdir(data_dir) if n.startswith("notes.e") and n.endswith(".json")]) == 2
+    assert sorted(n.title for n in sm.list_notes()) == titles
+    assert sm.get_note(kept[7].id).title == "S7"
+
+
+def test_migrate_between_sharded_and_unsharded(tmp_path):
+    data_dir = str(tmp_path / "data")
+    sm = StorageManager(data_dir, backend="sqlite")
+    sm.add_notes(_notes(20, tags=["t"]))
+    assert migrate(data_dir, "sharded") == {"notes": 20, "tasks": 0}
+    sm = StorageManager(data_dir)
+    assert sm.backend.name == "sharded"
+    assert [n.title for n in sm.list_notes_by_tags(["t"])] == [f"N{i}" for i in range(20)]
+    assert migrate(data_dir, "json") == {"notes": 20, "tasks": 0}
+    assert StorageManager(data_dir).backend.name == "json"
+    assert not [n for n in os.listdir(data_dir) if n.startswith("notes.e")]
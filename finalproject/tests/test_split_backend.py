@@ -0,0 +1,105 @@
+import os
+from pkms import cli
+from pkms.models import LazyNote, Note, Task
+from pkms.split_backend import BodyStore
+from pkms.storage import StorageManager
+
+
+def _count_body_reads(monkeypatch):
+    reads = []
+    real = BodyStore.read
+    monkeypatch.setattr(BodyStore, "read", lambda self, ref: reads.append(ref) or real(self, ref))
+    return reads
+
+
+def test_split_lists_without_reading_bodies(tmp_path, monkeypatch):
+    data_dir = str(tmp_path / "data")
+    sm = StorageManager(data_dir, backend="split")
+    notes = sm.add_notes([Note.create(f"N{i}", f"body {i} " * 50, tags=["even" if i % 2 == 0 else "odd"])
+                          for i in range(10)])
+    sm.add_task(Task.create("T"))
+    assert os.path.exists(os.path.join(data_dir, "notes.meta.json"))
+    assert StorageManager(data_dir).backend.name == "split"
+
+    reads = _count_body_reads(monkeypatch)
+    sm = StorageManager(data_dir)
+    listed = sm.list_notes()
+    tagged = sm.list_notes_by_tags(["odd"])
+    assert [n.title for n in tagged] == ["N1", "N3", "N5", "N7", "N9"]
+    assert all(isinstance(n, LazyNote) and not n.body_loaded for n in listed)
+    assert reads == []
+    assert listed[2].body == notes[2].body and listed[2] == notes[2]
+    assert len(reads) == 1
+
+    # A metadata-only update writes back the stored body ref, not the body
+    size = sm.backend.body_bytes()
+    sm.update_note(notes[4].id, title="renamed")
+    assert sm.backend.body_bytes() == size
+    sm.update_note(notes[5].id, body="new body")
+    fresh = StorageManager(data_dir)
+    assert fresh.get_note(notes[4].id).title == "renamed"
+    assert fresh.get_note(notes[4].id).body == notes[4].body
+    assert fresh.get_note(notes[5].id).body == "new body"
+    assert fresh.search_notes("body 7")[0].id == notes[7].id
+
+
+def test_split_compacts_dead_bodies(tmp_path):
+    data_dir = str(tmp_path / "data")
+    sm = StorageManager(data_dir, backend="split", cache=True)
+    notes = sm.add_notes([Note.create(f"N{i}", "x" * 100_000 + str(i)) for i in range(20)])
+    listed = sm.list_notes()
+    sm.delete_notes([n.id for n in notes[:15]])
+    # More than half the segment was dead: rewritten into a new one
+    assert sm.backend.bodies.segments() == [2]
+    assert sm.backend.body_bytes() < 600_000
+    # Records loaded before the rewrite still find their bodies
+    assert listed[17].body.endswith("17")
+    assert [n.body[-2:] for n in StorageManager(data_dir).list_notes()] == ["15", "16", "17", "18", "19"]
+
+
+def test_migrate_split_to_json_and_back(tmp_path):
+    data_dir = str(tmp_path / "data")
+    cli.main(["--data-dir", data_dir, "--backend", "split", "add-note", "A", "body a", "--tags", "x"])
+    cli.main(["--data-dir", data_dir, "add-task", "T1"])
+    assert cli.main(["--data-dir", data_dir, "migrate", "json"]) is None
+    sm = StorageManager(data_dir)
+    assert sm.backend.name == "json"
+    assert sm.list_notes()[0].body == "body a"
+    assert cli.main(["--data-dir", data_dir, "migrate", "split"]) is None
+    sm = StorageManager(data_dir)
+    assert sm.backend.name == "split" and sm.list_notes()[0].body == "body a"
+    assert sm.list_tasks()[0].title == "T1"
+
+
+def test_split_search_scans_mapped_bodies(tmp_path, monkeypatch):
+    data_dir = str(tmp_path / "data")
+    sm = StorageManager(data_dir, backend="split")
+    sm.add_notes([
+        Note.create("Alpha", "the quick brown fox", tags=["animals"]),
+        Note.create("Beta", "brown bread and quick oats"),
+        Note.create("Gamma", "Ein KELVIN-Thermometer Kelvin"),
+        Note.create("Fox notes", "nothing here"),
+        Note.create("Delta", "Café Brünnen"),
+    ])
+    expected = {}
+    queries = [("quick brown", "phrase"), ("brown quick", "all"), ("fox", "phrase"), ("kelvin", "phrase"),
+               ("animals", "phrase"), ("oats zebra", "any"), ("brünnen", "phrase"), ("--", "phrase")]
+    json_dir = str(tmp_path / "json")
+    plain = StorageManager(json_dir, backend="json")
+    plain.save_notes([Note.from_dict(n.to_dict()) for n in sm.list_notes()])
+    for query, match in queries:
+        expected[query] = sorted(n.title for n in plain.search_notes(query, match=match))
+
+    reads = _count_body_reads(monkeypatch)
+    sm = StorageManager(data_dir)
+    for query, match in queries:
+        assert sorted(n.title for n in sm.search_notes(query, match=match)) == expected[query], query
+    assert expected["quick brown"] == ["Alpha"] and expected["kelvin"] == ["Gamma"]
+
+    # Only bodies the byte scan could not rule out are decoded
+    del reads[:]
+    assert [n.title for n in sm.search_notes("quick brown")] == ["Alpha"]
+    assert len(reads) == 1
+    # A phrase may span the title and the body
+    assert [n.title for n in sm.search_notes("fox notes nothing")] == ["Fox notes"]
+    assert [n.title for n in sm.search_notes("fox animals")] == ["Alpha"]
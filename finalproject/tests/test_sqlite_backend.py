@@ -0,0 +1,43 @@
+import os
+from pkms import cli
+from pkms.storage import StorageManager
+from pkms.models import Note, Task
+
+
+def test_sqlite_lifecycle(tmp_path):
+    data_dir = str(tmp_path / "data")
+    sm = StorageManager(data_dir, backend="sqlite")
+
+    n = Note.create("T1", "Body here", tags=["x", "y"])
+    sm.add_note(n)
+    sm.add_note(Note.create("T2", "Other"))
+    assert [x.title for x in sm.list_notes()] == ["T1", "T2"]
+
+    sm.update_note(n.id, title="T1-updated")
+    updated = sm.list_notes()[0]
+    assert updated.title == "T1-updated"
+    assert updated.tags == ["x", "y"]
+
+    sm.delete_note(n.id)
+    assert all(x.id != n.id for x in sm.list_notes())
+
+    t = Task.create("Task1", description="do stuff", due_date="2025-01-01")
+    sm.add_task(t)
+    sm.mark_complete(t.id)
+    done = sm.list_tasks()[0]
+    assert done.status == "done"
+    assert done.due_date == "2025-01-01"
+
+
+def test_migrate_json_to_sqlite(tmp_path):
+    data_dir = str(tmp_path / "data")
+    cli.main(["--data-dir", data_dir, "add-note", "A", "b", "--tags", "x"])
+    cli.main(["--data-dir", data_dir, "add-task", "T1"])
+    assert cli.main(["--data-dir", data_dir, "migrate", "sqlite"]) is None
+
+    assert os.path.exists(os.path.join(data_dir, "pkms.db"))
+    assert not os.path.exists(os.path.join(data_dir, "notes.json"))
+    sm = StorageManager(data_dir)
+    assert sm.backend.name == "sqlite"
+    assert [n.title for n in sm.list_notes()] == ["A"]
+    assert [t.title for t in sm.list_tasks()] == ["T1"]
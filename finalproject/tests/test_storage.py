@@ -1,6 +1,7 @@
 import tempfile
 import os
-from pkms.storage import StorageManager
+import pytest
+from pkms.storage import StorageManager, StorageError
 from pkms.models import Note, Task
 
 
@@ -32,3 +33,249 @@ def test_notes_and_tasks_lifecycle(tmp_path):
 
     sm.delete_task(t.id)
     assert all(x.id != t.id for x in sm.list_tasks())
+
+
+def test_cache_revalidates_against_other_writers(tmp_path):
+    data_dir = str(tmp_path / "data")
+    sm = StorageManager(data_dir, backend="sqlite", cache=True)
+    sm.add_note(Note.create("A", "a"))
+    loads = []
+    real_load = sm.backend.load
+    sm.backend.load = lambda kind: loads.append(kind) or real_load(kind)
+
+    assert [n.title for n in sm.list_notes()] == ["A"]
+    n = sm.list_notes()[0]
+    sm.update_note(n.id, title="A2")
+    assert [n.title for n in sm.list_notes()] == ["A2"]
+    assert loads == ["notes"]
+
+    # a write by another manager (or process) invalidates the cache
+    other = StorageManager(data_dir)
+    other.add_note(Note.create("B", "b"))
+    assert [n.title for n in sm.list_notes()] == ["A2", "B"]
+    assert loads == ["notes", "notes"]
+
+
+def test_get_by_id_uses_offset_index(tmp_path, monkeypatch):
+    import json
+    for backend in ("json", "journal", "sqlite"):
+        data_dir = str(tmp_path / backend)
+        sm = StorageManager(data_dir, backend=backend)
+        notes = [Note.create(f"N{i}", f"body {i}") for i in range(50)]
+        sm.save_notes(notes)
+        sm.update_note(notes[3].id, title="changed")
+        sm.add_task(Task.create("T"))
+        assert sm.get_note(notes[10].id).title == "N10"
+        assert sm.get_note(notes[3].id).title == "changed"
+        assert sm.get_note("missing") is None
+        assert sm.get_task(sm.list_tasks()[0].id).title == "T"
+
+    # a file rewritten by something else makes the index stale, not wrong
+    path = os.path.join(str(tmp_path / "json"), "notes.json")
+    with open(path, "r", encoding="utf-8") as f:
+        rows = json.load(f)
+    rows[10]["title"] = "edited"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(rows, f, indent=2)
+    assert StorageManager(str(tmp_path / "json")).get_note(rows[10]["id"]).title == "edited"
+
+    # the file is replaced between opening the index and reading from it
+    from pkms import offsets, storage
+    sm = StorageManager(str(tmp_path / "json"))
+    notes = sm.list_notes()
+    sm.save_notes(notes)
+    stale = offsets.OffsetIndex.open(path)
+    sm.save_notes([Note.from_dict(dict(n.to_dict(), title="x" * 40)) for n in reversed(notes)])
+    assert stale.read_many([notes[10].id]) is None
+    monkeypatch.setattr(storage.OffsetIndex, "open", lambda *args: stale)
+    assert sm.backend.get("notes", notes[10].id)["title"] == "x" * 40
+
+
+def test_batch_commits_once_and_rolls_back(tmp_path):
+    data_dir = str(tmp_path / "data")
+    sm = StorageManager(data_dir)
+    notes = sm.add_notes([Note.create(f"N{i}", "alpha") for i in range(5)])
+    assert len(sm.search_notes("alpha")) == 5
+
+    writes = []
+    real_apply = sm.backend.apply
+    sm.backend.apply = lambda kind, puts, deletes: writes.append(kind) or real_apply(kind, puts, deletes)
+    with sm.batch():
+        for n in notes[:3]:
+            sm.update_note(n.id, body="beta")
+        sm.delete_note(notes[4].id)
+        sm.add_task(Task.create("T"))
+        # reads inside the batch see the pending changes
+        assert [n.title for n in sm.list_notes()] == ["N0", "N1", "N2", "N3"]
+    assert writes == ["notes", "tasks"]
+    assert [n.title for n in sm.search_notes("beta")] == ["N0", "N1", "N2"]
+
+    try:
+        with sm.batch():
+            sm.update_notes({notes[3].id: {"title": "lost"}})
+            sm.update_notes({"missing": {"title": "x"}})
+    except Exception:
+        pass
+    assert writes == ["notes", "tasks"]
+    assert sm.get_note(notes[3].id).title == "N3"
+    assert sm.delete_notes([notes[0].id, "missing"]) == 1
+    assert len(StorageManager(data_dir).list_notes()) == 3
+
+    # save_* inside a batch is written at commit, and not at all if the block raises
+    kept = [n.title for n in sm.list_notes()]
+    with pytest.raises(RuntimeError):
+        with sm.batch():
+            sm.save_notes([Note.create("only", "gamma")])
+            assert [n.title for n in sm.list_notes()] == ["only"]
+            raise RuntimeError("abort")
+    assert [n.title for n in StorageManager(data_dir).list_notes()] == kept
+    with sm.batch():
+        sm.save_notes([Note.create("only", "gamma")])
+        sm.add_note(Note.create("after", "gamma"))
+    assert [n.title for n in StorageManager(data_dir).list_notes()] == ["only", "after"]
+    assert [n.title for n in sm.search_notes("gamma")] == ["only", "after"]
+
+
+def test_streaming_export_import(tmp_path):
+    import json
+    sm = StorageManager(str(tmp_path / "src"))
+    notes = sm.add_notes([Note.create(f"N{i}", "body") for i in range(5)])
+    sm.add_task(Task.create("T"))
+    for name in ("backup.json", "backup.jsonl", "backup.jsonl.gz", "backup.json.xz", "backup.pkb", "backup.pkb.gz"):
+        out = str(tmp_path / name)
+        ticks = []
+        assert sm.export(out, progress=ticks.append) == 6
+        assert ticks == [6]
+        umask = os.umask(0)
+        os.umask(umask)
+        assert os.stat(out).st_mode & 0o777 == 0o666 & ~umask
+        dst = StorageManager(str(tmp_path / name.replace(".", "_")))
+        dst.add_note(notes[0])
+        assert dst.import_file(out) == 5
+        assert dst.import_file(out) == 0
+        assert [n.title for n in dst.list_notes()] == [f"N{i}" for i in range(5)]
+        assert len(dst.search_notes("body")) == 5
+
+    # pretty-printed backups from older versions still import
+    legacy = str(tmp_path / "legacy.json")
+    with open(legacy, "w", encoding="utf-8") as f:
+        json.dump({"notes": [notes[1].to_dict()], "tasks": []}, f, indent=2)
+    assert sm.import_file(legacy, merge=False) == 1
+    assert [n.title for n in sm.list_notes()] == ["N1"]
+    assert sm.list_tasks() == []
+
+    # binary backups are JSON records behind a versioned header; anything else is refused
+    data = open(str(tmp_path / "backup.pkb"), "rb").read()
+    assert data.startswith(b"PKMSBAK\x02\x00") and b'"N0"' in data
+    for name, content in (("old.pkb", b"PKMSBAK1" + data[9:]), ("bad.pkb", data[:9] + b"\x00\x05\x00\x00\x00\x80\x81!{[")):
+        with open(str(tmp_path / name), "wb") as f:
+            f.write(content)
+        with pytest.raises(StorageError):
+            sm.import_file(str(tmp_path / name))
+
+
+def test_incremental_backup_chain(tmp_path):
+    backup_dir = str(tmp_path / "backups")
+    sm = StorageManager(str(tmp_path / "src"))
+    notes = sm.add_notes([Note.create(f"N{i}", "body") for i in range(10)])
+    sm.add_task(Task.create("T"))
+    assert sm.backup(backup_dir)["puts"] == 11
+    assert sm.backup(backup_dir)["file"] is None
+
+    sm.update_note(notes[2].id, body="changed")
+    sm.delete_note(notes[5].id)
+    sm.add_note(Note.create("new", "body"))
+    result = sm.backup(backup_dir)
+    assert (result["puts"], result["deletes"]) == (2, 1)
+
+    # a change that leaves updated_at alone (an edit outside update_note) is still backed up
+    edited = sm.get_note(notes[3].id)
+    stamp = edited.updated_at
+    sm.save_notes([n if n.id != edited.id else Note.from_dict(dict(n.to_dict(), body="quiet edit"))
+                   for n in sm.list_notes()])
+    assert sm.get_note(notes[3].id).updated_at == stamp
+    assert sm.backup(backup_dir)["puts"] == 1
+
+    dst = StorageManager(str(tmp_path / "dst"), backend="journal")
+    assert dst.restore(backup_dir) == {"notes": 10, "tasks": 1}
+    assert [n.id for n in dst.list_notes()] == [n.id for n in sm.list_notes()]
+    assert dst.get_note(notes[2].id).body == "changed"
+    assert dst.restore(backup_dir, upto=1) == {"notes": 10, "tasks": 1}
+    assert [n.id for n in dst.list_notes()] == [n.id for n in notes]
+    assert dst.get_note(notes[5].id) is not None
+    assert dst.get_note(notes[2].id).body == "body"
+
+    # a save that only reorders records is backed up and restored in that order
+    sm.save_notes(list(reversed(sm.list_notes())))
+    assert sm.backup(backup_dir)["file"] is not None
+    dst.restore(backup_dir)
+    assert [n.id for n in dst.list_notes()] == [n.id for n in sm.list_notes()]
+    assert dst.restore(backup_dir, upto=3) == {"notes": 10, "tasks": 1}
+    assert [n.id for n in dst.list_notes()] == [n.id for n in reversed(sm.list_notes())]
+
+    # a tampered chain file is refused
+    first = sorted(f for f in os.listdir(backup_dir) if f.endswith(".gz"))[0]
+    with open(os.path.join(backup_dir, first), "ab") as f:
+        f.write(b"x")
+    with pytest.raises(StorageError, match="does not match"):
+        dst.restore(backup_dir)
+
+
+def test_group_commit_writes_once_per_group(tmp_path, monkeypatch):
+    sm = StorageManager(str(tmp_path / "data"))
+    applies = []
+    apply = sm.backend.apply
+    monkeypatch.setattr(sm.backend, "apply", lambda *a: applies.append(a[0]) or apply(*a))
+    done = []
+    with sm.group_commit(window=10, max_records=100) as gc:
+        futures = [gc.add_task(Task.create(f"t{i}")) for i in range(250)]
+        futures[0].add_done_callback(done.append)
+        missing = gc.update_task("nope", status="done")
+        gc.flush()
+        assert all(f.done() for f in futures) and done == [futures[0]]
+        with pytest.raises(StorageError):
+            missing.result()
+        completed = gc.mark_complete(futures[1].result().id)
+    assert completed.result().status == "done"
+    # Groups of >= 100 (the window never expires), not one write per task
+    assert 2 <= len(applies) <= 6
+    tasks = StorageManager(sm.data_dir).list_tasks()
+    assert len(tasks) == 250 and sum(t.status == "done" for t in tasks) == 1
+
+
+def test_compact_records_and_columns(tmp_path):
+    sm = StorageManager(str(tmp_path / "data"))
+    notes = sm.add_notes([Note.create(f"N{i}", "b", tags=["a", "b"] if i % 2 else ["c"]) for i in range(6)])
+    sm.update_note(notes[0].id, body="edited")
+    sm.add_task(Task.create("T", due_date="2026-01-01"))
+    assert not hasattr(notes[0], "__dict__")
+
+    loaded = StorageManager(sm.data_dir).list_notes()
+    assert loaded[1].tags[0] is loaded[3].tags[0] and loaded[1].source is loaded[2].source
+    assert loaded[1].updated_at is loaded[1].created_at
+
+    cols = sm.columns("notes")
+    assert len(cols) == 6
+    assert [n.to_dict() for n in cols] == [n.to_dict() for n in loaded]
+    assert list(cols.rows()) == [n.to_dict() for n in loaded]
+    assert cols[-1].title == "N5" and cols.value("updated_at", 0) != cols.value("created_at", 0)
+    tags = cols.column("tags")
+    assert tags[1] is tags[3]
+    assert sm.columns("tasks")[0].due_date == "2026-01-01"
+    with pytest.raises(StorageError):
+        sm.columns("nope")
+
+
+def test_record_dicts_round_trip_without_eager_defaults(monkeypatch):
+    from pkms import models
+    note = Note.create("T", "B", tags=["x"])
+    task = Task.create("T", due_date="2026-01-01")
+    d = note.to_dict()
+    d["tags"].append("mutated")
+    assert note.tags == ["x"]
+    monkeypatch.setattr(models, "_now_iso", lambda: pytest.fail("default computed for a present key"))
+    assert Note.from_dict(note.to_dict()) == note
+    assert Task.from_dict(task.to_dict()) == task
+    monkeypatch.setattr(models, "_now_iso", lambda: "now")
+    assert Task.from_dict({"id": "t"}) == Task(id="t", title="", created_at="now", updated_at="now")
+    assert Note.from_dict({"id": "n", "tags": None}).tags == []